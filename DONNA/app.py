@@ -1,140 +1,1847 @@
-from flask import Flask, render_template, request, jsonify
-import requests
-from supabase import create_client, Client
+from flask import Flask, Blueprint, current_app, render_template, request, jsonify, make_response, Response, stream_with_context, g
 import uuid
 import json
 import re
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import os
-import jwt
+import hashlib
+from functools import wraps
+from contextlib import contextmanager
+import random
+import threading
+import time
+import asyncio
+from collections import OrderedDict, deque
+from itertools import chain, islice
+import calendar
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait, FIRST_COMPLETED
+import logging
+import logging.handlers
+import queue
+import sys
+import atexit
+import gzip
+import mimetypes
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.security import generate_password_hash, check_password_hash
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables first
 load_dotenv()
 
-app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', 'ajd8f92n3kfjSDF9234lkj23nf9234')
+# ==================== LOGGING ====================
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+    
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, for log aggregators"""
+    
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+LOG_BANNERS = os.getenv('LOG_BANNERS', 'false').lower() == 'true'
+
+def configure_logging():
+    """Send all logging through a queue drained by one background thread.
+
+    Request threads only enqueue a record; the listener does the stdout
+    writes. LOG_LEVEL sets the default level and LOG_LEVELS overrides it
+    per logger, e.g. "donna.chat=DEBUG,werkzeug=WARNING". LOG_FORMAT=json
+    switches to JSON lines.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if isinstance(handler, NonBlockingQueueHandler):
+            return handler
+    
+    output = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        output.setFormatter(JsonLogFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)-7s %(name)s: %(message)s'))
+    
+    log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', 10000)))
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    root.handlers = [queue_handler]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    # supabase's HTTP client logs every request at INFO
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    for item in os.getenv('LOG_LEVELS', '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+    
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return queue_handler
+
+log_handler = configure_logging()
+
+def logging_stats():
+    return {'queued': log_handler.queue.qsize(), 'dropped': log_handler.dropped}
+
+def log_banner(logger, title, *lines):
+    """Log a ==== banner block as one record, only when LOG_BANNERS is on"""
+    if LOG_BANNERS and logger.isEnabledFor(logging.INFO):
+        rule = "=" * 80
+        logger.info("\n".join(["", rule, title, rule, *lines, rule]))
+
+log = logging.getLogger('donna')
+auth_log = logging.getLogger('donna.auth')
+chat_log = logging.getLogger('donna.chat')
+actions_log = logging.getLogger('donna.actions')
+llm_log = logging.getLogger('donna.llm')
+data_log = logging.getLogger('donna.data')
+push_log = logging.getLogger('donna.push')
+
+# ==================== METRICS ====================
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """Prometheus-style bucket counts plus a window of recent samples for percentiles"""
+    
+    def __init__(self, buckets=LATENCY_BUCKETS, window=1024):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+    
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+    
+    def percentile(self, fraction):
+        if not self.recent:
+            return None
+        samples = sorted(self.recent)
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+class MetricsRegistry:
+    """In-process counters and histograms, rendered in the Prometheus text format.
+
+    Collectors are callables run at scrape time that return extra
+    (name, type, help, [(labels, value), ...]) families, so components
+    that already keep their own stats don't have to duplicate them here.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._buckets = {}
+        self._collectors = []
+    
+    def describe(self, name, help_text, buckets=None):
+        self._help[name] = help_text
+        if buckets:
+            self._buckets[name] = buckets
+    
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+    
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+    
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self._buckets.get(name, LATENCY_BUCKETS))
+            histogram.observe(value)
+    
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+    
+    def summary(self, name, label):
+        """{label value: {count, p50_ms, p99_ms}} for one histogram family"""
+        with self._lock:
+            result = {}
+            for (metric, labels), histogram in self._histograms.items():
+                if metric != name:
+                    continue
+                p50, p99 = histogram.percentile(0.5), histogram.percentile(0.99)
+                result[dict(labels).get(label, '')] = {
+                    'count': histogram.count,
+                    'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+                    'p99_ms': round(p99 * 1000, 1) if p99 is not None else None
+                }
+            return dict(sorted(result.items()))
+    
+    def render(self):
+        lines = []
+        
+        def header(name, kind):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+        
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            histograms = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in histograms]
+        
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                header(name, 'counter')
+            lines.append(f"{name}{format_labels(labels)} {format_metric_value(value)}")
+        
+        for (name, labels), counts, total, count, buckets in histograms:
+            if name not in seen:
+                seen.add(name)
+                header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', format_metric_value(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {format_metric_value(total)}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                log.error("❌ Metrics collector failed: %s", e)
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{format_labels(tuple(sorted(labels.items())))} {format_metric_value(value)}")
+        
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+def format_metric_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+metrics = MetricsRegistry()
+metrics.describe('donna_stage_seconds', 'Time spent in each stage of a request (Supabase calls, LLM, parsing, actions).')
+metrics.describe('donna_http_request_seconds', 'HTTP request latency until the response headers are ready.')
+metrics.describe('donna_http_requests_total', 'HTTP requests by endpoint, method and status.')
+metrics.describe('donna_http_errors_total', 'HTTP requests that ended in a 5xx or an unhandled exception.')
+metrics.describe('donna_chat_queue_wait_seconds', 'Time queued chat jobs waited for a worker.')
+metrics.describe('donna_local_intents_total', 'Chat messages answered by the local intents instead of the LLM, by intent.')
+metrics.describe('donna_compressed_responses_total', 'API responses compressed on the fly, by encoding.')
+metrics.describe('donna_compression_saved_bytes_total', 'Bytes saved by compressing API responses.')
+metrics.describe('donna_context_tokens', 'Estimated tokens in each freshly built user context.',
+                 buckets=(50, 100, 200, 400, 600, 800, 1200, 1600, 2400, 3200))
+
+def stage_timer(stage):
+    """Time one stage into donna_stage_seconds{stage=...}"""
+    return metrics.timer('donna_stage_seconds', stage=stage)
+
+# ==================== JSON PROVIDER ====================
+# jsonify() goes through app.json. With orjson installed the task, event and
+# history lists serialize several times faster, straight to bytes. Output
+# matches the stdlib provider's (sorted keys, HTTP dates for datetimes);
+# anything orjson can't encode falls back to the stdlib encoder.
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, backed by orjson when it is installed"""
+    
+    def dumps_bytes(self, obj, sort_keys=None):
+        """Compact UTF-8 JSON"""
+        sort_keys = self.sort_keys if sort_keys is None else sort_keys
+        if orjson is not None:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            if sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            try:
+                return orjson.dumps(obj, default=self.default, option=option)
+            except TypeError:
+                pass  # e.g. integers beyond 64 bits
+        return json.dumps(obj, default=self.default, ensure_ascii=False, sort_keys=sort_keys,
+                          separators=(',', ':')).encode()
+    
+    def dumps(self, obj, **kwargs):
+        if kwargs or orjson is None:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        if kwargs or orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+SECRET_KEY = os.getenv('SECRET_KEY', 'ajd8f92n3kfjSDF9234lkj23nf9234')
+
+# Routes and request hooks are registered on this blueprint; create_app()
+# (see APP FACTORY at the bottom) builds the Flask app around it.
+donna_routes = Blueprint('donna', __name__)
+
+# ==================== LAZY CLIENTS ====================
+# Importing supabase (and the httpx/httpcore stack under it) takes ~0.4s and
+# creating the client does nothing a request needs yet, so it happens on
+# first use. A Render free instance spun down while idle then serves
+# /health as soon as Flask is up; warmup() connects in the background.
+
+class LazyClient:
+    """Stands in for a client that is built on first use, once, under a lock"""
+    
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+    
+    @property
+    def ready(self):
+        return self._client is not None
+    
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    started = time.perf_counter()
+                    self._client = self._factory()
+                    log.info("🔌 %s client ready in %.0fms", self.name, (time.perf_counter() - started) * 1000)
+                client = self._client
+        return client
+    
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
 
 # SUPABASE CREDENTIALS
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY')
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+
+def create_supabase_client():
+    if not SUPABASE_URL or not SUPABASE_ANON_KEY:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+
+supabase = LazyClient('Supabase', create_supabase_client)
+
+# Postgres / PostgREST codes for a table or column that doesn't exist
+MISSING_SCHEMA_CODES = {'42P01', '42703', 'PGRST200', 'PGRST204', 'PGRST205'}
+
+def is_missing_schema_error(error):
+    """True when a Supabase error means a migration hasn't run, not a transient failure"""
+    return getattr(error, 'code', None) in MISSING_SCHEMA_CODES
 
 # OPENROUTER API
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_URL = os.getenv('OPENROUTER_URL', "https://openrouter.ai/api/v1/chat/completions")
+
+# ==================== USER CONTEXT CACHE ====================
+
+class UserContextCache:
+    """Bounded LRU + TTL cache of each user's formatted context.
+
+    Entries are dropped by the routes that change tasks or events, so a hit
+    is never staler than this worker's own writes. Writes made by other
+    gunicorn workers are picked up when the TTL runs out.
+    """
+
+    def __init__(self, max_entries=512, ttl_seconds=60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        """Return (context, context_data) or None"""
+        today = datetime.now().date()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            # The context embeds today's date, so it also expires at midnight
+            if entry is None or entry[0] < time.monotonic() or entry[1] != today:
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[2]
+
+    def version(self, user_id):
+        """Take before loading; pass to set() so a racing write wins"""
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def set(self, user_id, value, version=None):
+        with self._lock:
+            if version is not None and version != self._versions.get(user_id, 0):
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl_seconds, datetime.now().date(), value)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+context_cache = UserContextCache(
+    max_entries=int(os.getenv('CONTEXT_CACHE_SIZE', 512)),
+    ttl_seconds=float(os.getenv('CONTEXT_CACHE_TTL', 60))
+)
+
+# ==================== RESPONSE CACHE ====================
+
+class ResponseCache:
+    """Bounded LRU + TTL cache of DONNA's answers to read-only questions.
+
+    Keys include a hash of the user's context, so any change to their tasks
+    or events makes the old answers unreachable; they age out by TTL or LRU.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', 1024)),
+    ttl_seconds=float(os.getenv('RESPONSE_CACHE_TTL', 300))
+)
+
+QUESTION_START_RE = re.compile(
+    r"^(what|whats|when|which|where|who|how|do|does|did|is|are|am|any|anything|show|list|tell|give|summari[sz]e)\b"
+)
+# Verbs that ask for a change wherever they appear, and words that only do
+# as the first word ("schedule a call" vs "what's on my schedule")
+WRITE_INTENT_RE = re.compile(
+    r"\b(add|create|remind|reschedule|rename|edit|delete|remove|cancel|clear|complete|finish|mark|check off)\b"
+)
+WRITE_COMMAND_RE = re.compile(r"^(schedule|book|plan|set|put|move|make|change|update|new)\b")
+FILLER_PREFIX_RE = re.compile(r"^(?:(?:hey|hi|hello|ok|okay|so|um|donna|please|can you|could you|would you)\s+)+")
+
+def normalize_question(message):
+    """Lowercased, punctuation-free form of a read-only question, or None.
+
+    Anything that might ask for a change is not cacheable, and neither is
+    small talk that isn't a question about the user's data.
+    """
+    text = re.sub(r"[^a-z0-9\s]", "", message.lower().replace("'", ""))
+    text = FILLER_PREFIX_RE.sub("", " ".join(text.split()))
+    if not text or len(text) > 200 or WRITE_INTENT_RE.search(text) or WRITE_COMMAND_RE.match(text):
+        return None
+    if not (QUESTION_START_RE.match(text) or message.rstrip().endswith('?')):
+        return None
+    return text
+
+def response_cache_key(user_id, user_message, user_context):
+    """Cache key for a read-only question asked against this context, or None"""
+    question = normalize_question(user_message)
+    if question is None:
+        return None
+    context_hash = hashlib.sha1(user_context.encode()).hexdigest()
+    return (user_id, question, context_hash)
+
+# ==================== CHANGE NOTIFICATIONS ====================
+
+class Subscription:
+    """One open push stream. Pending topics are coalesced into a set, so a
+    burst of writes turns into a single notification per topic."""
+
+    def __init__(self):
+        self._topics = set()
+        self._condition = threading.Condition()
+
+    def push(self, topic):
+        with self._condition:
+            self._topics.add(topic)
+            self._condition.notify()
+
+    def wait(self, timeout):
+        """Block until something changes; return the changed topics (maybe none)"""
+        with self._condition:
+            if not self._topics:
+                self._condition.wait(timeout)
+            topics, self._topics = self._topics, set()
+            return topics
+
+class LocalPubSubBackend:
+    """Delivers notifications to streams held by this process only"""
+
+    name = 'local'
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, user_id, topic):
+        self._deliver(user_id, topic)
+
+class RedisPubSubBackend:
+    """Fans notifications out to every gunicorn worker over a Redis channel.
+
+    Needs the optional ``redis`` package; enabled with PUBSUB_URL=redis://...
+    """
+
+    name = 'redis'
+
+    def __init__(self, url, channel='donna:changes'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+
+    def start(self, deliver):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+
+        def listen():
+            while True:
+                try:
+                    for message in pubsub.listen():
+                        data = json.loads(message['data'])
+                        deliver(data['user_id'], data['topic'])
+                except Exception as e:
+                    push_log.error("❌ Redis pub/sub listener error: %s", e)
+                    time.sleep(1)
+
+        threading.Thread(target=listen, name='donna-pubsub', daemon=True).start()
+
+    def publish(self, user_id, topic):
+        self.client.publish(self.channel, json.dumps({'user_id': user_id, 'topic': topic}))
+
+class StreamsFullError(Exception):
+    """Raised when this process already holds as many push streams as it allows"""
+
+class ChangeNotifier:
+    """Per-user pub/sub of change notifications ('tasks', 'calendar', 'messages').
+
+    Every open stream holds a request thread, so ``max_streams`` caps them
+    per process and leaves the rest of the pool to the API routes.
+    """
+
+    def __init__(self, backend, max_streams_per_user=10, max_streams=16):
+        self.backend = backend
+        self.max_streams_per_user = max_streams_per_user
+        self.max_streams = max_streams
+        self._subscriptions = {}
+        self._open = 0
+        self._lock = threading.Lock()
+        self.published = 0
+        self.rejected = 0
+        self.backend.start(self._deliver)
+
+    def subscribe(self, user_id):
+        """Register a stream, or return None if the user has too many open.
+
+        Raises StreamsFullError when the process is at ``max_streams``.
+        """
+        with self._lock:
+            if self._open >= self.max_streams:
+                self.rejected += 1
+                raise StreamsFullError(f"{self._open} push streams already open")
+            streams = self._subscriptions.setdefault(user_id, set())
+            if len(streams) >= self.max_streams_per_user:
+                return None
+            subscription = Subscription()
+            streams.add(subscription)
+            self._open += 1
+            return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            streams = self._subscriptions.get(user_id)
+            if streams is not None and subscription in streams:
+                streams.discard(subscription)
+                self._open -= 1
+                if not streams:
+                    del self._subscriptions[user_id]
+
+    def publish(self, user_id, topic):
+        self.published += 1
+        try:
+            self.backend.publish(user_id, topic)
+        except Exception as e:
+            # Clients still have their fallback poll
+            push_log.error("❌ Change notification failed: %s", e)
+
+    def _deliver(self, user_id, topic):
+        with self._lock:
+            streams = list(self._subscriptions.get(user_id, ()))
+        for subscription in streams:
+            subscription.push(topic)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.backend.name,
+                'users': len(self._subscriptions),
+                'streams': self._open,
+                'max_streams': self.max_streams,
+                'rejected': self.rejected,
+                'published': self.published
+            }
+
+def create_pubsub_backend(url):
+    if url and url.startswith(('redis://', 'rediss://')):
+        try:
+            return RedisPubSubBackend(url)
+        except ImportError:
+            push_log.warning("⚠️ PUBSUB_URL is set but the redis package is missing - using in-process pub/sub")
+    return LocalPubSubBackend()
+
+change_notifier = ChangeNotifier(
+    create_pubsub_backend(os.getenv('PUBSUB_URL')),
+    max_streams_per_user=int(os.getenv('MAX_STREAMS_PER_USER', 10)),
+    max_streams=int(os.getenv('MAX_STREAMS', 16))
+)
+
+TABLE_TOPICS = {'tasks': 'tasks', 'calendar_events': 'calendar'}
+
+def notify_change(user_id, *topics):
+    """Record that the user's data changed: drop cached context and push to open streams"""
+    if 'tasks' in topics or 'calendar' in topics:
+        context_cache.invalidate(user_id)
+    for topic in topics:
+        change_notifier.publish(user_id, topic)
+
+# ==================== SHARED I/O EXECUTOR ====================
+
+# Independent Supabase calls on the chat path run here concurrently. Tasks
+# submitted to this pool must not wait on other tasks in it.
+io_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('IO_POOL_SIZE', 16)),
+    thread_name_prefix='donna-io'
+)
+SUPABASE_CALL_TIMEOUT = float(os.getenv('SUPABASE_CALL_TIMEOUT', 10))
+
+def result_or_default(future, default, label, timeout=None):
+    """Wait for a fan-out call, falling back to ``default`` on error or timeout"""
+    try:
+        return future.result(timeout=timeout or SUPABASE_CALL_TIMEOUT)
+    except FutureTimeoutError:
+        data_log.warning("⚠️ %s timed out after %ss", label, timeout or SUPABASE_CALL_TIMEOUT)
+        future.cancel()
+        return default
+    except Exception as e:
+        data_log.error("❌ %s failed: %s", label, e)
+        return default
+
+# ==================== OPENROUTER CLIENT ====================
+
+class LLMError(Exception):
+    """OpenRouter call failed"""
+
+    def __init__(self, message, status_code=None, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class CircuitOpenError(LLMError):
+    """OpenRouter is failing; calls are rejected without being sent"""
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open after a cool-down.
+
+    While half-open a single trial call is let through; its outcome closes
+    or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self.trial_in_flight = False
+            if self.state == 'half_open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    llm_log.warning("⚠️ OpenRouter circuit opened after %d failures", self.failures)
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """Give back a half-open trial whose call ended without an outcome"""
+        with self._lock:
+            if self.state == 'half_open':
+                self.trial_in_flight = False
+
+class OpenRouterClient:
+    """Keep-alive OpenRouter client with retries, hedging and a circuit breaker.
+
+    - One pooled requests.Session, so turns reuse TCP+TLS connections.
+    - 429/5xx and connection errors are retried with full-jitter exponential
+      backoff (honouring Retry-After), all within ``deadline`` seconds.
+    - With ``hedge_percentile`` set (e.g. 0.95), a non-streaming call still
+      running after that latency percentile gets a second identical request
+      and whichever answers first wins.
+    - Repeated failures open the circuit breaker and calls fail fast with
+      CircuitOpenError until the cool-down passes.
+    
+    acomplete() and astream() are the asyncio versions used by asgi.py; they
+    share the breaker and stats but go through a pooled httpx.AsyncClient
+    and don't hedge.
+    """
+
+    RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+    def __init__(self, url, api_key, pool_size=10, max_retries=2, backoff_base=0.5,
+                 backoff_max=4.0, connect_timeout=5, read_timeout=45, deadline=60,
+                 hedge_percentile=None, hedge_min_samples=20, breaker=None, async_pool_size=200):
+        self.url = url
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+
+        self.pool_size = pool_size
+        self._session = None
+        self._hedge_executor = ThreadPoolExecutor(max_workers=pool_size * 2, thread_name_prefix='donna-llm')
+        self.async_pool_size = async_pool_size
+        self._async_session = None
+
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    # ---- public API ----
+
+    @property
+    def session(self):
+        """The pooled requests.Session, created (and requests imported) on first use"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def warm(self):
+        """Open a pooled connection to OpenRouter ahead of the first chat"""
+        if self.api_key:
+            self.session.head(self.url, timeout=self.connect_timeout).close()
+
+    def complete(self, payload):
+        """POST a chat completion and return the decoded JSON body"""
+        self._check_breaker()
+        with self._lock:
+            self.calls += 1
+        with self._settle_breaker():
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is None:
+                body = self._with_retries(lambda timeout: self._post_json(payload, timeout))
+            else:
+                body = self._hedged(payload, hedge_delay)
+            self._record_usage(body.get('usage'))
+        return body
+
+    def stream(self, payload):
+        """POST a streaming chat completion and yield content deltas.
+
+        Only connecting and the response status are retried; once tokens
+        have been forwarded a failure is raised to the caller.
+        """
+        import requests
+        self._check_breaker()
+        with self._lock:
+            self.calls += 1
+        with self._settle_breaker():
+            response = self._with_retries(lambda timeout: self._open_stream(payload, timeout))
+            try:
+                for raw_line in response.iter_lines():
+                    finished, delta = self._stream_delta(raw_line.decode('utf-8'))
+                    if finished:
+                        break
+                    if delta:
+                        yield delta
+            except (requests.RequestException, LLMError) as e:
+                raise LLMError(f"Stream interrupted: {e}") from e
+            finally:
+                response.close()
+
+    async def acomplete(self, payload):
+        """complete() for asyncio callers"""
+        self._check_breaker()
+        with self._lock:
+            self.calls += 1
+        with self._settle_breaker():
+            body = await self._with_retries_async(lambda timeout: self._post_json_async(payload, timeout))
+            self._record_usage(body.get('usage'))
+        return body
+
+    async def astream(self, payload):
+        """stream() for asyncio callers: an async generator of content deltas"""
+        import httpx
+        self._check_breaker()
+        with self._lock:
+            self.calls += 1
+        with self._settle_breaker():
+            response = await self._with_retries_async(lambda timeout: self._open_stream_async(payload, timeout))
+            try:
+                async for line in response.aiter_lines():
+                    finished, delta = self._stream_delta(line)
+                    if finished:
+                        break
+                    if delta:
+                        yield delta
+            except (httpx.HTTPError, LLMError) as e:
+                raise LLMError(f"Stream interrupted: {e}") from e
+            finally:
+                await response.aclose()
+
+    async def aclose(self):
+        if self._async_session is not None:
+            await self._async_session.aclose()
+            self._async_session = None
+
+    def stats(self):
+        with self._lock:
+            samples = sorted(self._latencies)
+            return {
+                'circuit': self.breaker.state,
+                'session_open': self._session is not None,
+                'calls': self.calls,
+                'retries': self.retries,
+                'failures': self.failures,
+                'hedges_sent': self.hedges_sent,
+                'hedges_won': self.hedges_won,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'latency_p50': round(self._percentile(samples, 0.5), 3) if samples else None,
+                'latency_p95': round(self._percentile(samples, 0.95), 3) if samples else None
+            }
+
+    # ---- internals ----
+
+    def _headers(self, stream=False):
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        if stream:
+            headers["Accept"] = "text/event-stream"
+        return headers
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError("AI service is temporarily unavailable, please try again shortly")
+
+    def _record_usage(self, usage):
+        if not isinstance(usage, dict):
+            return
+        with self._lock:
+            self.prompt_tokens += usage.get('prompt_tokens') or 0
+            self.completion_tokens += usage.get('completion_tokens') or 0
+
+    def _stream_delta(self, line):
+        """(finished, content delta or None) for one line of a streamed completion"""
+        line = line.strip()
+        # Blank separators and ": OPENROUTER PROCESSING" keep-alive comments
+        if not line.startswith('data:'):
+            return False, None
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return True, None
+
+        chunk = json.loads(data)
+        if chunk.get('error'):
+            raise LLMError(f"API error: {chunk['error']}")
+        # Usage arrives on the last chunk, usually without content
+        if chunk.get('usage'):
+            self._record_usage(chunk['usage'])
+        choices = chunk.get('choices') or [{}]
+        return False, (choices[0].get('delta') or {}).get('content')
+
+    @contextmanager
+    def _settle_breaker(self):
+        """Report how one call ended to the breaker, so a half-open trial is
+        always settled: success, failure, or released when the caller went away.
+        """
+        try:
+            yield
+        except LLMError as e:
+            with self._lock:
+                self.failures += 1
+            # 4xx errors other than throttling are our fault, and prove OpenRouter is up
+            if e.retryable or e.status_code is None:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # GeneratorExit from a closed stream, task cancellation
+            self.breaker.release()
+            raise
+        else:
+            self.breaker.record_success()
+
+    @staticmethod
+    def _raise_for_status(response):
+        if response.status_code == 200:
+            return
+        retry_after = response.headers.get('Retry-After')
+        raise LLMError(
+            f"API error: {response.status_code} - {response.text}",
+            status_code=response.status_code,
+            retryable=response.status_code in OpenRouterClient.RETRY_STATUSES,
+            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+        )
+
+    def _post_json(self, payload, read_timeout):
+        import requests
+        started = time.monotonic()
+        try:
+            response = self.session.post(
+                self.url,
+                headers=self._headers(),
+                json=payload,
+                timeout=(self.connect_timeout, read_timeout)
+            )
+        except requests.RequestException as e:
+            raise LLMError(f"OpenRouter request failed: {e}", retryable=True) from e
+        self._raise_for_status(response)
+        body = response.json()
+        with self._lock:
+            self._latencies.append(time.monotonic() - started)
+        return body
+
+    def _open_stream(self, payload, read_timeout):
+        import requests
+        try:
+            response = self.session.post(
+                self.url,
+                headers=self._headers(stream=True),
+                json=payload,
+                stream=True,
+                timeout=(self.connect_timeout, read_timeout)
+            )
+        except requests.RequestException as e:
+            raise LLMError(f"OpenRouter request failed: {e}", retryable=True) from e
+        try:
+            self._raise_for_status(response)
+        except LLMError:
+            response.close()
+            raise
+        return response
+
+    def _with_retries(self, attempt):
+        """Run attempt(read_timeout) with jittered backoff inside the deadline"""
+        deadline = time.monotonic() + self.deadline
+        for attempt_number in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            try:
+                return attempt(max(1.0, min(self.read_timeout, remaining)))
+            except LLMError as e:
+                delay = self._retry_delay(e, attempt_number, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def _with_retries_async(self, attempt):
+        deadline = time.monotonic() + self.deadline
+        for attempt_number in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            try:
+                return await attempt(max(1.0, min(self.read_timeout, remaining)))
+            except LLMError as e:
+                delay = self._retry_delay(e, attempt_number, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    def _retry_delay(self, error, attempt_number, deadline):
+        """Backoff before the next attempt, or None when ``error`` should be raised"""
+        if not error.retryable or attempt_number == self.max_retries:
+            return None
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt_number)))
+        if error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+        if time.monotonic() + delay >= deadline:
+            return None
+        with self._lock:
+            self.retries += 1
+        llm_log.warning("🔁 OpenRouter retry %d/%d in %.2fs: %s", attempt_number + 1, self.max_retries, delay, error)
+        return delay
+
+    def _async_client(self):
+        """The httpx.AsyncClient, created on first use inside the event loop"""
+        import httpx
+        if self._async_session is None:
+            self._async_session = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.async_pool_size,
+                                    max_keepalive_connections=self.async_pool_size),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+            )
+        return self._async_session
+
+    async def _post_json_async(self, payload, read_timeout):
+        import httpx
+        started = time.monotonic()
+        try:
+            response = await self._async_client().post(
+                self.url,
+                headers=self._headers(),
+                json=payload,
+                timeout=httpx.Timeout(read_timeout, connect=self.connect_timeout)
+            )
+        except httpx.HTTPError as e:
+            raise LLMError(f"OpenRouter request failed: {e}", retryable=True) from e
+        self._raise_for_status(response)
+        body = response.json()
+        with self._lock:
+            self._latencies.append(time.monotonic() - started)
+        return body
+
+    async def _open_stream_async(self, payload, read_timeout):
+        import httpx
+        client = self._async_client()
+        try:
+            response = await client.send(client.build_request(
+                'POST',
+                self.url,
+                headers=self._headers(stream=True),
+                json=payload,
+                timeout=httpx.Timeout(read_timeout, connect=self.connect_timeout)
+            ), stream=True)
+        except httpx.HTTPError as e:
+            raise LLMError(f"OpenRouter request failed: {e}", retryable=True) from e
+        if response.status_code != 200:
+            await response.aread()
+            await response.aclose()
+            self._raise_for_status(response)
+        return response
+
+    @staticmethod
+    def _percentile(sorted_samples, fraction):
+        index = min(len(sorted_samples) - 1, int(fraction * (len(sorted_samples) - 1) + 0.5))
+        return sorted_samples[index]
+
+    def _hedge_delay(self):
+        if not self.hedge_percentile:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            return self._percentile(sorted(self._latencies), self.hedge_percentile)
+
+    def _hedged(self, payload, hedge_delay):
+        """Send a second request if the first is slower than ``hedge_delay``.
+
+        The losing request is not cancelled (requests can't abort a call in
+        flight); its connection goes back to the pool when it finishes.
+        """
+        run = lambda: self._with_retries(lambda timeout: self._post_json(payload, timeout))
+        primary = self._hedge_executor.submit(run)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        with self._lock:
+            self.hedges_sent += 1
+        hedge = self._hedge_executor.submit(run)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=self.deadline, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    body = future.result()
+                except LLMError as e:
+                    error = e
+                    continue
+                if future is hedge:
+                    with self._lock:
+                        self.hedges_won += 1
+                return body
+        raise error or LLMError("OpenRouter request timed out", retryable=True)
+
+def optional_float(name):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+llm_client = OpenRouterClient(
+    OPENROUTER_URL,
+    OPENROUTER_API_KEY,
+    pool_size=int(os.getenv('OPENROUTER_POOL_SIZE', 10)),
+    max_retries=int(os.getenv('OPENROUTER_MAX_RETRIES', 2)),
+    read_timeout=float(os.getenv('OPENROUTER_TIMEOUT', 45)),
+    deadline=float(os.getenv('OPENROUTER_DEADLINE', 60)),
+    hedge_percentile=optional_float('OPENROUTER_HEDGE_PERCENTILE'),
+    async_pool_size=int(os.getenv('OPENROUTER_ASYNC_POOL_SIZE', 200)),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv('OPENROUTER_BREAKER_THRESHOLD', 5)),
+        reset_timeout=float(os.getenv('OPENROUTER_BREAKER_RESET', 30))
+    )
+)
+
+# ==================== AUTHENTICATION HELPER ====================
+
+class TokenCache:
+    """Verified JWT claims keyed by token digest, each kept until its exp"""
+    
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+    
+    def get(self, token):
+        """Return cached claims for token, or None if unknown or expired"""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                claims, expires_at = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return claims
+                del self._entries[key]
+            self.misses += 1
+            return None
+    
+    def set(self, token, claims):
+        """Remember claims that were just verified; tokens without exp are not cached"""
+        expires_at = claims.get('exp')
+        if not isinstance(expires_at, (int, float)) or self.max_entries <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (claims, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+token_cache = TokenCache(max_entries=int(os.getenv('TOKEN_CACHE_SIZE', 10000)))
+
+def verify_token(token, scope=None):
+    """Return the claims of a valid token for ``scope``, decoding it only on a cache miss.
+
+    Login tokens have no scope; 'stream' tokens only open push streams.
+    """
+    claims = token_cache.get(token)
+    if claims is None:
+        import jwt
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        except jwt.InvalidTokenError:
+            return None
+        token_cache.set(token, claims)
+    return claims if claims.get('scope') == scope else None
+
+STREAM_TOKEN_SECONDS = int(os.getenv('STREAM_TOKEN_SECONDS', 60))
+
+def create_stream_token(claims):
+    """A short-lived token that only opens push streams, for EventSource URLs.
+
+    Query strings end up in access logs, so the 30-day login token never goes there.
+    """
+    import jwt
+    now = datetime.utcnow()
+    return jwt.encode({
+        'user_id': claims['user_id'],
+        'username': claims.get('username'),
+        'scope': 'stream',
+        'iat': now,
+        'exp': now + timedelta(seconds=STREAM_TOKEN_SECONDS)
+    }, SECRET_KEY, algorithm='HS256')
+
+class HashPoolBusyError(Exception):
+    """Raised when too many password hashes are already waiting for a core"""
+
+class PasswordHasher:
+    """Password hashing and verification on a pool sized to the CPU count.
+
+    Hashing is deliberately slow, so a login storm would otherwise pin every
+    request thread on it. The pool caps how many run at once and how many may
+    wait; past that, callers get HashPoolBusyError and answer 503.
+    """
+    
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='donna-hash')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+    
+    def _run(self, stage, fn, *args):
+        if not self._slots.acquire(timeout=AUTH_HASH_WAIT_SECONDS):
+            with self._lock:
+                self.rejected += 1
+            raise HashPoolBusyError(f"{self.pending} password hashes already pending")
+        with self._lock:
+            self.pending += 1
+        try:
+            with stage_timer(stage):
+                return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+    
+    def hash(self, password):
+        return self._run('password_hash', generate_password_hash, password)
+    
+    def verify(self, password_hash, password):
+        return self._run('password_check', check_password_hash, password_hash, password)
+    
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'pending': self.pending, 'rejected': self.rejected}
+
+AUTH_HASH_WAIT_SECONDS = float(os.getenv('AUTH_HASH_WAIT_SECONDS', 5))
+AUTH_RETRY_AFTER_SECONDS = 2
+password_hasher = PasswordHasher(
+    workers=int(os.getenv('AUTH_HASH_WORKERS', os.cpu_count() or 2)),
+    max_pending=int(os.getenv('AUTH_HASH_MAX_PENDING', 4 * (os.cpu_count() or 2)))
+)
+
+class UnknownLoginCache:
+    """Usernames/emails that matched no user, remembered for a short TTL.
+
+    Repeated logins with an unknown identifier (typos, credential stuffing)
+    are answered without a query. Entries are per process, so registering
+    clears them here and the TTL bounds how long other workers keep one.
+    """
+    
+    def __init__(self, ttl_seconds=30, max_entries=10000):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def __contains__(self, identifier):
+        with self._lock:
+            expires_at = self._entries.get(identifier)
+            if expires_at is not None:
+                if expires_at > time.monotonic():
+                    self.hits += 1
+                    return True
+                del self._entries[identifier]
+            self.misses += 1
+            return False
+    
+    def add(self, identifier):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[identifier] = time.monotonic() + self.ttl
+            self._entries.move_to_end(identifier)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def discard(self, *identifiers):
+        with self._lock:
+            for identifier in identifiers:
+                self._entries.pop(identifier, None)
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+unknown_logins = UnknownLoginCache(
+    ttl_seconds=float(os.getenv('AUTH_NEGATIVE_TTL', 30)),
+    max_entries=int(os.getenv('AUTH_NEGATIVE_CACHE_SIZE', 10000))
+)
+
+AUTH_USER_COLUMNS = 'id, username, email, password_hash'
+
+def find_login_user(identifier):
+    """The user whose username, or else email, is identifier - in one query"""
+    quoted = postgrest_quote(identifier)
+    with stage_timer('user_lookup'):
+        result = supabase.table('users')\
+            .select(AUTH_USER_COLUMNS)\
+            .or_(f"username.eq.{quoted},email.eq.{quoted}")\
+            .limit(2)\
+            .execute()
+    rows = result.data or []
+    return next((u for u in rows if u['username'] == identifier), rows[0] if rows else None)
+
+def registration_conflict(email, username):
+    """'email' or 'username' if either is already taken, else None - in one query"""
+    with stage_timer('user_lookup'):
+        result = supabase.table('users')\
+            .select('email, username')\
+            .or_(f"email.eq.{postgrest_quote(email)},username.eq.{postgrest_quote(username)}")\
+            .limit(2)\
+            .execute()
+    rows = result.data or []
+    if any(u['email'] == email for u in rows):
+        return 'email'
+    if rows:
+        return 'username'
+    return None
+
+def auth_busy_response():
+    return jsonify({
+        'success': False,
+        'message': 'Too many sign-ins right now, please try again in a moment'
+    }), 503, {'Retry-After': str(AUTH_RETRY_AFTER_SECONDS)}
+
+def get_current_user(allow_query_token=False):
+    """Extract user from JWT token.
+
+    EventSource can't send headers, so push streams may pass a stream token
+    (POST /api/events/token) as ?token= instead.
+    """
+    scope = None
+    auth_header = request.headers.get('Authorization')
+    if auth_header:
+        if not auth_header.startswith('Bearer '):
+            return None
+        token = auth_header[7:].strip()
+    elif allow_query_token:
+        token = request.args.get('token', '').strip()
+        scope = 'stream'
+    else:
+        return None
+    if not token:
+        return None
+    
+    try:
+        return verify_token(token, scope)
+    except Exception as e:
+        auth_log.error("❌ Token decode error: %s", e)
+        return None
+
+def require_auth(view=None, allow_query_token=False):
+    """Reject unauthenticated requests with 401; claims go to g.user, the id to g.user_id"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user = get_current_user(allow_query_token)
+            if not user:
+                return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+            g.user = user
+            g.user_id = str(user.get('user_id'))
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator(view) if view is not None else decorator
+
+# ==================== CALENDAR RECURRENCE ====================
+# A recurring event is one calendar_events row whose `recurrence` holds an
+# RRULE subset (FREQ=DAILY|WEEKLY|MONTHLY|YEARLY with INTERVAL, COUNT,
+# UNTIL and, for WEEKLY, BYDAY). Series are expanded only inside the
+# window being read; `recurrence_until` (null = open-ended) lets the
+# window query skip series that ended before it. Needs
+# migrations/003_recurring_events.sql; until then every row is a single event.
+
+RRULE_FREQS = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+RRULE_WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+MAX_OCCURRENCES = 400
+MAX_WINDOW_DAYS = 400
+recurrence_enabled = True
+
+def parse_rrule(rule):
+    """'FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10' -> dict, or None if unsupported"""
+    parts = {}
+    for part in str(rule or '').upper().replace('RRULE:', '').split(';'):
+        key, _, value = part.partition('=')
+        if key.strip():
+            parts[key.strip()] = value.strip()
+    
+    freq = parts.get('FREQ')
+    if freq not in RRULE_FREQS or ('BYDAY' in parts and freq != 'WEEKLY'):
+        return None
+    try:
+        return {
+            'freq': freq,
+            'interval': max(int(parts.get('INTERVAL', 1)), 1),
+            'count': max(int(parts['COUNT']), 1) if 'COUNT' in parts else None,
+            'until': datetime.strptime(parts['UNTIL'][:8], '%Y%m%d').date() if 'UNTIL' in parts else None,
+            'byday': sorted({RRULE_WEEKDAYS.index(d.strip()) for d in parts['BYDAY'].split(',')})
+                     if 'BYDAY' in parts else None
+        }
+    except ValueError:
+        return None
+
+def period_dates(start, rule, period):
+    """Candidate dates in the ``period``-th interval after ``start``"""
+    freq, interval = rule['freq'], rule['interval']
+    if freq == 'DAILY':
+        return [start + timedelta(days=period * interval)]
+    if freq == 'WEEKLY':
+        if not rule['byday']:
+            return [start + timedelta(weeks=period * interval)]
+        week = start - timedelta(days=start.weekday()) + timedelta(weeks=period * interval)
+        return [week + timedelta(days=d) for d in rule['byday']]
+    if freq == 'MONTHLY':
+        month = start.month - 1 + period * interval
+        year, month = start.year + month // 12, month % 12 + 1
+        # Like RFC 5545, months without the day (the 31st, say) are skipped
+        return [start.replace(year=year, month=month)] if start.day <= calendar.monthrange(year, month)[1] else []
+    year = start.year + period * interval
+    if start.month == 2 and start.day == 29 and not calendar.isleap(year):
+        return []
+    return [start.replace(year=year)]
+
+def recurrence_dates(start, rule, window_start, window_end):
+    """Dates a series falls on inside [window_start, window_end], generated lazily"""
+    last = min(window_end, rule['until']) if rule['until'] else window_end
+    period, seen = 0, 0
+    
+    # Without COUNT nothing before the window matters: jump straight to it
+    if rule['count'] is None and rule['freq'] in ('DAILY', 'WEEKLY') and window_start > start:
+        step = rule['interval'] * (1 if rule['freq'] == 'DAILY' else 7)
+        period = max((window_start - start).days // step - 1, 0)
+    
+    while True:
+        for day in period_dates(start, rule, period):
+            if day < start:
+                continue
+            if day > last:
+                return
+            seen += 1
+            if rule['count'] is not None and seen > rule['count']:
+                return
+            if day >= window_start:
+                yield day
+        period += 1
+
+def recurrence_until(start, recurrence):
+    """Last date a series can fall on (None = open-ended); raises ValueError if unsupported"""
+    rule = parse_rrule(recurrence)
+    if rule is None:
+        raise ValueError(f"Unsupported recurrence: {recurrence}")
+    if rule['count'] is None:
+        return rule['until']
+    if rule['count'] > MAX_OCCURRENCES:
+        raise ValueError(f"COUNT can be at most {MAX_OCCURRENCES}")
+    last = None
+    for last in recurrence_dates(start, rule, start, rule['until'] or datetime.max.date()):
+        pass
+    return last
+
+def shift_timestamp(value, days):
+    """Move an ISO timestamp string by ``days``; unparseable values pass through"""
+    try:
+        return (parse_iso_timestamp(str(value)) + days).isoformat()
+    except ValueError:
+        return value
+
+def expand_events(rows, window_start, window_end):
+    """Rows -> events inside the window, one per occurrence, ordered by date.
+    
+    Occurrences keep the series' id (edits and deletes apply to the whole
+    series) and carry `recurrence` plus `series_date`, the first date.
+    """
+    events = []
+    for row in rows:
+        rule = parse_rrule(row.get('recurrence')) if row.get('recurrence') else None
+        start = parse_day(row.get('date'))
+        if rule is None or start is None:
+            if start is None or window_start <= start <= window_end:
+                events.append(row)
+            continue
+        for day in islice(recurrence_dates(start, rule, window_start, window_end), MAX_OCCURRENCES):
+            shift = day - start
+            events.append({
+                **row,
+                'date': day.isoformat(),
+                'start_time': shift_timestamp(row.get('start_time'), shift) if row.get('start_time') else None,
+                'end_time': shift_timestamp(row.get('end_time'), shift) if row.get('end_time') else None,
+                'series_date': row.get('date')
+            })
+    events.sort(key=lambda e: (str(e.get('date') or ''), str(e.get('time') or ''), str(e.get('id'))))
+    return events
+
+def recurrence_fields(recurrence, date):
+    """Columns to store for a series starting on ``date``; raises ValueError if invalid"""
+    if not recurrence:
+        return {'recurrence': None, 'recurrence_until': None}
+    start = parse_day(date)
+    if start is None:
+        raise ValueError('Recurring events need a valid date')
+    until = recurrence_until(start, recurrence)
+    return {'recurrence': str(recurrence).upper(), 'recurrence_until': until.isoformat() if until else None}
+
+def disable_recurrence(error):
+    global recurrence_enabled
+    recurrence_enabled = False
+    data_log.warning("⚠️ Recurring events disabled (run migrations/003_recurring_events.sql): %s", error)
+
+def events_window_filter(start, end):
+    """Single events inside the window, plus series that start before its end
+    and haven't ended before its start"""
+    return (f"and(recurrence.is.null,date.gte.{start},date.lte.{end}),"
+            f"and(recurrence.not.is.null,date.lte.{end},"
+            f"or(recurrence_until.is.null,recurrence_until.gte.{start}))")
+
+def fetch_events_in_window(user_id, window_start, window_end, stage='calendar_events_window'):
+    """The user's events between two dates (inclusive), recurring series expanded"""
+    start, end = window_start.isoformat(), window_end.isoformat()
+    
+    if recurrence_enabled:
+        try:
+            with stage_timer(stage):
+                result = supabase.table('calendar_events')\
+                    .select('*')\
+                    .eq('user_id', user_id)\
+                    .or_(events_window_filter(start, end))\
+                    .execute()
+            return expand_events(result.data or [], window_start, window_end)
+        except Exception as e:
+            # Timeouts and network errors say nothing about the schema
+            if not is_missing_schema_error(e):
+                raise
+            disable_recurrence(e)
+    
+    with stage_timer(stage):
+        result = supabase.table('calendar_events')\
+            .select('*')\
+            .eq('user_id', user_id)\
+            .gte('date', start)\
+            .lte('date', end)\
+            .order('date')\
+            .execute()
+    return result.data or []
+
+# ==================== DONNA AI FUNCTIONS ====================
+
+def fetch_tasks(user_id):
+    """All of the user's tasks"""
+    with stage_timer('context_tasks'):
+        tasks_result = supabase.table('tasks').select('*').eq('user_id', user_id).execute()
+    return tasks_result.data or []
+
+def fetch_upcoming_events(user_id, today):
+    """The user's events for the next CONTEXT_EVENT_DAYS days"""
+    future_date = today + timedelta(days=CONTEXT_EVENT_DAYS)
+    
+    return fetch_events_in_window(user_id, today, future_date, stage='context_events')
+
+CONTEXT_EVENT_DAYS = 30
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 600))
+CONTEXT_DETAILED_ITEMS = int(os.getenv('CONTEXT_DETAILED_ITEMS', 3))
+PRIORITY_RANK = {'high': 0, 'medium': 1, 'low': 2}
+
+def estimate_tokens(text):
+    """Rough token count, about four characters per token"""
+    return (len(text) + 3) // 4
+
+def parse_day(value):
+    """The date part of a date or timestamp string, or None"""
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
+
+def rank_tasks(tasks, today):
+    """Overdue first, then by due date (undated last), then by priority"""
+    def key(task):
+        due = parse_day(task.get('due_date'))
+        return (
+            0 if due is not None and due < today else 1,
+            due or datetime.max.date(),
+            PRIORITY_RANK.get(str(task.get('priority') or 'medium').lower(), 1),
+            str(task.get('created_at') or ''),
+            str(task.get('id') or '')
+        )
+    return sorted(tasks, key=key)
+
+def rank_events(events):
+    """Soonest first"""
+    return sorted(events, key=lambda e: (str(e.get('date') or ''), str(e.get('time') or ''), str(e.get('id') or '')))
+
+def task_context_line(task, today, detailed):
+    priority = str(task.get('priority') or 'medium')[:1].upper()
+    line = f"- [{priority}] {task.get('title', 'Untitled Task')}"
+    due = parse_day(task.get('due_date'))
+    if due is not None:
+        line += f" | due {due.isoformat()}{' OVERDUE' if due < today else ''}"
+    if detailed and task.get('description'):
+        line += f" | {task['description'][:80]}"
+    return line + "\n"
 
-print("\n" + "="*80)
-print("🔧 CONFIGURATION LOADED")
-print("="*80)
-print(f"✅ Supabase URL: {SUPABASE_URL[:30]}...")
-print(f"✅ Supabase Key: {SUPABASE_ANON_KEY[:30]}...")
-print(f"✅ OpenRouter Key: {'***' + OPENROUTER_API_KEY[-10:] if OPENROUTER_API_KEY else 'MISSING'}")
-print(f"✅ Secret Key: {app.secret_key[:20]}...")
-print("="*80 + "\n")
+def event_context_line(event, detailed):
+    line = f"- {event.get('date', '')}"
+    if event.get('time'):
+        line += f" {str(event['time'])[:5]}"
+    line += f" {event.get('title', 'Untitled Event')}"
+    if detailed and event.get('description'):
+        line += f" | {event['description'][:80]}"
+    return line + "\n"
 
-# ==================== AUTHENTICATION HELPER ====================
+def take_within_budget(lines, budget):
+    """The longest prefix of lines that fits in budget tokens, and its cost"""
+    taken, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        taken.append(line)
+        used += cost
+    return taken, used
 
-def get_current_user():
-    """Extract user from JWT token"""
-    auth_header = request.headers.get('Authorization', '')
-    if not auth_header:
-        print("❌ No Authorization header")
-        return None
-    if not auth_header.startswith('Bearer '):
-        print("❌ Invalid Authorization header format")
-        return None
+def format_user_context(tasks, events, today, token_budget=None):
+    """Format tasks and events into the private context prompt.
+
+    Tasks are ranked by overdue status, due date and priority, events by how
+    soon they start, and lines are added in that order until the token
+    budget is spent: about 60% for tasks first, then events, then whatever
+    is left back to tasks. Only the top few items carry descriptions.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    active_tasks = [t for t in tasks if not t.get('completed')]
+    completed_tasks = [t for t in tasks if t.get('completed')]
     
-    token = auth_header.replace('Bearer ', '').strip()
-    if not token:
-        print("❌ Empty token")
-        return None
+    ranked_tasks = rank_tasks(active_tasks, today)
+    ranked_events = rank_events(events)
+    task_lines = [task_context_line(t, today, i < CONTEXT_DETAILED_ITEMS) for i, t in enumerate(ranked_tasks)]
+    event_lines = [event_context_line(e, i < CONTEXT_DETAILED_ITEMS) for i, e in enumerate(ranked_events)]
     
-    try:
-        payload = jwt.decode(token, app.secret_key, algorithms=['HS256'])
-        print(f"✅ Token decoded for user: {payload.get('username')}")
-        return payload
-    except jwt.ExpiredSignatureError:
-        print("❌ Token expired")
-        return None
-    except jwt.InvalidTokenError as e:
-        print(f"❌ Invalid token: {e}")
-        return None
-    except Exception as e:
-        print(f"❌ Token decode error: {e}")
-        return None
+    header = (
+        f"USER CONTEXT (private, for your analysis only)\n"
+        f"Today: {today.strftime('%A %Y-%m-%d')}\n"
+    )
+    # Section headers are at most this long once the counts are filled in
+    remaining = budget - estimate_tokens(header) - 2 * estimate_tokens("ACTIVE TASKS (9999 of 9999, most urgent first):\n")
+    
+    shown_tasks, used = take_within_budget(task_lines, int(remaining * 0.6))
+    shown_events, event_used = take_within_budget(event_lines, remaining - used)
+    more_tasks, _ = take_within_budget(task_lines[len(shown_tasks):], remaining - used - event_used)
+    shown_tasks += more_tasks
+    
+    parts = [header]
+    if active_tasks:
+        parts.append(f"ACTIVE TASKS ({len(shown_tasks)} of {len(active_tasks)}, most urgent first):\n")
+        parts.extend(shown_tasks)
+    else:
+        parts.append("ACTIVE TASKS: none\n")
+    parts.append(f"COMPLETED TASKS: {len(completed_tasks)}\n")
+    if events:
+        parts.append(f"UPCOMING EVENTS ({len(shown_events)} of {len(events)}, next {CONTEXT_EVENT_DAYS} days):\n")
+        parts.extend(shown_events)
+    else:
+        parts.append("UPCOMING EVENTS: none\n")
+    context = ''.join(parts)
+    tokens = estimate_tokens(context)
+    metrics.observe('donna_context_tokens', tokens)
+    
+    return context, {
+        'tasks': tasks,
+        'active_tasks': active_tasks,
+        'completed_tasks': completed_tasks,
+        'events': events,
+        'tokens': tokens,
+        'token_budget': budget
+    }
 
-# ==================== DONNA AI FUNCTIONS ====================
+EMPTY_CONTEXT = ("", {'tasks': [], 'active_tasks': [], 'completed_tasks': [], 'events': [], 'tokens': 0, 'token_budget': CONTEXT_TOKEN_BUDGET})
 
 def get_user_context(user_id):
     """Get complete user context: tasks, events, recent activity"""
+    with stage_timer('user_context'):
+        return load_user_context(user_id)
+
+def load_user_context(user_id):
+    """Cached context, or tasks and events loaded concurrently on a miss"""
+    cached = context_cache.get(user_id)
+    if cached is not None:
+        return cached
+    cache_version = context_cache.version(user_id)
+    
     try:
-        # Get tasks
-        tasks_result = supabase.table('tasks').select('*').eq('user_id', user_id).execute()
-        tasks = tasks_result.data or []
-        
-        # Get upcoming events (next 30 days)
+        # Tasks and upcoming events are loaded concurrently
         today = datetime.now().date()
-        future_date = today + timedelta(days=30)
-        
-        events_result = supabase.table('calendar_events')\
-            .select('*')\
-            .eq('user_id', user_id)\
-            .gte('date', str(today))\
-            .lte('date', str(future_date))\
-            .order('date')\
-            .execute()
-        events = events_result.data or []
-        
-        # Format context for DONNA
-        active_tasks = [t for t in tasks if not t.get('completed')]
-        completed_tasks = [t for t in tasks if t.get('completed')]
-        
-        context = f"""
-CURRENT USER CONTEXT (Private - for your analysis only):
-==========================================================
-📅 TODAY'S DATE: {today.strftime('%A, %B %d, %Y')}
-
-✅ ACTIVE TASKS ({len(active_tasks)} tasks):
-"""
-        
-        if active_tasks:
-            for task in active_tasks[:10]:
-                due = f" (Due: {task.get('due_date')})" if task.get('due_date') else ""
-                priority = f" [{task.get('priority', 'medium').upper()}]" if task.get('priority') else ""
-                context += f"- {task['title']}{priority}{due}\n"
-                if task.get('description'):
-                    context += f" └─ {task['description'][:100]}\n"
-        else:
-            context += " (No active tasks - user has a clear schedule!)\n"
-        
-        context += f"\n✓ COMPLETED TASKS: {len(completed_tasks)} tasks done\n"
-        context += f"\n📆 UPCOMING EVENTS ({len(events)} events):\n"
-        
-        if events:
-            for event in events[:10]:
-                event_date = event.get('date', '')
-                event_time = event.get('time', '')
-                time_str = f" at {event_time}" if event_time else ""
-                context += f"- {event['title']} on {event_date}{time_str}\n"
-                if event.get('description'):
-                    context += f" └─ {event['description'][:100]}\n"
-        else:
-            context += " (No upcoming events scheduled)\n"
+        tasks_future = io_executor.submit(fetch_tasks, user_id)
+        events_future = io_executor.submit(fetch_upcoming_events, user_id, today)
         
-        context += "\n=========================================================="
+        tasks = tasks_future.result(timeout=SUPABASE_CALL_TIMEOUT)
+        events = events_future.result(timeout=SUPABASE_CALL_TIMEOUT)
         
-        return context, {
-            'tasks': tasks,
-            'active_tasks': active_tasks,
-            'completed_tasks': completed_tasks,
-            'events': events
-        }
+        result = format_user_context(tasks, events, today)
+        context_cache.set(user_id, result, version=cache_version)
+        return result
     
+    except FutureTimeoutError:
+        data_log.warning("⚠️ User context timed out after %ss", SUPABASE_CALL_TIMEOUT)
+        return EMPTY_CONTEXT
     except Exception as e:
-        print(f"❌ Error getting user context: {e}")
-        return "", {'tasks': [], 'active_tasks': [], 'completed_tasks': [], 'events': []}
+        data_log.error("❌ Error getting user context: %s", e)
+        return EMPTY_CONTEXT
 
 
 DONNA_SYSTEM_PROMPT = """You are DONNA, an intelligent and personable AI mission control assistant.
@@ -178,149 +1885,1046 @@ PERSONALITY:
 
 Remember: JSON first (on separate lines), then friendly response. User will NOT see the JSON. NEVER create tasks about your own responses or conversational phrases."""
 
-def get_conversation_memory(user_id, limit=5):
-    """Get recent conversation for context"""
-    try:
+def get_conversation_memory(user_id, limit=None):
+    """The last few completed turns, newest first"""
+    with stage_timer('conversation_memory'):
         result = supabase.table('messages')\
-            .select('user_message, donna_response')\
+            .select(HISTORY_COLUMNS)\
             .eq('user_id', user_id)\
             .eq('status', 'completed')\
             .order('created_at', desc=True)\
-            .limit(limit)\
+            .order('id', desc=True)\
+            .limit(limit or MEMORY_RAW_TURNS)\
             .execute()
-        
-        memory = []
-        for msg in reversed(result.data or []):
-            if msg.get('user_message'):
-                memory.append({"role": "user", "content": msg['user_message']})
-            if msg.get('donna_response'):
-                memory.append({"role": "assistant", "content": msg['donna_response']})
-        
-        return memory
-    except:
-        return []
+    return result.data or []
+
+def get_conversation_summary(user_id):
+    """The user's rolling conversation summary row, or None"""
+    if not summaries_enabled:
+        return None
+    try:
+        with stage_timer('conversation_summary'):
+            result = supabase.table('conversation_summaries')\
+                .select(SUMMARY_COLUMNS)\
+                .eq('user_id', user_id)\
+                .limit(1)\
+                .execute()
+    except Exception as e:
+        if not is_missing_schema_error(e):
+            raise
+        disable_summaries(e)
+        return None
+    return result.data[0] if result.data else None
+
+def clip_to_tokens(text, tokens):
+    """text cut at a word boundary to about ``tokens`` tokens"""
+    if estimate_tokens(text) <= tokens:
+        return text
+    clipped = text[:max(0, tokens * 4 - 1)].rsplit(' ', 1)[0]
+    return clipped + '…' if clipped else ''
+
+def memory_messages(summary, rows, token_budget=None):
+    """Prompt memory: the rolling summary, then the newest raw turns that fit.
+
+    ``rows`` are newest first. Turns the summary already covers are left
+    out. The summary is capped at SUMMARY_MAX_TOKENS and the whole block at
+    MEMORY_TOKEN_BUDGET; the turn that crosses the budget is clipped and
+    older ones dropped.
+    """
+    budget = MEMORY_TOKEN_BUDGET if token_budget is None else token_budget
+    memory = []
+    covered = parse_sync_cursor(summary.get('summarized_until')) if summary else None
+    if summary and summary.get('summary'):
+        content = "Earlier in this conversation:\n" + clip_to_tokens(summary['summary'], min(SUMMARY_MAX_TOKENS, budget))
+        memory.append({"role": "system", "content": content})
+        budget -= estimate_tokens(content)
+    
+    turns = []
+    for msg in rows:
+        created_at = parse_sync_cursor(msg.get('created_at'))
+        if covered and created_at and created_at <= covered:
+            break
+        # A turn keeps its question; the reply gets what is left
+        question = clip_to_tokens(msg.get('user_message') or '', budget)
+        if not question:
+            break
+        budget -= estimate_tokens(question)
+        reply = clip_to_tokens(msg.get('donna_response') or '', budget)
+        budget -= estimate_tokens(reply)
+        if reply:
+            turns.append({"role": "assistant", "content": reply})
+        turns.append({"role": "user", "content": question})
+    return memory + turns[::-1]
+
+TITLE_MARKUP_RE = re.compile(r'\{[^}]*\}|\[[^\]]*\]|["\'*]+')
+TITLE_TRAILING_BANG_RE = re.compile(r'!+$')
+WHITESPACE_RE = re.compile(r'\s+')
 
 def clean_title(title):
     """Remove all special formatting from titles"""
-    title = re.sub(r'["\']', '', title)
-    title = re.sub(r'\*+', '', title)
-    title = re.sub(r'\{[^}]*\}', '', title)
-    title = re.sub(r'\[[^\]]*\]', '', title)
-    title = re.sub(r'!+$', '', title)
-    title = re.sub(r'\s+', ' ', title).strip()
-    return title
+    title = TITLE_MARKUP_RE.sub('', title)
+    title = TITLE_TRAILING_BANG_RE.sub('', title)
+    return WHITESPACE_RE.sub(' ', title).strip()
 
 def parse_donna_actions(text):
     """Extract and clean JSON actions from DONNA's response"""
-    actions = []
-    print(f"\n{'='*80}")
-    print(f"🔍 PARSING AI RESPONSE")
-    print(f"{'='*80}")
-    
-    # Line-by-line JSON parsing
-    lines = text.split('\n')
-    for i, line in enumerate(lines):
-        line = line.strip()
-        if line.startswith('{') and '"action"' in line:
-            try:
-                obj = json.loads(line)
-                if "action" in obj:
-                    if 'title' in obj:
-                        obj['title'] = clean_title(obj['title'])
-                    actions.append(obj)
-                    print(f" ✅ Line {i}: {obj.get('action')} - {obj.get('title', 'N/A')}")
-            except json.JSONDecodeError:
-                continue
-    
-    if len(actions) == 0:
-        print("📋 Using regex fallback")
-        pattern = r'\{[^{}]*"action"[^{}]*\}'
-        matches = re.findall(pattern, text)
-        for match in matches:
-            try:
-                obj = json.loads(match)
-                if "action" in obj:
-                    if 'title' in obj:
-                        obj['title'] = clean_title(obj['title'])
-                    actions.append(obj)
-            except:
-                continue
+    return scan_donna_response(text)[0]
+
+def task_row_from_action(action, user_id):
+    """Row for the tasks table from a create_task action"""
+    return {
+        "user_id": user_id,
+        "title": action.get("title") or "Untitled Task",
+        "description": action.get("description", ""),
+        "priority": action.get("priority", "medium"),
+        "due_date": action.get("due_date"),
+        "completed": False,
+        "created_at": datetime.utcnow().isoformat()
+    }
+
+def event_row_from_action(action, user_id):
+    """Row for the calendar_events table from a create_event action"""
+    date = action.get("date", datetime.now().strftime("%Y-%m-%d"))
+    time = action.get("time", "00:00")
     
-    print(f"📊 FINAL: {len(actions)} actions parsed")
-    print(f"{'='*80}\n")
-    return actions
+    return {
+        "user_id": user_id,
+        "title": action.get("title") or "Untitled Event",
+        "description": action.get("description", ""),
+        "date": date,
+        "time": time,
+        "start_time": f"{date}T{time}:00",
+        "end_time": f"{date}T{time}:00",
+        "created_at": datetime.utcnow().isoformat()
+    }
 
-def execute_donna_action(action, user_id):
-    """Execute actions with detailed logging"""
-    try:
-        action_type = action.get("action")
-        print(f"\n🎯 EXECUTING: {action_type}")
-        
-        if action_type == "create_task":
-            task_data = {
-                "user_id": user_id,
-                "title": clean_title(action.get("title", "Untitled Task")),
-                "description": action.get("description", ""),
-                "priority": action.get("priority", "medium"),
-                "due_date": action.get("due_date"),
-                "completed": False,
-                "created_at": datetime.utcnow().isoformat()
-            }
-            
-            result = supabase.table("tasks").insert(task_data).execute()
+# action type -> (table, operation, row builder or id field)
+ACTION_HANDLERS = {
+    "create_task": ("tasks", "insert", task_row_from_action),
+    "create_event": ("calendar_events", "insert", event_row_from_action),
+    "complete_task": ("tasks", "complete", "task_id"),
+    "delete_task": ("tasks", "delete", "task_id"),
+    "delete_event": ("calendar_events", "delete", "event_id"),
+}
+
+def insert_action_rows(table, indexes, rows, results):
+    """Bulk insert; on failure retry row by row so one bad row can't sink the rest"""
+    try:
+        result = supabase.table(table).insert(rows).execute()
+        created = result.data or []
+        # PostgREST returns inserted rows in request order
+        for index, row in zip(indexes, created):
+            results[index].update(success=True, id=row.get("id"), title=row.get("title"))
+        for index in indexes[len(created):]:
+            results[index]["error"] = "Insert returned no row"
+        return
+    except Exception as e:
+        if len(rows) == 1:
+            results[indexes[0]]["error"] = str(e)
+            return
+        actions_log.warning("⚠️ Bulk insert into %s failed, retrying row by row: %s", table, e)
+    
+    for index, row in zip(indexes, rows):
+        try:
+            result = supabase.table(table).insert(row).execute()
             if result.data:
-                print(f"✅ Task created: {result.data[0].get('title')}")
+                results[index].update(success=True, id=result.data[0].get("id"), title=result.data[0].get("title"))
             else:
-                print(f"❌ Task creation failed")
-        
-        elif action_type == "create_event":
-            date = action.get("date", datetime.now().strftime("%Y-%m-%d"))
-            time = action.get("time", "00:00")
-            
-            event_data = {
-                "user_id": user_id,
-                "title": clean_title(action.get("title", "Untitled Event")),
-                "description": action.get("description", ""),
-                "date": date,
-                "time": time,
-                "start_time": f"{date}T{time}:00",
-                "end_time": f"{date}T{time}:00",
-                "created_at": datetime.utcnow().isoformat()
-            }
-            
-            result = supabase.table("calendar_events").insert(event_data).execute()
-            if result.data:
-                print(f"✅ Event created: {result.data[0].get('title')}")
+                results[index]["error"] = "Insert returned no row"
+        except Exception as e:
+            results[index]["error"] = str(e)
+
+def modify_action_rows(table, operation, indexes, ids, user_id, results):
+    """One in_-filtered update or delete for every targeted row"""
+    if operation == "complete":
+        query = supabase.table(table).update({"completed": True})
+    else:
+        query = supabase.table(table).delete()
+    
+    try:
+        result = query.in_("id", ids).eq("user_id", user_id).execute()
+    except Exception as e:
+        for index in indexes:
+            results[index]["error"] = str(e)
+        return
+    
+    affected = {str(row.get("id")) for row in result.data or []}
+    for index, row_id in zip(indexes, ids):
+        if str(row_id) in affected:
+            results[index].update(success=True, id=row_id)
+        else:
+            results[index]["error"] = "Not found"
+
+def execute_donna_actions(actions, user_id):
+    """Execute actions with one round trip per table and operation.
+
+    Returns one result per action, in order:
+    {'action', 'success', and 'id'/'title' or 'error'}.
+    """
+    results = [{"action": action.get("action"), "success": False} for action in actions]
+    groups = OrderedDict()
+    
+    for index, action in enumerate(actions):
+        handler = ACTION_HANDLERS.get(action.get("action"))
+        if handler is None:
+            results[index]["error"] = "Unknown action"
+            continue
+        table, operation, _ = handler
+        groups.setdefault((table, operation), []).append(index)
+    
+    try:
+        for (table, operation), indexes in groups.items():
+            actions_log.debug("🎯 Executing %s x%d on %s", operation, len(indexes), table)
+            if operation == "insert":
+                rows = [ACTION_HANDLERS[actions[i]["action"]][2](actions[i], user_id) for i in indexes]
+                insert_action_rows(table, indexes, rows, results)
             else:
-                print(f"❌ Event creation failed")
-        
-        elif action_type == "complete_task":
-            task_id = action.get("task_id")
-            supabase.table("tasks").update({
-                "completed": True
-            }).eq("id", task_id).eq("user_id", user_id).execute()
-            print(f"✅ Task completed: {task_id}")
-        
-        elif action_type == "delete_task":
-            supabase.table("tasks").delete()\
-                .eq("id", action.get("task_id"))\
-                .eq("user_id", user_id).execute()
-            print(f"✅ Task deleted")
-        
-        elif action_type == "delete_event":
-            supabase.table("calendar_events").delete()\
-                .eq("id", action.get("event_id"))\
-                .eq("user_id", user_id).execute()
-            print(f"✅ Event deleted")
+                valid = []
+                for index in indexes:
+                    row_id = actions[index].get(ACTION_HANDLERS[actions[index]["action"]][2])
+                    if row_id is None:
+                        results[index]["error"] = "Missing id"
+                    else:
+                        valid.append((index, row_id))
+                if valid:
+                    modify_action_rows(table, operation, [i for i, _ in valid], [r for _, r in valid], user_id, results)
     
     except Exception as e:
-        print(f"❌ Action execution error: {e}")
-        import traceback
-        traceback.print_exc()
+        actions_log.exception("❌ Action execution error: %s", e)
+    
+    finally:
+        if groups:
+            notify_change(user_id, *sorted({TABLE_TOPICS[table] for table, _ in groups}))
+    
+    for result in results:
+        if result["success"]:
+            actions_log.info("✅ %s: %s", result['action'], result.get('title') or result.get('id'))
+        else:
+            actions_log.warning("❌ %s failed: %s", result['action'], result.get('error'))
+    return results
+
+def execute_donna_action(action, user_id):
+    """Execute a single action; see execute_donna_actions"""
+    return execute_donna_actions([action], user_id)[0]
+
+def clean_donna_response(text):
+    """Strip action JSON and code fences from DONNA's response"""
+    return scan_donna_response(text)[1]
+
+def store_chat_message(request_id, user_id, user_message):
+    """Insert the 'processing' row for a new chat request"""
+    with stage_timer('message_insert'):
+        supabase.table('messages').insert(new_message_row(request_id, user_id, user_message)).execute()
+
+def new_message_row(request_id, user_id, user_message):
+    return {
+        'request_id': request_id,
+        'user_id': user_id,
+        'user_message': user_message,
+        'donna_response': None,
+        'status': 'processing'
+    }
+
+def prepare_chat(request_id, user_id, user_message):
+    """Store the message and load context and memory concurrently.
+
+    The memory and summary selects run on io_executor while this thread
+    stores the message and then loads the context. The insert stays on the
+    request thread so a busy pool can't time it out while it still lands
+    later. Context and memory fall back to empty on error or timeout; a
+    failed insert still fails the request.
+    
+    Returns (messages, cache_key, reply). When the message needs no LLM
+    call, reply is {'source', 'response', 'actions'} and there are no
+    messages to send: 'local' for a create command or a task/calendar
+    question handled by the local intents, 'cache' for a read-only
+    question already answered against the same context.
+    """
+    local = local_command(user_message) if LOCAL_INTENTS_ENABLED else None
+    if local is not None:
+        store_chat_message(request_id, user_id, user_message)
+        return None, None, local
+    
+    memory_future = io_executor.submit(get_conversation_memory, user_id)
+    summary_future = io_executor.submit(get_conversation_summary, user_id)
+    try:
+        store_chat_message(request_id, user_id, user_message)
+    except Exception:
+        memory_future.cancel()
+        summary_future.cancel()
+        raise
+    
+    user_context, context_data = get_user_context(user_id)
+    chat_log.debug("🧠 Context: %d of %d tokens", context_data['tokens'], context_data['token_budget'])
+    local = local_query(user_message, context_data) if user_context and LOCAL_INTENTS_ENABLED else None
+    if local is not None:
+        return None, None, local
+    cache_key = response_cache_key(user_id, user_message, user_context) if user_context else None
+    cached_response = response_cache.get(cache_key) if cache_key else None
+    if cached_response is not None:
+        return None, cache_key, {'source': 'cache', 'response': cached_response, 'actions': []}
+    
+    conversation_memory = memory_messages(
+        result_or_default(summary_future, None, 'Conversation summary'),
+        result_or_default(memory_future, [], 'Conversation memory')
+    )
+    
+    return build_chat_messages(user_context, conversation_memory, user_message), cache_key, None
+
+def build_chat_messages(user_context, conversation_memory, user_message):
+    """Assemble the LLM prompt: system prompt, user context, memory, message.
+
+    Ordered from most to least stable so provider-side prefix caching can
+    reuse the longest prefix: the system prompt never changes, the context
+    only when the user's data (or the day) does, memory every turn.
+    """
+    return [
+        {"role": "system", "content": DONNA_SYSTEM_PROMPT},
+        {"role": "system", "content": user_context},
+        *conversation_memory,
+        {"role": "user", "content": user_message}
+    ]
+
+def openrouter_payload(messages, stream=False):
+    """Request body for the OpenRouter chat completions API"""
+    payload = {
+        "model": "deepseek/deepseek-chat",
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": 2000,
+        # Token counts on the response (the last chunk when streaming)
+        "usage": {"include": True},
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+# ==================== LOCAL INTENTS ====================
+
+# Requests answered or carried out without the LLM: read-only questions about
+# tasks and the calendar, answered from the same context the prompt would
+# carry, and single create commands with an unambiguous date and time. A
+# message the rules don't account for word by word goes to the LLM as before.
+LOCAL_INTENTS_ENABLED = os.getenv('LOCAL_INTENTS', '1') != '0'
+LOCAL_LIST_LIMIT = 10
+LOCAL_ACTION_FAILED = "Sorry, I couldn't save that just now. Please try again."
+
+WEEKDAY_NAMES = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+MONTH_NUMBERS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
+}
+COUNT_WORDS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7}
+MONTH_PATTERN = (r"(?:january|february|march|april|may|june|july|august|september|october|november|december"
+                 r"|jan|feb|mar|apr|jun|jul|aug|sept|sep|oct|nov|dec)")
+
+WHEN_DATE_RE = re.compile(rf"""
+    \b(?:(?:on|by|for|due)\s+)?
+    (?:
+        (?P<relative>(?:the\s+)?day\s+after\s+tomorrow|today|tonight|tomorrow|tmrw)
+      | (?P<qualifier>this\s+coming\s+|this\s+|coming\s+|next\s+)?(?P<weekday>{'|'.join(WEEKDAY_NAMES)})
+      | in\s+(?P<count>\d{{1,2}}|{'|'.join(COUNT_WORDS)})\s+(?P<unit>days?|weeks?)
+      | (?P<iso>\d{{4}}-\d{{2}}-\d{{2}})
+      | (?:the\s+)?(?P<day_first>\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<month_last>{MONTH_PATTERN})\.?(?:,?\s+(?P<year_last>\d{{4}}))?
+      | (?P<month_first>{MONTH_PATTERN})\.?\s+(?P<day_last>\d{{1,2}})(?:st|nd|rd|th)?(?:,?\s+(?P<year_first>\d{{4}}))?
+    )\b(?!['’]\w)""", re.I | re.X)
+WHEN_TIME_RE = re.compile(r"""
+    (?<![\w:])(?:at\s+|@\s*)?
+    (?:
+        (?P<hour>\d{1,2})(?::(?P<minute>[0-5]\d))?\s*(?P<meridiem>a\.?m\.?|p\.?m\.?)
+      | (?P<hour24>[01]?\d|2[0-3]):(?P<minute24>[0-5]\d)
+      | (?P<named>noon|midday|midnight)
+    )(?![\w:])""", re.I | re.X)
+# Left in a title after the date and time are taken out, these mean the
+# message said more about timing than the parser understood ("on the 1st",
+# "in march", "in an hour", "half past three", "on christmas", "by end of day")
+VAGUE_WHEN_RE = re.compile(
+    rf"\b(?:at|@|by|on|around|about)\s+(?:the\s+)?\d|\d\s*o'?clock|\b\d{{1,2}}(?:st|nd|rd|th)\b|\b{MONTH_PATTERN}\b"
+    r"|\bin\s+(?:a|an)\s+(?:bit|while)\b|\bend\s+of\b|\b(?:on|for)\s+(?:my|his|her|their|our|your)\s+\w+day\b"
+    r"|\b(?:morning|afternoon|evening|tonight|noon|weekend|week|month"
+    r"|year|later|soon|sometime|every|each|daily|weekly|monthly|yearly|until|till|between|before|after|from"
+    r"|today|tomorrow|seconds?|secs?|minutes?|mins?|hours?|hrs?|half|quarter|past"
+    r"|spring|summer|autumn|fall|winter|christmas|xmas|easter|thanksgiving|halloween|hanukkah|diwali|new\s+year'?s?"
+    r"|holidays?|birthday|anniversary|eod|eow|cob)\b", re.I
+)
+DANGLING_WORD_RE = re.compile(r"\b(?:on|at|by|for|in|to|the|a|an|and|with|due)$", re.I)
+COMMAND_FILLER_RE = re.compile(
+    r"^(?:(?:hey|hi|ok|okay|so|donna|please|pls|can you|could you|would you|will you|go ahead and)\b[\s,]*)+", re.I
+)
+COMMAND_TRAILER_RE = re.compile(r"[\s,]*(?:please|thanks|thank you)?[\s.!]*$", re.I)
+# Conditions, negations and follow-ups need the LLM's judgement
+COMMAND_GUARD_RE = re.compile(
+    r"\?|;|\b(?:don'?t|do not|never|not|if|unless|whenever|instead|also|then|cancel|delete|remove|move|reschedule"
+    r"|change|update|rename)\b|\b(?:and|plus)\s+(?:remind|add|schedule|book|create|put|buy|get|pick|call|text"
+    r"|email|message|phone|pay|send|order|return|renew|finish|submit|review|prepare|write|read|print|file|sign"
+    r"|clean|wash|fix|check|take|bring|make|cook|do|go|visit|meet|feed|walk|water|study|practice|grab)\b", re.I
+)
+# "call mom at 2pm tomorrow and buy milk" is two commands, not one title
+WHEN_JOIN_RE = re.compile(r"[\s,]*(?:and\b|plus\b|&)", re.I)
+PRIORITY_WORDS_RE = re.compile(
+    r"[\s,(-]*\b(?:(?P<level>high|medium|low)\s+priority|priority\s*:?\s*(?P<level2>high|medium|low)"
+    r"|(?P<urgent>urgent|asap|important))\b\)?", re.I
+)
+
+TASK_COMMAND_RES = (
+    re.compile(r"^remind me to\s+(?P<title>.+)$", re.I),
+    re.compile(r"^(?:add|create|make|new)\s+(?:a\s+|an\s+|another\s+)?(?:new\s+)?(?:task|to-?do|reminder)\b"
+               r"\s*(?:to\s+|for\s+|called\s+|:\s*|-\s*)?(?P<title>.+)$", re.I),
+    re.compile(r"^(?:add|put)\s+(?P<title>.+?)\s+(?:to|on)\s+(?:my\s+)?(?:task\s+list|tasks|to-?do\s+list|to-?dos|list)$", re.I),
+    re.compile(r"^(?:task|to-?do)\s*:\s*(?P<title>.+)$", re.I),
+)
+EVENT_COMMAND_RES = (
+    re.compile(r"^(?:add|put)\s+(?P<title>.+?)\s+(?:to|on|in)\s+(?:my\s+)?calendar$", re.I),
+    re.compile(r"^(?:schedule|book|set\s+up)\s+(?:a\s+|an\s+|my\s+)?(?P<title>.+)$", re.I),
+    re.compile(r"^(?:add|create)\s+(?:a\s+|an\s+|my\s+)?(?:new\s+)?(?P<title>(?:meeting|call|appointment|event"
+               r"|lunch|dinner|breakfast|coffee|interview|session|catch-?up|class|party)\b.*)$", re.I),
+)
+EVENT_PREFIX_RE = re.compile(r"^event\s*(?:called\s+|for\s+|:\s*)?", re.I)
+
+def resolve_when_date(match, today):
+    """The date a WHEN_DATE_RE match names, or None if it is ambiguous or invalid"""
+    groups = match.groupdict()
+    if groups['relative']:
+        word = groups['relative'].lower()
+        return today + timedelta(days=2 if 'after' in word else 1 if word.startswith(('tomorrow', 'tmrw')) else 0)
+    if groups['weekday']:
+        qualifier = ' '.join((groups['qualifier'] or '').lower().split())
+        days_ahead = (WEEKDAY_NAMES.index(groups['weekday'].lower()) - today.weekday()) % 7
+        # "next friday" and a bare "friday" said on a Friday mean different
+        # days to different people
+        if qualifier == 'next' or (not qualifier and days_ahead == 0):
+            return None
+        return today + timedelta(days=days_ahead)
+    if groups['count']:
+        count = COUNT_WORDS.get(groups['count'].lower()) or int(groups['count'])
+        return today + timedelta(days=count * (7 if groups['unit'].lower().startswith('week') else 1))
+    try:
+        if groups['iso']:
+            return datetime.strptime(groups['iso'], '%Y-%m-%d').date()
+        month = MONTH_NUMBERS[(groups['month_last'] or groups['month_first']).lower()[:3]]
+        day = int(groups['day_first'] or groups['day_last'])
+        year = groups['year_last'] or groups['year_first']
+        if year:
+            return datetime(int(year), month, day).date()
+        resolved = datetime(today.year, month, day).date()
+        return resolved if resolved >= today else datetime(today.year + 1, month, day).date()
+    except ValueError:
+        return None
+
+def resolve_when_time(match):
+    """'HH:MM' for a WHEN_TIME_RE match, or None if it isn't a valid time"""
+    groups = match.groupdict()
+    if groups['named']:
+        return '00:00' if groups['named'].lower() == 'midnight' else '12:00'
+    if groups['hour24']:
+        # "5:30" could be morning or evening; "05:30" and "17:30" can't
+        if 1 <= int(groups['hour24']) <= 12 and not groups['hour24'].startswith('0'):
+            return None
+        return f"{int(groups['hour24']):02d}:{groups['minute24']}"
+    hour = int(groups['hour'])
+    if not 1 <= hour <= 12:
+        return None
+    hour = hour % 12 + (12 if groups['meridiem'].lower().startswith('p') else 0)
+    return f"{hour:02d}:{groups['minute'] or '00'}"
+
+def extract_when(text, today):
+    """Take one date and one time out of text: (rest, date, 'HH:MM').
+
+    Either may be None when absent. Returns None when the text names more
+    than one of either, or one that can't be pinned down.
+    """
+    dates = list(WHEN_DATE_RE.finditer(text))
+    times = list(WHEN_TIME_RE.finditer(text))
+    if len(dates) > 1 or len(times) > 1:
+        return None
+    day = resolve_when_date(dates[0], today) if dates else None
+    clock = resolve_when_time(times[0]) if times else None
+    if (dates and day is None) or (times and clock is None):
+        return None
+    for match in sorted(dates + times, key=lambda m: m.start(), reverse=True):
+        text = text[:match.start()] + ' ' + text[match.end():]
+    return ' '.join(text.split()), day, clock
+
+def describe_day(day, today):
+    """'today', 'tomorrow', 'Friday' within the week, else 'Friday, Oct 24'"""
+    delta = (day - today).days
+    if delta == 0:
+        return 'today'
+    if delta == 1:
+        return 'tomorrow'
+    if 1 < delta < 7:
+        return day.strftime('%A')
+    label = f"{day.strftime('%A, %b')} {day.day}"
+    return label if day.year == today.year else f"{label}, {day.year}"
+
+def describe_clock(clock):
+    """'14:30' -> '2:30 PM'"""
+    try:
+        hour, minute = (int(part) for part in str(clock)[:5].split(':'))
+    except ValueError:
+        return str(clock)
+    return f"{hour % 12 or 12}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+def command_title(title):
+    """A clean title for a local create command, or None if it isn't one"""
+    title = clean_title(COMMAND_TRAILER_RE.sub('', title))
+    if not title or len(title) > 80 or len(title.split()) > 12:
+        return None
+    if VAGUE_WHEN_RE.search(title) or DANGLING_WORD_RE.search(title):
+        return None
+    return title[0].upper() + title[1:]
+
+def local_command(message, today=None, now=None):
+    """A create_task/create_event reply for an unambiguous command, or None"""
+    now = now or datetime.now()
+    today = today or now.date()
+    text = COMMAND_FILLER_RE.sub('', ' '.join(message.replace('’', "'").split()))
+    text = COMMAND_TRAILER_RE.sub('', text)
+    if not text or len(text) > 200 or COMMAND_GUARD_RE.search(text):
+        return None
+    if any(WHEN_JOIN_RE.match(text, m.end()) for m in chain(WHEN_DATE_RE.finditer(text), WHEN_TIME_RE.finditer(text))):
+        return None
+    when = extract_when(text, today)
+    if when is None:
+        return None
+    text, day, clock = when
+    
+    priority = 'medium'
+    marker = PRIORITY_WORDS_RE.search(text)
+    if marker:
+        priority = (marker.group('level') or marker.group('level2') or 'high').lower()
+        text = ' '.join((text[:marker.start()] + ' ' + text[marker.end():]).split())
+    
+    for pattern in TASK_COMMAND_RES:
+        match = pattern.match(text)
+        if match:
+            title = command_title(match.group('title'))
+            if title is None:
+                return None
+            if clock and not day:
+                # A time on its own means its next occurrence, not one already past
+                passed = today == now.date() and clock <= now.strftime('%H:%M')
+                day = today + timedelta(days=1) if passed else today
+            response = f"Got it - I added \"{title}\" to your tasks"
+            if day:
+                response += f", due {describe_day(day, today)}"
+            if clock:
+                response += f" at {describe_clock(clock)}"
+            return local_reply('create_task', response + '.', [{
+                "action": "create_task",
+                "title": title,
+                "description": f"At {describe_clock(clock)}" if clock else "",
+                "priority": priority,
+                "due_date": day.isoformat() if day else None
+            }])
+    
+    for pattern in EVENT_COMMAND_RES:
+        match = pattern.match(text)
+        if match:
+            title = command_title(EVENT_PREFIX_RE.sub('', match.group('title')))
+            # An event needs both; "lunch with Sam on Friday" is left to the LLM
+            if title is None or not day or not clock or marker:
+                return None
+            return local_reply('create_event', (
+                f"Done - \"{title}\" is on your calendar for {describe_day(day, today)} at {describe_clock(clock)}."
+            ), [{
+                "action": "create_event",
+                "title": title,
+                "date": day.isoformat(),
+                "time": clock,
+                "description": ""
+            }])
+    return None
+
+# Words a read-only question may contain besides its topic and date range
+QUERY_WORDS = frozenset("""
+    what whats is are on my the for do i have any anything show me list tell about all of in there theres got
+    ive coming up upcoming how many much does look looks like left open pending remaining still need to a an
+    please can you get give see check so far planned happening going everything next at be
+""".split())
+TASK_TOPIC_WORDS = frozenset('task tasks todo todos todolist deadline deadlines due overdue late chores errands'.split())
+EVENT_TOPIC_WORDS = frozenset('schedule calendar event events meeting meetings appointment appointments'.split())
+AGENDA_WORDS = frozenset('agenda plan plans day week'.split())
+QUERY_RANGE_RE = re.compile(r"\b(?:for |on |due )?(this week|next week|this weekend|the weekend|weekend|my day|my week)\b")
+
+def query_range(text, today):
+    """(rest, first day, last day, label) for a normalized question; days are None when it names none"""
+    ranges = list(QUERY_RANGE_RE.finditer(text))
+    when = extract_when(text, today)
+    if when is None or len(ranges) > 1 or (ranges and when[1]):
+        return None
+    rest, day, _ = when
+    if day:
+        return rest, day, day, describe_day(day, today)
+    if not ranges:
+        return rest, None, None, None
+    
+    phrase = ranges[0].group(1)
+    rest = ' '.join(QUERY_RANGE_RE.sub(' ', text).split())
+    if phrase == 'my day':
+        return rest + ' day', today, today, 'today'
+    monday = today - timedelta(days=today.weekday())
+    if phrase in ('this week', 'my week'):
+        return rest + (' week' if phrase == 'my week' else ''), today, monday + timedelta(days=6), 'this week'
+    if phrase == 'next week':
+        return rest, monday + timedelta(days=7), monday + timedelta(days=13), 'next week'
+    saturday = monday + timedelta(days=5)
+    return rest, max(today, saturday), saturday + timedelta(days=1), 'this weekend'
+
+def event_summary_line(event, today, with_day):
+    line = f"• {describe_day(parse_day(event.get('date')), today).capitalize()} " if with_day else "• "
+    if event.get('time') and str(event['time'])[:5] != '00:00':
+        line += f"{describe_clock(event['time'])} "
+    return line + str(event.get('title') or 'Untitled Event')
+
+def task_summary_line(task, today):
+    line = f"• {task.get('title') or 'Untitled Task'}"
+    due = parse_day(task.get('due_date'))
+    if due is not None:
+        line += f" - overdue since {describe_day(due, today)}" if due < today else f" - due {describe_day(due, today)}"
+    if str(task.get('priority') or '').lower() == 'high':
+        line += " (high priority)"
+    return line
+
+def bullet_list(lines):
+    shown = lines[:LOCAL_LIST_LIMIT]
+    if len(lines) > len(shown):
+        shown.append(f"…and {len(lines) - len(shown)} more")
+    return '\n'.join(shown)
+
+def local_query(message, context_data, today=None):
+    """A reply to a read-only task or calendar question, from context_data, or None"""
+    today = today or datetime.now().date()
+    question = normalize_question(message)
+    if question is None:
+        return None
+    question = re.sub(r"\bto do\b", "todo", question)
+    parsed = query_range(question, today)
+    if parsed is None:
+        return None
+    rest, first, last, label = parsed
+    # "due" can go with the date ("due tomorrow") but still asks about tasks
+    words = (set(rest.split()) | ({'due'} & set(question.split()))) - QUERY_WORDS
+    if words - TASK_TOPIC_WORDS - EVENT_TOPIC_WORDS - AGENDA_WORDS:
+        return None
+    
+    want_tasks = bool(words & TASK_TOPIC_WORDS) or bool(words & AGENDA_WORDS) or not words
+    want_events = bool(words & EVENT_TOPIC_WORDS) or bool(words & AGENDA_WORDS) or not words
+    if not words and first is None and 'anything' not in rest.split():
+        return None
+    if want_tasks and want_events and first is None:
+        first = last = today
+        label = 'today'
+    # Events past the context window, or already gone, aren't in context_data
+    if first is not None and (first < today or last > today + timedelta(days=CONTEXT_EVENT_DAYS)):
+        return None
+    
+    active = rank_tasks(context_data['active_tasks'], today)
+    events = rank_events(context_data['events'])
+    rest_words = rest.split()
+    
+    if 'overdue' in words or 'late' in words:
+        overdue = [t for t in active if (parse_day(t.get('due_date')) or today) < today]
+        if not overdue:
+            return local_reply('overdue_tasks', "Nothing is overdue - nice work!")
+        return local_reply('overdue_tasks', f"You have {len(overdue)} overdue task{'s' * (len(overdue) != 1)}:\n"
+                           + bullet_list([task_summary_line(t, today) for t in overdue]))
+    
+    if 'how' in rest_words and 'many' in rest_words:
+        parts = []
+        if want_tasks:
+            tasks = active if first is None else [t for t in active if first <= (parse_day(t.get('due_date')) or datetime.max.date()) <= last]
+            parts.append(f"{len(tasks)} open task{'s' * (len(tasks) != 1)}" + (f" due {label}" if first else ""))
+        if want_events:
+            shown = events if first is None else [e for e in events if first <= (parse_day(e.get('date')) or today) <= last]
+            parts.append(f"{len(shown)} event{'s' * (len(shown) != 1)} " + (label if first else f"in the next {CONTEXT_EVENT_DAYS} days"))
+        return local_reply('count', f"You have {' and '.join(parts)}.")
+    
+    if want_events and not want_tasks and first is None and 'next' in rest_words:
+        now = datetime.now().strftime('%H:%M')
+        upcoming = [e for e in events if (parse_day(e.get('date')), str(e.get('time') or '00:00')[:5]) >= (today, now)]
+        if not upcoming:
+            return local_reply('next_event', f"Nothing on your calendar in the next {CONTEXT_EVENT_DAYS} days.")
+        event = upcoming[0]
+        when = describe_day(parse_day(event.get('date')), today)
+        if event.get('time') and str(event['time'])[:5] != '00:00':
+            when += f" at {describe_clock(event['time'])}"
+        return local_reply('next_event', f"Next up: {event.get('title') or 'Untitled Event'}, {when}.")
+    
+    sections = []
+    if want_events:
+        if first is None:
+            shown = [e for e in events if (parse_day(e.get('date')) or today) >= today]
+            heading = "Coming up on your calendar:" if shown else f"Nothing on your calendar in the next {CONTEXT_EVENT_DAYS} days."
+        else:
+            shown = [e for e in events if first <= (parse_day(e.get('date')) or today) <= last]
+            heading = f"On your calendar {label}:" if shown else f"Nothing on your calendar {label}."
+        sections.append(heading + ('\n' + bullet_list([event_summary_line(e, today, first is None or first != last) for e in shown]) if shown else ''))
+    if want_tasks:
+        if first is None:
+            shown = active
+            heading = f"You have {len(shown)} open task{'s' * (len(shown) != 1)}:" if shown else "You have no open tasks."
+        else:
+            shown = [t for t in active if first <= (parse_day(t.get('due_date')) or datetime.max.date()) <= last]
+            heading = f"Due {label}:" if shown else f"No tasks due {label}."
+        sections.append(heading + ('\n' + bullet_list([task_summary_line(t, today) for t in shown]) if shown else ''))
+    
+    intent = 'agenda' if want_tasks and want_events else 'list_tasks' if want_tasks else 'list_events'
+    return local_reply(intent, '\n\n'.join(sections))
+
+def local_reply(intent, response, actions=()):
+    metrics.inc('donna_local_intents_total', intent=intent)
+    return {'source': 'local', 'intent': intent, 'response': response, 'actions': list(actions)}
+
+def carry_out_reply(reply, user_id):
+    """Run a cached or local reply's actions: (action results, response text)"""
+    if not reply['actions']:
+        return [], reply['response']
+    with stage_timer('actions'):
+        results = execute_donna_actions(reply['actions'], user_id)
+    if all(result['success'] for result in results):
+        return results, reply['response']
+    return results, LOCAL_ACTION_FAILED
+
+# ==================== CONVERSATION SUMMARY ====================
+
+# The prompt carries a rolling summary of the conversation plus the last
+# MEMORY_RAW_TURNS turns verbatim, within MEMORY_TOKEN_BUDGET tokens.
+# Needs migrations/004_conversation_summaries.sql; until then the prompt
+# carries the raw turns only.
+MEMORY_RAW_TURNS = int(os.getenv('MEMORY_RAW_TURNS', 2))
+MEMORY_TOKEN_BUDGET = int(os.getenv('MEMORY_TOKEN_BUDGET', 600))
+SUMMARY_MAX_TOKENS = int(os.getenv('SUMMARY_MAX_TOKENS', 200))
+# Turns folded in per refresh; a backlog beyond this (a first refresh for
+# a long history) keeps only its newest turns
+SUMMARY_MAX_FOLD = 10
+SUMMARY_TURN_TOKENS = 400
+SUMMARY_COLUMNS = 'summary, summarized_until, summarized_id'
+summaries_enabled = True
+
+def disable_summaries(error):
+    global summaries_enabled
+    summaries_enabled = False
+    chat_log.warning("⚠️ Conversation summaries disabled (run migrations/004_conversation_summaries.sql): %s", error)
+
+SUMMARY_PROMPT = """You keep a running summary of a conversation between a user and DONNA, their personal assistant.
+
+Update the summary with the new exchanges. Keep what DONNA will need later: facts about the user, their preferences, plans, commitments and open questions. Drop greetings and small talk. Don't list tasks or events that were created; DONNA sees those separately.
+
+Write plain prose, at most {words} words, no lists or JSON. Reply with the updated summary only."""
+
+def summary_payload(summary, turns):
+    """Request body that folds ``turns`` (oldest first) into ``summary``"""
+    exchanges = '\n'.join(
+        f"User: {clip_to_tokens(t.get('user_message') or '', SUMMARY_TURN_TOKENS)}\n"
+        f"DONNA: {clip_to_tokens(t.get('donna_response') or '', SUMMARY_TURN_TOKENS)}"
+        for t in turns
+    )
+    payload = openrouter_payload([
+        {"role": "system", "content": SUMMARY_PROMPT.format(words=SUMMARY_MAX_TOKENS * 3 // 4)},
+        {"role": "user", "content": f"Current summary:\n{summary or '(none yet)'}\n\nNew exchanges:\n{exchanges}"}
+    ])
+    payload.update(temperature=0.2, max_tokens=SUMMARY_MAX_TOKENS * 2)
+    return payload
+
+class ConversationSummarizer:
+    """Folds completed turns into each user's rolling summary, off the request path.
+
+    schedule() is called once a reply is stored. Refreshes for one user
+    never overlap in this process; a schedule() during a refresh runs it
+    once more afterwards. A turn is folded in once it is older than the
+    last MEMORY_RAW_TURNS, which the prompt still carries verbatim.
+    """
+    
+    def __init__(self, workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='donna-summary')
+        self._lock = threading.Lock()
+        self._active = {}  # user_id -> another refresh was requested meanwhile
+        self.refreshed = 0
+        self.folded = 0
+        self.failed = 0
+    
+    def schedule(self, user_id):
+        if not summaries_enabled:
+            return
+        with self._lock:
+            if user_id in self._active:
+                self._active[user_id] = True
+                return
+            self._active[user_id] = False
+        self._executor.submit(self._run, user_id)
+    
+    def _run(self, user_id):
+        while True:
+            try:
+                folded = self.refresh(user_id)
+                with self._lock:
+                    self.refreshed += 1 if folded else 0
+                    self.folded += folded
+            except Exception as e:
+                if is_missing_schema_error(e):
+                    disable_summaries(e)
+                else:
+                    with self._lock:
+                        self.failed += 1
+                    chat_log.warning("⚠️ Conversation summary for %s failed: %s", user_id, e)
+            with self._lock:
+                if not self._active.get(user_id):
+                    del self._active[user_id]
+                    return
+                self._active[user_id] = False
+    
+    def refresh(self, user_id):
+        """Fold the turns that left the raw window into the summary; returns how many"""
+        summary = get_conversation_summary(user_id)
+        if not summaries_enabled:
+            return 0
+        query = supabase.table('messages')\
+            .select(HISTORY_COLUMNS)\
+            .eq('user_id', user_id)\
+            .eq('status', 'completed')
+        if summary and summary.get('summarized_until') and summary.get('summarized_id'):
+            query = query.or_(keyset_filter((summary['summarized_until'], summary['summarized_id']), 'gt'))
+        rows = query.order('created_at', desc=True)\
+            .order('id', desc=True)\
+            .limit(MEMORY_RAW_TURNS + SUMMARY_MAX_FOLD)\
+            .execute().data or []
+        
+        turns = rows[MEMORY_RAW_TURNS:][::-1]
+        if not turns:
+            return 0
+        
+        with stage_timer('summary_llm'):
+            completion = llm_client.complete(summary_payload(summary and summary.get('summary'), turns))
+        text = (completion['choices'][0]['message']['content'] or '').strip()
+        if not text:
+            raise LLMError("Empty summary")
+        
+        with stage_timer('summary_update'):
+            supabase.table('conversation_summaries').upsert({
+                'user_id': user_id,
+                'summary': clip_to_tokens(text, SUMMARY_MAX_TOKENS),
+                'summarized_until': turns[-1]['created_at'],
+                'summarized_id': turns[-1]['id'],
+                'updated_at': datetime.utcnow().isoformat()
+            }, on_conflict='user_id').execute()
+        chat_log.debug("🧾 Folded %d turns into the summary for %s", len(turns), user_id)
+        return len(turns)
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': summaries_enabled,
+                'refreshing': len(self._active),
+                'refreshed': self.refreshed,
+                'turns_folded': self.folded,
+                'failed': self.failed
+            }
+
+conversation_summarizer = ConversationSummarizer(workers=int(os.getenv('SUMMARY_WORKERS', 2)))
+
+# ==================== STREAMING HELPERS ====================
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+ACTION_INLINE_RE = re.compile(r'\{[^{}]*"action"[^{}]*\}')
+
+class ActionScanner:
+    """Single-pass extractor of DONNA actions and the user-visible reply.
+
+    Feed it the response in chunks (or whole) and it returns, per chunk,
+    the visible text that is safe to show and the actions that completed.
+    Handles one-line action JSON, multi-line objects, fenced ``` blocks
+    and actions embedded in a sentence. Visible text streams as soon as a
+    line can't be an action; anything from a '{' onwards is held until the
+    end of its line. Blank lines collapse to one and the ends are trimmed,
+    so ``text`` is also the cleaned response to store.
+    """
+
+    def __init__(self):
+        self.actions = []
+        self.parts = []
+        self.line = ''
+        self.mode = 'start'      # start | visible | held | fence | block
+        self.fence_lines = []
+        self.block_lines = []
+        self.block_depth = 0
+        self.newlines = 0        # line breaks owed before the next visible text
+        self.started = False
+
+    @property
+    def text(self):
+        return ''.join(self.parts).rstrip()
+
+    def feed(self, chunk):
+        """Consume a chunk; return (visible_text, completed_actions)"""
+        visible, actions = [], []
+        for i, part in enumerate(chunk.split('\n')):
+            if i > 0:
+                self._end_line(visible, actions)
+            self._extend(part, visible)
+        return self._flush(visible, actions)
+
+    def close(self):
+        """Finish the last line and any unterminated fence or block"""
+        visible, actions = [], []
+        if self.line or self.mode != 'start':
+            self._end_line(visible, actions)
+        if self.mode == 'fence':
+            self._finish_block(self.fence_lines, visible, actions)
+        elif self.mode == 'block':
+            self._finish_block(self.block_lines, visible, actions)
+        self.mode = 'start'
+        return self._flush(visible, actions)
+
+    # ---- internals ----
+
+    def _flush(self, visible, actions):
+        text = ''.join(visible)
+        if text:
+            self.parts.append(text)
+        self.actions.extend(actions)
+        return text, actions
+
+    def _emit(self, text, visible):
+        if not text:
+            return
+        if self.started and self.newlines:
+            visible.append('\n' * self.newlines)
+        self.newlines = 0
+        self.started = True
+        visible.append(text)
+
+    def _forward(self, text, visible):
+        """Emit visible text up to the first '{', which may open an inline action"""
+        brace = text.find('{')
+        if brace == -1:
+            self._emit(text, visible)
+            return
+        self._emit(text[:brace], visible)
+        self.line = text[brace:]
+        self.mode = 'held'
+
+    def _extend(self, text, visible):
+        if self.mode == 'visible':
+            self._forward(text, visible)
+            return
+        self.line += text
+        if self.mode != 'start':
+            return
+        stripped = self.line.lstrip()
+        if stripped and stripped[0] not in '{`':
+            line, self.line = (stripped if not self.started else self.line), ''
+            self.mode = 'visible'
+            self._forward(line, visible)
+
+    def _end_line(self, visible, actions):
+        line, self.line = self.line, ''
+        stripped = line.strip()
+        mode = self.mode
+        self.mode = 'start'
+
+        if mode == 'fence':
+            if stripped.startswith('```'):
+                self._finish_block(self.fence_lines, visible, actions)
+            else:
+                self.fence_lines.append(line)
+                self.mode = 'fence'
+            return
+        if mode == 'block':
+            self.block_lines.append(line)
+            self.block_depth += line.count('{') - line.count('}')
+            if self.block_depth > 0:
+                self.mode = 'block'
+            else:
+                self._finish_block(self.block_lines, visible, actions)
+            return
+        if mode == 'held':
+            self._emit(self._strip_inline_actions(line, actions).rstrip(), visible)
+        if mode in ('visible', 'held'):
+            self.newlines = 1
+            return
+
+        # A line that started with '{', '`' or was blank
+        if not stripped:
+            if self.started:
+                self.newlines = 2
+        elif stripped.startswith('```'):
+            self.fence_lines = []
+            self.mode = 'fence'
+        elif '"action"' in stripped and stripped.count('{') == stripped.count('}'):
+            # Malformed action lines are dropped, never shown
+            action = parse_action_line(stripped)
+            if action:
+                actions.append(action)
+        elif stripped.count('{') > stripped.count('}'):
+            self.block_lines = [line]
+            self.block_depth = stripped.count('{') - stripped.count('}')
+            self.mode = 'block'
+        else:
+            self._emit(self._strip_inline_actions(line if self.started else stripped, actions).rstrip(), visible)
+            self.newlines = 1
+
+    def _strip_inline_actions(self, text, actions):
+        if '"action"' not in text:
+            return text
+        for match in ACTION_INLINE_RE.findall(text):
+            action = parse_action_line(match)
+            if action:
+                actions.append(action)
+        return ACTION_INLINE_RE.sub('', text)
+
+    def _finish_block(self, lines, visible, actions):
+        """A closed fence or multi-line object: actions if it holds any, else text"""
+        content = '\n'.join(lines)
+        found = []
+        if '"action"' in content:
+            try:
+                parsed = json.loads(content)
+            except json.JSONDecodeError:
+                parsed = None
+            items = parsed if isinstance(parsed, list) else [parsed]
+            found = [a for a in map(normalize_action, items) if a]
+            if not found:
+                found = [a for a in map(parse_action_line, ACTION_INLINE_RE.findall(content)) if a]
+        if found or '"action"' in content:
+            actions.extend(found)
+            return
+        for line in lines:
+            if line.strip():
+                self._emit(line.rstrip() if self.started else line.strip(), visible)
+                self.newlines = 1
+            elif self.started:
+                self.newlines = 2
+
+def normalize_action(obj):
+    """An action dict with its title cleaned, or None if obj isn't an action"""
+    if not isinstance(obj, dict) or "action" not in obj:
+        return None
+    if isinstance(obj.get('title'), str):
+        obj['title'] = clean_title(obj['title'])
+    actions_log.debug(" ✅ %s - %s", obj.get('action'), obj.get('title', 'N/A'))
+    return obj
+
+def parse_action_line(line):
+    """Parse a single action JSON line, or return None"""
+    try:
+        return normalize_action(json.loads(line))
+    except json.JSONDecodeError:
+        return None
+
+def scan_donna_response(text):
+    """Actions and cleaned visible text of a complete response, in one pass"""
+    scanner = ActionScanner()
+    scanner.feed(text)
+    scanner.close()
+    return scanner.actions, scanner.text
 
 # ==================== AUTHENTICATION ROUTES ====================
 
-@app.route('/api/auth/register', methods=['POST'])
+@donna_routes.route('/api/auth/register', methods=['POST'])
 def register():
     """Register new user"""
     try:
@@ -329,7 +2933,7 @@ def register():
         email = data.get('email', '').strip()
         password = data.get('password', '').strip()
         
-        print(f"\n📝 Registration attempt: {username}")
+        auth_log.info("📝 Registration attempt: %s", username)
         
         if not all([username, email, password]):
             return jsonify({'success': False, 'message': 'Missing required fields'}), 400
@@ -337,33 +2941,34 @@ def register():
         if len(password) < 6:
             return jsonify({'success': False, 'message': 'Password must be at least 6 characters'}), 400
         
-        # Check if email exists
-        existing = supabase.table('users').select('*').eq('email', email).execute()
-        if existing.data:
+        conflict = registration_conflict(email, username)
+        if conflict == 'email':
             return jsonify({'success': False, 'message': 'Email already registered'}), 400
-        
-        # Check if username exists
-        existing = supabase.table('users').select('*').eq('username', username).execute()
-        if existing.data:
+        if conflict == 'username':
             return jsonify({'success': False, 'message': 'Username already taken'}), 400
         
         # Create user
-        password_hash = generate_password_hash(password)
-        result = supabase.table('users').insert({
+        password_hash = password_hasher.hash(password)
+        supabase.table('users').insert({
             'email': email,
             'username': username,
             'password_hash': password_hash,
             'created_at': datetime.utcnow().isoformat()
         }).execute()
         
-        print(f"✅ User registered: {username}")
+        unknown_logins.discard(username, email)
+        
+        auth_log.info("✅ User registered: %s", username)
         return jsonify({'success': True, 'message': 'Registration successful!'}), 201
     
+    except HashPoolBusyError as e:
+        auth_log.warning("⚠️ Registration rejected, hash pool busy: %s", e)
+        return auth_busy_response()
     except Exception as e:
-        print(f"❌ Registration error: {e}")
+        auth_log.error("❌ Registration error: %s", e)
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/api/auth/login', methods=['POST'])
+@donna_routes.route('/api/auth/login', methods=['POST'])
 def login():
     """Login user"""
     try:
@@ -371,40 +2976,35 @@ def login():
         username = data.get('username', '').strip()
         password = data.get('password', '').strip()
         
-        print(f"\n🔐 Login attempt: {username}")
+        auth_log.info("🔐 Login attempt: %s", username)
         
         if not username or not password:
             return jsonify({'success': False, 'message': 'Missing credentials'}), 400
         
-        # Try to find user by username first
-        result = supabase.table('users').select('*').eq('username', username).execute()
+        # Username or email, answered from the miss cache when recently unknown
+        user = None if username in unknown_logins else find_login_user(username)
         
-        # If not found, try email
-        if not result.data:
-            result = supabase.table('users').select('*').eq('email', username).execute()
-        
-        if not result.data:
-            print(f"❌ User not found: {username}")
+        if not user:
+            unknown_logins.add(username)
+            auth_log.info("❌ User not found: %s", username)
             return jsonify({'success': False, 'message': 'Invalid username or password'}), 401
         
-        user = result.data[0]
-        
         # Check password
-        if not check_password_hash(user['password_hash'], password):
-            print(f"❌ Invalid password for: {username}")
+        if not password_hasher.verify(user['password_hash'], password):
+            auth_log.info("❌ Invalid password for: %s", username)
             return jsonify({'success': False, 'message': 'Invalid username or password'}), 401
         
         # Generate JWT token
+        import jwt
         token = jwt.encode({
             'user_id': str(user['id']),
             'username': user['username'],
             'email': user['email'],
             'iat': datetime.utcnow(),
             'exp': datetime.utcnow() + timedelta(days=30)
-        }, app.secret_key, algorithm='HS256')
+        }, SECRET_KEY, algorithm='HS256')
         
-        print(f"✅ User logged in: {user['username']}")
-        print(f"✅ Token generated: {token[:30]}...")
+        auth_log.info("✅ User logged in: %s", user['username'])
         
         return jsonify({
             'success': True,
@@ -415,49 +3015,658 @@ def login():
                 'username': user['username'],
                 'email': user['email']
             }
-        }), 200
-    
+        }), 200
+    
+    except HashPoolBusyError as e:
+        auth_log.warning("⚠️ Login rejected, hash pool busy: %s", e)
+        return auth_busy_response()
+    except Exception as e:
+        auth_log.exception("❌ Login error: %s", e)
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# ==================== STATIC ASSETS ====================
+# The pages' CSS and JS live in static/ and are served from fingerprinted
+# URLs (/assets/css/index.<hash>.css) that never change, so browsers cache
+# them for good. Page shells are rendered once. Everything is compressed
+# once with gzip (and brotli when installed) and sent with an ETag, so a
+# repeat visit costs a 304.
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+PAGE_CACHE_CONTROL = 'public, no-cache'
+PAGE_TEMPLATES = ('index.html', 'login.html', 'tasks.html', 'calendar.html')
+COMPRESS_MIN_BYTES = 1024
+
+def precompress(data):
+    """data in each encoding worth sending: identity, gzip and, with brotli installed, br"""
+    variants = {'identity': data}
+    if len(data) < COMPRESS_MIN_BYTES:
+        return variants
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data):
+        variants['gzip'] = compressed
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data):
+            variants['br'] = compressed
+    return variants
+
+class Precompressed:
+    """A static body kept in every encoding, with a content hash for its ETag"""
+    
+    def __init__(self, data, mimetype):
+        self.digest = hashlib.sha256(data).hexdigest()[:20]
+        self.mimetype = mimetype
+        self.variants = precompress(data)
+    
+    def respond(self, cache_control):
+        """The smallest encoding the client accepts, or 304 if it has this version"""
+        encoding = next((e for e in ('br', 'gzip') if e in self.variants and request.accept_encodings[e]), 'identity')
+        etag = self.digest if encoding == 'identity' else f"{self.digest}-{encoding}"
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(self.variants[encoding], mimetype=self.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+class StaticAssets:
+    """Files under static/, fingerprinted and precompressed on first use"""
+    
+    def __init__(self, root, url_prefix='/assets'):
+        self.root = root
+        self.url_prefix = url_prefix
+        self._urls = {}   # 'css/index.css' -> '/assets/css/index.<hash>.css'
+        self._files = {}  # 'css/index.<hash>.css' -> Precompressed
+        self._loaded = False
+        self._lock = threading.Lock()
+    
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return self
+            urls, files = {}, {}
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                    with open(path, 'rb') as f:
+                        asset = Precompressed(f.read(), mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+                    stem, ext = os.path.splitext(name)
+                    fingerprinted = f"{stem}.{asset.digest[:10]}{ext}"
+                    files[fingerprinted] = asset
+                    urls[name] = f"{self.url_prefix}/{fingerprinted}"
+            self._urls, self._files, self._loaded = urls, files, True
+        return self
+    
+    def url(self, name):
+        """Fingerprinted URL of a file in static/ (the plain /static/ one if it is new)"""
+        if not self._loaded:
+            self.load()
+        return self._urls.get(name) or f"/static/{name}"
+    
+    def get(self, fingerprinted):
+        if not self._loaded:
+            self.load()
+        return self._files.get(fingerprinted)
+    
+    def stats(self):
+        return {
+            'files': len(self._files),
+            'bytes': sum(len(a.variants['identity']) for a in self._files.values()),
+            'encodings': sorted({e for a in self._files.values() for e in a.variants})
+        }
+
+static_assets = StaticAssets(STATIC_DIR)
+donna_routes.add_app_template_global(static_assets.url, 'asset_url')
+
+page_shells = {}
+
+def render_page_shell(template):
+    """Render a page once (inside an app context); its HTML only changes with a deploy"""
+    page = page_shells.get(template)
+    if page is None:
+        page = page_shells.setdefault(template, Precompressed(render_template(template).encode(), 'text/html'))
+    return page
+
+def prerender_pages(app):
+    with app.app_context():
+        for template in PAGE_TEMPLATES:
+            render_page_shell(template)
+    log.info("📦 %d pages and %d static assets precompressed (%s)", len(page_shells),
+             static_assets.stats()['files'], ', '.join(static_assets.stats()['encodings']))
+
+@donna_routes.route('/assets/<path:filename>')
+def fingerprinted_asset(filename):
+    """A fingerprinted static file; its URL changes whenever its content does"""
+    asset = static_assets.get(filename)
+    if asset is None:
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return asset.respond(ASSET_CACHE_CONTROL)
+
+# API responses can't be compressed ahead of time, so they are compressed
+# per request at cheaper levels. A strong ETag becomes weak, as nginx does:
+# the encoded bytes differ but If-None-Match still matches.
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain')
+DYNAMIC_GZIP_LEVEL = int(os.getenv('DYNAMIC_GZIP_LEVEL', 5))
+DYNAMIC_BROTLI_QUALITY = int(os.getenv('DYNAMIC_BROTLI_QUALITY', 4))
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=DYNAMIC_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=DYNAMIC_GZIP_LEVEL, mtime=0)
+
+@donna_routes.after_app_request
+def compress_response(response):
+    """gzip/br JSON and text bodies of COMPRESS_MIN_BYTES or more when the client accepts it"""
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+    encoding = next((e for e in encodings if request.accept_encodings[e]), None)
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_BYTES:
+        return response
+    
+    with stage_timer(f'compress_{encoding}'):
+        compressed = compress_body(data, encoding)
+    if len(compressed) >= len(data):
+        return response
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    metrics.inc('donna_compressed_responses_total', encoding=encoding)
+    metrics.inc('donna_compression_saved_bytes_total', len(data) - len(compressed))
+    return response
+
+# ==================== PAGE ROUTES - NO AUTH CHECK ====================
+# These routes just serve HTML - JavaScript handles authentication
+
+@donna_routes.route('/')
+def index():
+    """Serve home page"""
+    return render_page_shell('index.html').respond(PAGE_CACHE_CONTROL)
+
+@donna_routes.route('/login')
+def login_page():
+    """Serve login page - NO AUTH REQUIRED ON ROUTE"""
+    return render_page_shell('login.html').respond(PAGE_CACHE_CONTROL)
+
+@donna_routes.route('/tasks')
+def tasks_page():
+    """Serve tasks page"""
+    return render_page_shell('tasks.html').respond(PAGE_CACHE_CONTROL)
+
+@donna_routes.route('/calendar')
+def calendar_page():
+    """Serve calendar page"""
+    return render_page_shell('calendar.html').respond(PAGE_CACHE_CONTROL)
+
+# ==================== CHAT JOB QUEUE ====================
+# POST /api/chat with "Prefer: respond-async" (or {"async": true}) queues
+# the request here and answers 202 right away; the reply is produced on a
+# bounded worker pool and read from GET /api/chat/<request_id>. Jobs live
+# in this process; other workers fall back to the messages table.
+
+class QueueFullError(Exception):
+    """Raised when the chat job queue is at capacity"""
+
+class ChatJob:
+    """One queued chat request and the events it has produced so far"""
+
+    def __init__(self, request_id, user_id, user_message):
+        self.request_id = request_id
+        self.user_id = user_id
+        self.user_message = user_message
+        self.status = 'queued'
+        self.events = []
+        self.dropped = 0
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'error')
+
+    def start(self):
+        with self._condition:
+            self.status = 'running'
+            self.started_at = time.monotonic()
+
+    def emit(self, event, data):
+        with self._condition:
+            self.events.append((event, data))
+            if event in ('done', 'error'):
+                self.status = 'completed' if event == 'done' else 'error'
+                self.finished_at = time.monotonic()
+            self._condition.notify_all()
+
+    def wait_events(self, start, timeout):
+        """(events after the first ``start``, index to resume from, finished),
+        waiting up to ``timeout`` for new ones"""
+        with self._condition:
+            if self.dropped + len(self.events) <= start and not self.finished:
+                self._condition.wait(timeout)
+            events = self.events[max(0, start - self.dropped):]
+            return events, self.dropped + len(self.events), self.finished
+
+    def compact(self):
+        """Drop the events of a finished job but its last ('done' or 'error').
+
+        A follower that was behind resumes at that event, which carries
+        the whole response.
+        """
+        with self._condition:
+            if self.finished and len(self.events) > 1:
+                self.dropped += len(self.events) - 1
+                self.events = self.events[-1:]
+
+    def snapshot(self):
+        with self._condition:
+            events, status = list(self.events), self.status
+        result = {'requestId': self.request_id, 'status': status, 'response': None, 'actions': [],
+                  'cached': False, 'local': False}
+        for event, data in events:
+            if event == 'action':
+                result['actions'].append(data)
+            elif event == 'done':
+                result['response'] = data.get('response')
+                result['cached'] = data.get('cached', False)
+                result['local'] = data.get('local', False)
+            elif event == 'error':
+                result['error'] = data.get('error')
+        return result
+
+class ChatJobQueue:
+    """Runs chat jobs on a bounded worker pool.
+
+    At most ``max_pending`` jobs are queued or running at once; beyond that
+    submit() raises QueueFullError so the caller can answer 503. Finished
+    jobs stay readable for ``ttl_seconds``.
+    """
+
+    def __init__(self, workers=4, max_pending=32, ttl_seconds=300):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='donna-chat')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, job, run):
+        """Queue ``run(job)``, a generator of (event, data) pairs, or raise QueueFullError"""
+        with self._lock:
+            self._prune()
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise QueueFullError(f"{self._pending} chat requests already pending")
+            self._pending += 1
+            self.submitted += 1
+            self._jobs[job.request_id] = job
+        self._executor.submit(self._run, job, run)
+
+    def _run(self, job, run):
+        job.start()
+        metrics.observe('donna_chat_queue_wait_seconds', job.started_at - job.enqueued_at)
+        with self._lock:
+            self._running += 1
+        try:
+            for event, data in run(job):
+                job.emit(event, data)
+        except Exception as e:
+            chat_log.exception("❌ Chat job %s failed: %s", job.request_id, e)
+        finally:
+            if not job.finished:
+                job.emit('error', {'requestId': job.request_id, 'error': 'The request failed'})
+            with self._lock:
+                self._pending -= 1
+                self._running -= 1
+                if job.status == 'completed':
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def _prune(self):
+        # Jobs are kept in submission order, so expired ones are at the front
+        cutoff = time.monotonic() - self.ttl_seconds
+        for request_id, job in list(self._jobs.items()):
+            if job.enqueued_at > cutoff:
+                break
+            if job.finished and job.finished_at < cutoff:
+                del self._jobs[request_id]
+
+    def get(self, request_id):
+        with self._lock:
+            return self._jobs.get(request_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'queued': self._pending - self._running,
+                'running': self._running,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'failed': self.failed,
+                'retained': len(self._jobs)
+            }
+
+chat_jobs = ChatJobQueue(
+    workers=int(os.getenv('CHAT_WORKERS', 4)),
+    max_pending=int(os.getenv('CHAT_QUEUE_SIZE', 32)),
+    ttl_seconds=int(os.getenv('CHAT_JOB_TTL', 300))
+)
+CHAT_RETRY_AFTER_SECONDS = 5
+
+def mark_chat_failed(request_id, message):
+    """Record a failed reply on the messages row; best effort"""
+    try:
+        supabase.table('messages').update({
+            'status': 'error',
+            'donna_response': message
+        }).eq('request_id', request_id).execute()
+    except:
+        pass
+
+def run_chat_job(job):
+    """Worker side of a queued chat: the same events /api/chat/stream sends"""
+    chat_log.info("💬 Chat job %s started after %.0fms in the queue",
+                  job.request_id, (job.started_at - job.enqueued_at) * 1000)
+    try:
+        messages, cache_key, reply = prepare_chat(job.request_id, job.user_id, job.user_message)
     except Exception as e:
-        print(f"❌ Login error: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'success': False, 'message': str(e)}), 500
+        chat_log.exception("❌ Chat job error: %s", e)
+        mark_chat_failed(job.request_id, f'Sorry, I encountered an error: {str(e)}')
+        yield 'error', {'requestId': job.request_id, 'error': str(e)}
+        return
+    yield from chat_events(job.request_id, job.user_id, messages, cache_key, reply)
 
-# ==================== PAGE ROUTES - NO AUTH CHECK ====================
-# These routes just serve HTML - JavaScript handles authentication
+def follow_chat_job(job):
+    """SSE for a job on this process: everything so far, then new events as they happen"""
+    yield "retry: 5000\n" + sse_event('start', {'requestId': job.request_id, 'status': job.status})
+    sent = 0
+    deadline = time.monotonic() + STREAM_MAX_SECONDS
+    while time.monotonic() < deadline:
+        events, sent, finished = job.wait_events(sent, STREAM_HEARTBEAT_SECONDS)
+        for event, data in events:
+            yield sse_event(event, data)
+        if finished:
+            return
+        if not events:
+            yield ": keep-alive\n\n"
 
-@app.route('/')
-def index():
-    """Serve home page"""
-    return render_template('index.html')
+def stored_chat_result(request_id, user_id):
+    """A chat's status from its messages row, for jobs this process doesn't hold"""
+    with stage_timer('messages_select'):
+        rows = supabase.table('messages')\
+            .select('request_id, status, donna_response')\
+            .eq('request_id', request_id)\
+            .eq('user_id', user_id)\
+            .limit(1)\
+            .execute().data
+    if not rows:
+        return None
+    status = {'processing': 'running'}.get(rows[0].get('status'), rows[0].get('status'))
+    result = {'requestId': request_id, 'status': status, 'response': None, 'actions': [], 'cached': False}
+    if status == 'completed':
+        result['response'] = rows[0].get('donna_response')
+    elif status == 'error':
+        result['error'] = rows[0].get('donna_response')
+    return result
 
-@app.route('/login')
-def login_page():
-    """Serve login page - NO AUTH REQUIRED ON ROUTE"""
-    return render_template('login.html')
+def follow_stored_chat(request_id, user_id, result):
+    """SSE for a job held by another process, polling its messages row"""
+    yield "retry: 5000\n" + sse_event('start', {'requestId': request_id, 'status': result['status']})
+    deadline = time.monotonic() + STREAM_MAX_SECONDS
+    while result and result['status'] not in ('completed', 'error') and time.monotonic() < deadline:
+        time.sleep(1)
+        yield ": keep-alive\n\n"
+        result = stored_chat_result(request_id, user_id)
+    if result and result['status'] == 'completed':
+        yield sse_event('done', {'requestId': request_id, 'response': result['response'], 'cached': False})
+    elif result and result['status'] == 'error':
+        yield sse_event('error', {'requestId': request_id, 'error': result.get('error')})
 
-@app.route('/tasks')
-def tasks_page():
-    """Serve tasks page"""
-    return render_template('tasks.html')
+# ==================== IDEMPOTENCY ====================
+# POST /api/chat, /api/chat/stream, /api/tasks and /api/calendar/events
+# accept an Idempotency-Key header. The first request with a key runs;
+# copies that arrive while it runs wait for it and copies that arrive later
+# get its stored response (marked Idempotent-Replayed), so a double-click
+# or a browser retry never calls the LLM or inserts rows twice. Streamed
+# chats are recorded as a ChatJob that copies follow live; once it is done
+# only its final event is kept, for CHAT_JOB_TTL. Only successes are kept:
+# after a failure the same key runs again. Keys are per user and per
+# process, like the chat jobs, so a copy that reaches another gunicorn
+# worker runs again.
 
-@app.route('/calendar')
-def calendar_page():
-    """Serve calendar page"""
-    return render_template('calendar.html')
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 90))
+REPLAYED_HEADERS = ('Content-Type', 'Location', 'Retry-After')
+
+class IdempotencyError(Exception):
+    """An Idempotency-Key the request can't run under; ``status`` is the HTTP answer"""
+    
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+class IdempotentFlight:
+    """The one execution of a keyed request; copies wait for its result"""
+    
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.result = None
+        self.failed = False
+        self.expires_at = None
+        self._settled = threading.Event()
+    
+    @property
+    def running(self):
+        return self.expires_at is None and not self.failed
+    
+    def resolve(self, result, expires_at=None):
+        """Hand ``result`` to waiters; ``expires_at`` is None while the flight still runs"""
+        self.result = result
+        self.expires_at = expires_at
+        self._settled.set()
+    
+    def fail(self):
+        self.failed = True
+        self._settled.set()
+    
+    def wait(self, timeout):
+        """The result, or None if the flight failed or is still running after ``timeout``"""
+        self._settled.wait(timeout)
+        return self.result
+
+class IdempotencyCache:
+    """Single-flight plus a bounded LRU + TTL cache of results, by (user, scope, key).
+
+    Only settled entries are evicted, so a running flight is never lost to
+    a newer key and run a second time.
+    """
+    
+    def __init__(self, max_entries=10000, ttl_seconds=86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.replayed = 0
+        self.rejected = 0
+    
+    def begin(self, key, fingerprint):
+        """(new flight, True) for the first request with ``key``, (its flight, False) for a copy"""
+        with self._lock:
+            flight = self._entries.get(key)
+            if flight is not None and (flight.failed or (
+                    flight.expires_at is not None and time.monotonic() > flight.expires_at)):
+                del self._entries[key]
+                flight = None
+            if flight is None:
+                flight = self._entries[key] = IdempotentFlight(fingerprint)
+                self._evict()
+                self.executed += 1
+                return flight, True
+            if flight.fingerprint != fingerprint:
+                self.rejected += 1
+                raise IdempotencyError("This Idempotency-Key was already used for a different request", 422)
+            self._entries.move_to_end(key)
+            if flight.running:
+                self.coalesced += 1
+            else:
+                self.replayed += 1
+            return flight, False
+    
+    def _evict(self):
+        excess = len(self._entries) - self.max_entries
+        if excess > 0:
+            settled = (key for key, flight in self._entries.items() if not flight.running)
+            for key in list(islice(settled, excess)):
+                del self._entries[key]
+    
+    def publish(self, flight, result):
+        """Let copies of a still-running flight follow ``result`` (a ChatJob)"""
+        flight.resolve(result)
+    
+    def complete(self, flight, result, ttl_seconds=None):
+        """Hand ``result`` to the copies waiting on ``flight`` and keep it for later ones"""
+        flight.resolve(result, time.monotonic() + (ttl_seconds or self.ttl_seconds))
+    
+    def discard(self, key, flight):
+        """Forget a flight that failed, so the next request with its key runs again"""
+        with self._lock:
+            if self._entries.get(key) is flight:
+                del self._entries[key]
+        flight.fail()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'in_flight': sum(1 for f in self._entries.values() if f.running),
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+                'replayed': self.replayed,
+                'rejected': self.rejected
+            }
+
+idempotency_cache = IdempotencyCache(
+    max_entries=int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000)),
+    ttl_seconds=int(os.getenv('IDEMPOTENCY_TTL', 86400))
+)
+
+def claim_idempotency_key(user_id, scope, key, body):
+    """(cache key, flight, owner): run the request when owner, else reuse flight.result.
+
+    Waits for a copy's flight to finish; if it failed, this request takes
+    over. Raises IdempotencyError for a bad key, a key reused with another
+    body, or a flight still running after IDEMPOTENCY_WAIT_SECONDS.
+    """
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise IdempotencyError(f"Idempotency-Key is longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters", 400)
+    cache_key = (user_id, scope, key)
+    fingerprint = hashlib.sha256(body).hexdigest()
+    for _ in range(3):
+        flight, owner = idempotency_cache.begin(cache_key, fingerprint)
+        if owner or flight.wait(IDEMPOTENCY_WAIT_SECONDS) is not None:
+            return cache_key, flight, owner
+        if not flight.failed:
+            break
+    raise IdempotencyError("A request with this Idempotency-Key is still in progress", 409)
+
+def replay_response(stored):
+    """A stored (body, status, headers) response, sent again"""
+    body, status, headers = stored
+    return Response(body, status=status, headers=[*headers, ('Idempotent-Replayed', 'true')])
+
+def idempotent(scope):
+    """Run a JSON route once per Idempotency-Key (after require_auth); copies get its response"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return f(*args, **kwargs)
+            try:
+                cache_key, flight, owner = claim_idempotency_key(g.user_id, scope, key, request.get_data())
+            except IdempotencyError as e:
+                return jsonify({'success': False, 'error': str(e)}), e.status
+            if not owner:
+                log.info("♻️ Replaying %s for Idempotency-Key %s", request.path, key)
+                return replay_response(flight.result)
+            
+            response = None
+            try:
+                response = make_response(f(*args, **kwargs))
+            finally:
+                if response is not None and 200 <= response.status_code < 300 and not response.is_streamed:
+                    idempotency_cache.complete(flight, (
+                        response.get_data(),
+                        response.status_code,
+                        [(name, value) for name, value in response.headers if name in REPLAYED_HEADERS]
+                    ))
+                else:
+                    idempotency_cache.discard(cache_key, flight)
+            return response
+        return decorated
+    return decorator
+
+def start_idempotent_chat(cache_key, flight, request_id, user_id, user_message):
+    """A ChatJob that records a streamed chat for copies of its request to follow"""
+    job = ChatJob(request_id, user_id, user_message)
+    job.start()
+    idempotency_cache.publish(flight, job)
+    return job
+
+def finish_idempotent_chat(cache_key, flight, job):
+    """Close a recorded chat; an interrupted or failed one frees its key for a retry.
+
+    A completed one keeps only its 'done' event, for as long as queued chat
+    jobs are kept.
+    """
+    if not job.finished:
+        job.emit('error', {'requestId': job.request_id, 'error': 'The response was interrupted'})
+    if job.status == 'completed':
+        job.compact()
+        idempotency_cache.complete(flight, job, chat_jobs.ttl_seconds)
+    else:
+        idempotency_cache.discard(cache_key, flight)
 
 # ==================== CHAT ROUTES ====================
 
-@app.route('/api/chat', methods=['POST'])
+@donna_routes.route('/api/chat', methods=['POST'])
+@require_auth
 def chat():
     """Intelligent DONNA chat"""
+    if request.accept_mimetypes.best_match(['application/json', 'text/event-stream']) == 'text/event-stream':
+        return chat_stream()
+    return chat_reply()
+
+@idempotent('chat')
+def chat_reply():
+    """The JSON answer to POST /api/chat, or 202 for a queued one"""
+    request_id = None
     try:
-        user = get_current_user()
-        if not user:
-            print("❌ Chat: Unauthorized")
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
-        
-        user_id = str(user.get('user_id'))
+        user_id = g.user_id
         data = request.json or {}
         user_message = data.get('message', '')
         
@@ -466,278 +3675,722 @@ def chat():
         
         request_id = str(uuid.uuid4())
         
-        print(f"\n{'='*80}")
-        print(f"💬 NEW CHAT REQUEST")
-        print(f"User: {user.get('username')} ({user_id})")
-        print(f"Message: {user_message}")
-        print(f"{'='*80}")
-        
-        # Store message
-        supabase.table('messages').insert({
-            'request_id': request_id,
-            'user_id': user_id,
-            'user_message': user_message,
-            'donna_response': None,
-            'status': 'processing'
-        }).execute()
-        
-        # Get context
-        user_context, context_data = get_user_context(user_id)
-        conversation_memory = get_conversation_memory(user_id, limit=5)
-        
-        # Build messages
-        messages = [
-            {"role": "system", "content": DONNA_SYSTEM_PROMPT},
-            {"role": "system", "content": user_context},
-            *conversation_memory,
-            {"role": "user", "content": user_message}
-        ]
-        
-        # Call AI
-        print("📡 Calling OpenRouter API...")
-        response = requests.post(
-            OPENROUTER_URL,
-            headers={
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "deepseek/deepseek-chat",
-                "messages": messages,
-                "temperature": 0.7,
-                "max_tokens": 2000,
-            },
-            timeout=60
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"API error: {response.status_code} - {response.text}")
-        
-        ai_response = response.json()['choices'][0]['message']['content']
-        print(f"✅ AI response received ({len(ai_response)} chars)")
+        if data.get('async') or 'respond-async' in request.headers.get('Prefer', ''):
+            return enqueue_chat(request_id, user_id, user_message)
         
-        # Parse and execute actions
-        actions = parse_donna_actions(ai_response)
+        chat_log.info("💬 Chat request %s from %s (%d chars)", request_id, g.user.get('username'), len(user_message))
+        chat_log.debug("Message: %s", user_message)
         
-        print(f"\n🎬 EXECUTING {len(actions)} ACTIONS")
-        for i, action in enumerate(actions):
-            execute_donna_action(action, user_id)
-        
-        # Clean response - remove JSON
-        clean_response = ai_response
-        lines = clean_response.split('\n')
-        clean_lines = []
-        for line in lines:
-            stripped = line.strip()
-            if stripped.startswith('{') and '"action"' in stripped:
-                continue
-            if stripped.startswith('```json') or stripped.startswith('```'):
-                continue
-            if stripped:
-                clean_lines.append(line)
+        # Store message, get context and build messages
+        messages, cache_key, reply = prepare_chat(request_id, user_id, user_message)
         
-        clean_response = '\n'.join(clean_lines).strip()
-        clean_response = re.sub(r'\{[^{}]*"action"[^{}]*\}', '', clean_response)
-        clean_response = re.sub(r'\n{3,}', '\n\n', clean_response).strip()
+        if reply is not None:
+            chat_log.debug("⚡ Answered without the LLM (%s)", reply.get('intent') or reply['source'])
+            actions = reply['actions']
+            action_results, clean_response = carry_out_reply(reply, user_id)
+        else:
+            # Call AI
+            chat_log.debug("📡 Calling OpenRouter API...")
+            with stage_timer('llm'):
+                completion = llm_client.complete(openrouter_payload(messages))
+            ai_response = completion['choices'][0]['message']['content']
+            chat_log.debug("✅ AI response received (%d chars)", len(ai_response))
+            
+            # Parse actions and clean the response in one pass
+            with stage_timer('parse_actions'):
+                actions, clean_response = scan_donna_response(ai_response)
+            
+            chat_log.debug("🎬 Executing %d actions", len(actions))
+            with stage_timer('actions'):
+                action_results = execute_donna_actions(actions, user_id)
+            
+            # Only answers that changed nothing are safe to replay
+            if cache_key and not actions:
+                response_cache.set(cache_key, clean_response)
         
         # Store response
-        supabase.table('messages').update({
-            'donna_response': clean_response,
-            'status': 'completed'
-        }).eq('request_id', request_id).execute()
+        with stage_timer('message_update'):
+            supabase.table('messages').update({
+                'donna_response': clean_response,
+                'status': 'completed'
+            }).eq('request_id', request_id).execute()
+        notify_change(user_id, 'messages')
+        conversation_summarizer.schedule(user_id)
         
-        print(f"✅ Chat completed - {len(actions)} actions executed")
+        chat_log.info("✅ Chat %s completed - %d actions executed", request_id, len(actions))
         
         return jsonify({
             'success': True,
             'requestId': request_id,
             'response': clean_response,
+            'actions': action_results,
+            'cached': bool(reply) and reply['source'] == 'cache',
+            'local': bool(reply) and reply['source'] == 'local'
         }), 200
     
     except Exception as e:
-        print(f"❌ CHAT ERROR: {e}")
-        import traceback
-        traceback.print_exc()
+        chat_log.exception("❌ Chat error: %s", e)
         
+        if request_id:
+            mark_chat_failed(request_id, f'Sorry, I encountered an error: {str(e)}')
+        
+        # Fail fast with 503 while the OpenRouter circuit is open
+        status = 503 if isinstance(e, CircuitOpenError) else 500
+        return jsonify({'success': False, 'error': str(e)}), status
+
+@donna_routes.route('/api/chat/stream', methods=['POST'])
+@require_auth
+def chat_stream():
+    """DONNA chat streamed as Server-Sent Events.
+
+    Events: 'start' (requestId), 'token' (visible text as it is generated),
+    'action' (each action as soon as its JSON line is complete and executed),
+    'done' (final cleaned response) and 'error'.
+    """
+    request_id = None
+    flight = None
+    try:
+        user_id = g.user_id
+        data = request.json or {}
+        user_message = data.get('message', '')
+
+        if not user_message:
+            return jsonify({'success': False, 'error': 'Empty message'}), 400
+
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            idempotency_cache_key, flight, owner = claim_idempotency_key(
+                user_id, 'chat_stream', idempotency_key, request.get_data())
+            if not owner:
+                chat_log.info("♻️ Chat %s followed by a repeated request", flight.result.request_id)
+                return event_stream_response(follow_chat_job(flight.result), replayed=True)
+
+        request_id = str(uuid.uuid4())
+
+        chat_log.info("💬 Streaming chat request %s from %s (%d chars)", request_id, g.user.get('username'), len(user_message))
+        chat_log.debug("Message: %s", user_message)
+
+        # Store message, get context and build messages
+        messages, cache_key, reply = prepare_chat(request_id, user_id, user_message)
+
+    except IdempotencyError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+
+    except Exception as e:
+        chat_log.error("❌ Chat stream error: %s", e)
+        if request_id:
+            mark_chat_failed(request_id, f'Sorry, I encountered an error: {str(e)}')
+        if flight is not None:
+            idempotency_cache.discard(idempotency_cache_key, flight)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    job = None
+    if flight is not None:
+        job = start_idempotent_chat(idempotency_cache_key, flight, request_id, user_id, user_message)
+
+    def generate():
+        events = chat_events(request_id, user_id, messages, cache_key, reply)
         try:
+            yield sse_event('start', {'requestId': request_id})
+            for event, data in events:
+                if job is not None:
+                    job.emit(event, data)
+                yield sse_event(event, data)
+        finally:
+            # A client disconnect closes the reply mid-stream too
+            events.close()
+            if job is not None:
+                finish_idempotent_chat(idempotency_cache_key, flight, job)
+
+    return event_stream_response(generate())
+
+def event_stream_response(events, replayed=False):
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    }
+    if replayed:
+        headers['Idempotent-Replayed'] = 'true'
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers=headers)
+
+def enqueue_chat(request_id, user_id, user_message):
+    """Queue a chat for the worker pool: 202 with its requestId, or 503 when full"""
+    job = ChatJob(request_id, user_id, user_message)
+    try:
+        chat_jobs.submit(job, run_chat_job)
+    except QueueFullError as e:
+        chat_log.warning("⚠️ Chat queue full, rejecting request from %s: %s", g.user.get('username'), e)
+        return jsonify({
+            'success': False,
+            'error': 'DONNA is busy right now, please try again in a few seconds'
+        }), 503, {'Retry-After': str(CHAT_RETRY_AFTER_SECONDS)}
+    
+    chat_log.info("💬 Chat request %s queued for %s (%d chars)", request_id, g.user.get('username'), len(user_message))
+    status_url = f"/api/chat/{request_id}"
+    return jsonify({
+        'success': True,
+        'requestId': request_id,
+        'status': 'queued',
+        'statusUrl': status_url
+    }), 202, {'Location': status_url}
+
+def chat_events(request_id, user_id, messages, cache_key, reply):
+    """Generate the reply to a prepared chat as (event, data) pairs.
+
+    Events: 'token' (visible text as it is generated), 'action' (each
+    action as soon as its JSON line is complete and executed), 'done'
+    (final cleaned response) and 'error'. The messages row is completed
+    or marked failed here; closing the generator early marks it interrupted.
+    """
+    received = 0
+    scanner = ActionScanner()
+
+    def run_actions(batch):
+        # Actions completed by the same chunk go out as one batch
+        if batch:
+            with stage_timer('actions'):
+                results = execute_donna_actions(batch, user_id)
+            for result in results:
+                yield 'action', result
+
+    def stream_from_llm():
+        nonlocal received
+        chat_log.debug("📡 Streaming from OpenRouter API...")
+        # 'llm' covers the whole stream, including actions run mid-stream
+        llm_started = time.perf_counter()
+        for delta in llm_client.stream(openrouter_payload(messages, stream=True)):
+            if not received:
+                metrics.observe('donna_stage_seconds', time.perf_counter() - llm_started, stage='llm_first_token')
+            received += len(delta)
+            visible, batch = scanner.feed(delta)
+            yield from run_actions(batch)
+            if visible:
+                yield 'token', {'text': visible}
+
+        visible, batch = scanner.close()
+        yield from run_actions(batch)
+        if visible:
+            yield 'token', {'text': visible}
+
+        metrics.observe('donna_stage_seconds', time.perf_counter() - llm_started, stage='llm')
+        chat_log.debug("✅ AI stream finished (%d chars)", received)
+
+    try:
+        if reply is not None:
+            chat_log.debug("⚡ Answered without the LLM (%s)", reply.get('intent') or reply['source'])
+            actions = reply['actions']
+            results, clean_response = carry_out_reply(reply, user_id)
+            for result in results:
+                yield 'action', result
+            yield 'token', {'text': clean_response}
+        else:
+            yield from stream_from_llm()
+            actions, clean_response = scanner.actions, scanner.text
+            # Only answers that changed nothing are safe to replay
+            if cache_key and not actions:
+                response_cache.set(cache_key, clean_response)
+
+        with stage_timer('message_update'):
             supabase.table('messages').update({
-                'status': 'error',
-                'donna_response': f'Sorry, I encountered an error: {str(e)}'
+                'donna_response': clean_response,
+                'status': 'completed'
             }).eq('request_id', request_id).execute()
-        except:
-            pass
+        notify_change(user_id, 'messages')
+        conversation_summarizer.schedule(user_id)
+
+        chat_log.info("✅ Chat %s completed - %d actions executed", request_id, len(actions))
+        yield 'done', {
+            'requestId': request_id,
+            'response': clean_response,
+            'cached': bool(reply) and reply['source'] == 'cache',
+            'local': bool(reply) and reply['source'] == 'local'
+        }
+
+    except GeneratorExit:
+        chat_log.warning("⚠️ Chat stream closed by client: %s", request_id)
+        mark_chat_failed(request_id, 'Sorry, the response was interrupted.')
+        raise
+
+    except Exception as e:
+        chat_log.exception("❌ Chat stream error: %s", e)
+        mark_chat_failed(request_id, f'Sorry, I encountered an error: {str(e)}')
+        yield 'error', {'requestId': request_id, 'error': str(e)}
+
+@donna_routes.route('/api/chat/<request_id>', methods=['GET'])
+@require_auth(allow_query_token=True)
+def get_chat_result(request_id):
+    """Poll a chat request, or follow it as Server-Sent Events.
+
+    JSON: {status: queued|running|completed|error, response, actions, cached}.
+    With Accept: text/event-stream the events so far are replayed, then
+    the rest are sent as they happen, like /api/chat/stream.
+    """
+    try:
+        user_id = g.user_id
+        job = chat_jobs.get(request_id)
+        if job is not None and job.user_id != user_id:
+            job = None
+        result = job.snapshot() if job is not None else stored_chat_result(request_id, user_id)
+        if result is None:
+            return jsonify({'success': False, 'error': 'Chat request not found'}), 404
         
+        if request.accept_mimetypes.best_match(['application/json', 'text/event-stream']) == 'text/event-stream':
+            events = follow_chat_job(job) if job is not None else follow_stored_chat(request_id, user_id, result)
+            return Response(
+                stream_with_context(events),
+                mimetype='text/event-stream',
+                headers={
+                    'Cache-Control': 'no-cache',
+                    'X-Accel-Buffering': 'no'
+                }
+            )
+        
+        return jsonify({'success': True, **result}), 200
+    
+    except Exception as e:
+        chat_log.error("❌ Chat result error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/chat/history', methods=['GET'])
+# Keyset pagination for /api/chat/history: a cursor is "<created_at>,<id>"
+# of a message, so pages stay stable while new messages arrive.
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+HISTORY_COLUMNS = 'id, user_message, donna_response, created_at'
+# ?after= pages stop at a reply still being generated, unless it has been
+# 'processing' this long (its worker died) and will never complete
+HISTORY_PENDING_WINDOW = timedelta(minutes=2)
+
+def postgrest_quote(value):
+    """Double-quote a value for a PostgREST or=(...) filter"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def history_cursor(message):
+    return f"{message['created_at']},{message['id']}"
+
+def parse_history_cursor(value):
+    """'<created_at>,<id>' -> (created_at, id), or None"""
+    created_at, _, message_id = (value or '').partition(',')
+    if not created_at or not message_id or parse_sync_cursor(created_at) is None:
+        return None
+    return created_at, message_id
+
+def keyset_filter(cursor, op):
+    """Rows strictly before (op='lt') or after (op='gt') a (created_at, id) cursor"""
+    created_at, message_id = map(postgrest_quote, cursor)
+    return f"created_at.{op}.{created_at},and(created_at.eq.{created_at},id.{op}.{message_id})"
+
+@donna_routes.route('/api/chat/history', methods=['GET'])
+@require_auth
 def get_chat_history():
-    """Get chat history"""
+    """Get chat history, newest page first.
+
+    ?limit=N (default 50) returns the newest N messages; ?before=<cursor>
+    pages back from there and ?after=<cursor> returns only messages newer
+    than the cursor, which is what the pages poll with. Messages are
+    always oldest first within a page.
+    """
     try:
-        user = get_current_user()
-        if not user:
-            print("❌ Chat history: Unauthorized")
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        user_id = g.user_id
+        try:
+            limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit must be a number'}), 400
         
-        user_id = str(user.get('user_id'))
+        before = after = None
+        if request.args.get('before'):
+            before = parse_history_cursor(request.args['before'])
+            if before is None:
+                return jsonify({'success': False, 'error': 'Invalid before cursor'}), 400
+        elif request.args.get('after'):
+            after = parse_history_cursor(request.args['after'])
+            if after is None:
+                return jsonify({'success': False, 'error': 'Invalid after cursor'}), 400
         
-        result = supabase.table('messages')\
-            .select('*')\
-            .eq('user_id', user_id)\
-            .eq('status', 'completed')\
-            .order('created_at', desc=False)\
-            .limit(50)\
-            .execute()
+        query = supabase.table('messages')\
+            .select(HISTORY_COLUMNS if after is None else HISTORY_COLUMNS + ', status')\
+            .eq('user_id', user_id)
+        if after is None:
+            query = query.eq('status', 'completed')
+            if before is not None:
+                query = query.or_(keyset_filter(before, 'lt'))
+            query = query.order('created_at', desc=True).order('id', desc=True)
+        else:
+            # Processing rows are fetched too so the page can stop short of
+            # them; otherwise a reply that finishes late would be skipped
+            query = query.in_('status', ['completed', 'processing'])\
+                .or_(keyset_filter(after, 'gt'))\
+                .order('created_at', desc=False)\
+                .order('id', desc=False)
         
-        messages = []
-        for msg in result.data:
-            messages.append({
-                'user_message': msg.get('user_message'),
-                'donna_response': msg.get('donna_response')
-            })
+        # One extra row tells whether there is another page
+        with stage_timer('messages_select'):
+            rows = query.limit(limit + 1).execute().data or []
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        if after is None:
+            rows.reverse()
+        else:
+            completed = []
+            stale_before = datetime.now(timezone.utc) - HISTORY_PENDING_WINDOW
+            for row in rows:
+                if row.pop('status') == 'completed':
+                    completed.append(row)
+                elif (parse_sync_cursor(row.get('created_at')) or stale_before) > stale_before:
+                    has_more = True
+                    break
+            rows = completed
+        
+        messages = [{
+            'id': row.get('id'),
+            'user_message': row.get('user_message'),
+            'donna_response': row.get('donna_response'),
+            'created_at': row.get('created_at')
+        } for row in rows]
+        
+        if messages:
+            cursors = {'before': history_cursor(messages[0]), 'after': history_cursor(messages[-1])}
+        else:
+            # An empty page hands back the cursors it was given
+            cursors = {'before': request.args.get('before'), 'after': request.args.get('after')}
         
-        print(f"✅ Chat history: {len(messages)} messages for {user.get('username')}")
-        return jsonify({'success': True, 'messages': messages}), 200
+        chat_log.debug("✅ Chat history: %d messages for %s", len(messages), g.user.get('username'))
+        return jsonify({
+            'success': True,
+            'messages': messages,
+            'cursor': cursors,
+            'has_more': has_more
+        }), 200
     
     except Exception as e:
-        print(f"❌ Chat history error: {e}")
+        chat_log.error("❌ Chat history error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== DELTA SYNC HELPERS ====================
+# GET /api/tasks and /api/calendar/events answer conditional requests
+# (ETag / If-None-Match -> 304) and ?since=<cursor> delta requests that
+# return only rows changed since the cursor plus tombstones for deleted ids.
+# Needs migrations/001_delta_sync.sql; without it full lists are returned.
+
+# Cursors trail the clock by this much so rows whose transactions commit a
+# little late (or small app/database clock skew) aren't skipped. Clients
+# merge by id, so a row arriving twice is harmless.
+SYNC_OVERLAP = timedelta(seconds=5)
+TOMBSTONE_RETENTION = timedelta(days=int(os.getenv('TOMBSTONE_RETENTION_DAYS', 7)))
+delta_sync_enabled = True
+
+# Postgres trims trailing zeros from the fraction ('10:11:56.12345+00:00'),
+# and Python 3.9's fromisoformat() only takes 3 or 6 digits
+ISO_FRACTION_RE = re.compile(r'(?<=:\d\d)\.(\d+)')
+
+def parse_iso_timestamp(value):
+    """datetime.fromisoformat() for timestamps as Postgres writes them, any fraction length"""
+    value = ISO_FRACTION_RE.sub(lambda m: '.' + m.group(1)[:6].ljust(6, '0'), value.replace('Z', '+00:00'), 1)
+    return datetime.fromisoformat(value)
+
+def parse_sync_cursor(value):
+    """Cursor (a UTC ISO timestamp) -> aware datetime, or None"""
+    try:
+        cursor = parse_iso_timestamp(value)
+    except (AttributeError, ValueError):
+        return None
+    if cursor.tzinfo is None:
+        cursor = cursor.replace(tzinfo=timezone.utc)
+    return cursor
+
+def next_sync_cursor(since=None):
+    """Cursor for the next poll; never moves backwards"""
+    cursor = datetime.now(timezone.utc) - SYNC_OVERLAP
+    if since is not None and since > cursor:
+        cursor = since
+    # 'Z' keeps it URL-safe ('+00:00' would turn into a space)
+    return cursor.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+def can_delta_sync(since):
+    """Deltas need the migration and a cursor younger than the tombstones"""
+    return delta_sync_enabled and since is not None and \
+        since > datetime.now(timezone.utc) - TOMBSTONE_RETENTION
+
+def fetch_changes(table, user_id, since):
+    """Rows updated and ids deleted after ``since``"""
+    after = since.isoformat()
+    
+    def changed_rows():
+        with stage_timer(f'{table}_changes'):
+            return supabase.table(table).select('*').eq('user_id', user_id).gt('updated_at', after).execute()
+    
+    def tombstones():
+        with stage_timer(f'{table}_tombstones'):
+            return supabase.table('sync_tombstones')\
+                .select('row_id')\
+                .eq('user_id', user_id)\
+                .eq('table_name', table)\
+                .gt('deleted_at', after)\
+                .execute()
+    
+    rows_future = io_executor.submit(changed_rows)
+    tombstones_future = io_executor.submit(tombstones)
+    rows = rows_future.result(timeout=SUPABASE_CALL_TIMEOUT).data or []
+    tombstones = tombstones_future.result(timeout=SUPABASE_CALL_TIMEOUT).data or []
+    return rows, [t['row_id'] for t in tombstones]
+
+def disable_delta_sync(error):
+    global delta_sync_enabled
+    delta_sync_enabled = False
+    data_log.warning("⚠️ Delta sync disabled (run migrations/001_delta_sync.sql): %s", error)
+
+def sync_list_response(key, rows, cursor, deleted=None):
+    """JSON list response, answered with 304 when If-None-Match still matches.
+
+    The ETag covers the rows only, not the cursor: a client that gets a 304
+    keeps its previous cursor, which is still valid.
+    """
+    payload = {'success': True, key: rows, 'cursor': cursor, 'delta': deleted is not None}
+    if deleted is not None:
+        payload['deleted'] = deleted
+    response = jsonify(payload)
+    digest = hashlib.sha1(current_app.json.dumps_bytes([rows, deleted], sort_keys=True))
+    response.set_etag(digest.hexdigest())
+    return response.make_conditional(request)
+
+def delta_list_response(key, table, user_id):
+    """Answer a ?since= request, or None to fall back to a full list"""
+    since = parse_sync_cursor(request.args.get('since'))
+    if not can_delta_sync(since):
+        return None
+    
+    try:
+        rows, deleted = fetch_changes(table, user_id, since)
+    except Exception as e:
+        # A timeout (maybe just io_executor queueing) only costs this poll a full list
+        if is_missing_schema_error(e):
+            disable_delta_sync(e)
+        else:
+            data_log.warning("⚠️ %s delta failed, sending the full list: %s", key, e)
+        return None
+    
+    # Nothing changed: hand back the same cursor so idle polls stay 304s
+    if rows or deleted:
+        cursor = next_sync_cursor(since)
+        data_log.debug("✅ %s delta: %d changed, %d deleted", key, len(rows), len(deleted))
+    else:
+        cursor = request.args.get('since')
+    return sync_list_response(key, rows, cursor, deleted=deleted)
+
+# ==================== PUSH ROUTES ====================
+
+STREAM_HEARTBEAT_SECONDS = float(os.getenv('STREAM_HEARTBEAT_SECONDS', 15))
+STREAM_MAX_SECONDS = float(os.getenv('STREAM_MAX_SECONDS', 300))
+STREAM_RETRY_AFTER_SECONDS = 60
+
+@donna_routes.route('/api/events/token', methods=['POST'])
+@require_auth
+def stream_token():
+    """A stream token for opening /api/events/stream?token=..."""
+    return jsonify({
+        'success': True,
+        'token': create_stream_token(g.user),
+        'expiresIn': STREAM_TOKEN_SECONDS
+    })
+
+@donna_routes.route('/api/events/stream', methods=['GET'])
+@require_auth(allow_query_token=True)
+def change_stream():
+    """Push change notifications to the pages as Server-Sent Events.
+
+    Sends a 'change' event ({topic}) whenever the user's tasks, calendar or
+    chat messages change, and a keep-alive comment otherwise. Connections
+    are recycled after STREAM_MAX_SECONDS. Authenticated with a stream
+    token from POST /api/events/token, which expires quickly, so the pages
+    fetch a fresh one to reconnect. When the process is at MAX_STREAMS it answers 503 and the pages fall
+    back to polling.
+    """
+    user_id = g.user_id
+    try:
+        subscription = change_notifier.subscribe(user_id)
+    except StreamsFullError as e:
+        push_log.warning("⚠️ Push stream rejected for %s: %s", g.user.get('username'), e)
+        return jsonify({
+            'success': False,
+            'error': 'Live updates are busy, falling back to polling'
+        }), 503, {'Retry-After': str(STREAM_RETRY_AFTER_SECONDS)}
+    if subscription is None:
+        return jsonify({'success': False, 'error': 'Too many open streams'}), 429
+    
+    def generate():
+        try:
+            yield "retry: 5000\n" + sse_event('ready', {'topics': ['tasks', 'calendar', 'messages']})
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                topics = subscription.wait(STREAM_HEARTBEAT_SECONDS)
+                if not topics:
+                    yield ": keep-alive\n\n"
+                for topic in sorted(topics):
+                    yield sse_event('change', {'topic': topic})
+        finally:
+            change_notifier.unsubscribe(user_id, subscription)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 # ==================== TASK ROUTES ====================
 
-@app.route('/api/tasks', methods=['GET'])
+@donna_routes.route('/api/tasks', methods=['GET'])
+@require_auth
 def get_tasks():
-    """Get all tasks"""
+    """Get all tasks, or only changes with ?since=<cursor>"""
     try:
-        user = get_current_user()
-        if not user:
-            print("❌ Get tasks: Unauthorized")
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        user_id = g.user_id
         
-        user_id = str(user.get('user_id'))
+        delta = delta_list_response('tasks', 'tasks', user_id)
+        if delta is not None:
+            return delta
         
-        result = supabase.table('tasks')\
-            .select('*')\
-            .eq('user_id', user_id)\
-            .order('created_at', desc=False)\
-            .execute()
+        with stage_timer('tasks_select'):
+            result = supabase.table('tasks')\
+                .select('*')\
+                .eq('user_id', user_id)\
+                .order('created_at', desc=False)\
+                .execute()
+        tasks = result.data or []
         
-        print(f"✅ Tasks retrieved: {len(result.data or [])} for {user.get('username')}")
-        return jsonify({'success': True, 'tasks': result.data or []}), 200
+        data_log.debug("✅ Tasks retrieved: %d for %s", len(tasks), g.user.get('username'))
+        return sync_list_response('tasks', tasks, next_sync_cursor())
     
     except Exception as e:
-        print(f"❌ Get tasks error: {e}")
+        data_log.error("❌ Get tasks error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/tasks', methods=['POST'])
+@donna_routes.route('/api/tasks', methods=['POST'])
+@require_auth
+@idempotent('tasks')
 def create_task():
     """Create new task"""
     try:
-        user = get_current_user()
-        if not user:
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
-        
-        user_id = str(user.get('user_id'))
+        user_id = g.user_id
         data = request.json or {}
         
-        result = supabase.table('tasks').insert({
-            'user_id': user_id,
-            'title': data.get('title', 'Task'),
-            'description': data.get('description', ''),
-            'priority': data.get('priority', 'medium'),
-            'due_date': data.get('due_date'),
-            'completed': False,
-            'created_at': datetime.utcnow().isoformat()
-        }).execute()
+        with stage_timer('tasks_insert'):
+            result = supabase.table('tasks').insert({
+                'user_id': user_id,
+                'title': data.get('title', 'Task'),
+                'description': data.get('description', ''),
+                'priority': data.get('priority', 'medium'),
+                'due_date': data.get('due_date'),
+                'completed': False,
+                'created_at': datetime.utcnow().isoformat()
+            }).execute()
+        notify_change(user_id, 'tasks')
         
-        print(f"✅ Task created: {data.get('title')}")
+        data_log.info("✅ Task created: %s", data.get('title'))
         return jsonify({'success': True, 'task': result.data[0] if result.data else {}}), 201
     
     except Exception as e:
-        print(f"❌ Create task error: {e}")
+        data_log.error("❌ Create task error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/tasks/<task_id>', methods=['PUT'])
+@donna_routes.route('/api/tasks/<task_id>', methods=['PUT'])
+@require_auth
 def update_task(task_id):
     """Update task"""
     try:
-        user = get_current_user()
-        if not user:
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
-        
-        user_id = str(user.get('user_id'))
+        user_id = g.user_id
         data = request.json or {}
         
-        supabase.table('tasks').update({
-            'completed': data.get('completed', True)
-        }).eq('id', task_id).eq('user_id', user_id).execute()
+        with stage_timer('tasks_update'):
+            supabase.table('tasks').update({
+                'completed': data.get('completed', True)
+            }).eq('id', task_id).eq('user_id', user_id).execute()
+        notify_change(user_id, 'tasks')
         
-        print(f"✅ Task updated: {task_id}")
+        data_log.info("✅ Task updated: %s", task_id)
         return jsonify({'success': True}), 200
     
     except Exception as e:
-        print(f"❌ Update task error: {e}")
+        data_log.error("❌ Update task error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/tasks/<task_id>', methods=['DELETE'])
+@donna_routes.route('/api/tasks/<task_id>', methods=['DELETE'])
+@require_auth
 def delete_task(task_id):
     """Delete task"""
     try:
-        user = get_current_user()
-        if not user:
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        user_id = g.user_id
         
-        user_id = str(user.get('user_id'))
+        with stage_timer('tasks_delete'):
+            supabase.table('tasks').delete().eq('id', task_id).eq('user_id', user_id).execute()
+        notify_change(user_id, 'tasks')
         
-        supabase.table('tasks').delete().eq('id', task_id).eq('user_id', user_id).execute()
-        
-        print(f"✅ Task deleted: {task_id}")
+        data_log.info("✅ Task deleted: %s", task_id)
         return jsonify({'success': True}), 200
     
     except Exception as e:
-        print(f"❌ Delete task error: {e}")
+        data_log.error("❌ Delete task error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # ==================== CALENDAR ROUTES ====================
 
-@app.route('/api/calendar/events', methods=['GET'])
+@donna_routes.route('/api/calendar/events', methods=['GET'])
+@require_auth
 def get_calendar_events():
-    """Get calendar events"""
+    """Get calendar events, or only changes with ?since=<cursor>.
+    
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD returns just the events in that window,
+    with recurring events expanded into one entry per occurrence.
+    """
     try:
-        user = get_current_user()
-        if not user:
-            print("❌ Get events: Unauthorized")
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        user_id = g.user_id
         
-        user_id = str(user.get('user_id'))
+        if request.args.get('from') or request.args.get('to'):
+            window_start = parse_day(request.args.get('from'))
+            window_end = parse_day(request.args.get('to'))
+            if window_start is None or window_end is None or window_end < window_start:
+                return jsonify({'success': False, 'error': 'from and to must be dates (YYYY-MM-DD), from <= to'}), 400
+            if (window_end - window_start).days > MAX_WINDOW_DAYS:
+                return jsonify({'success': False, 'error': f'Windows can span at most {MAX_WINDOW_DAYS} days'}), 400
+            
+            events = fetch_events_in_window(user_id, window_start, window_end)
+            data_log.debug("✅ Events %s..%s: %d for %s", window_start, window_end, len(events), g.user.get('username'))
+            return sync_list_response('events', events, None)
         
-        result = supabase.table('calendar_events')\
-            .select('*')\
-            .eq('user_id', user_id)\
-            .order('date', desc=False)\
-            .execute()
+        delta = delta_list_response('events', 'calendar_events', user_id)
+        if delta is not None:
+            return delta
         
-        print(f"✅ Events retrieved: {len(result.data or [])} for {user.get('username')}")
-        return jsonify({'success': True, 'events': result.data or []}), 200
+        with stage_timer('calendar_events_select'):
+            result = supabase.table('calendar_events')\
+                .select('*')\
+                .eq('user_id', user_id)\
+                .order('date', desc=False)\
+                .execute()
+        events = result.data or []
+        
+        data_log.debug("✅ Events retrieved: %d for %s", len(events), g.user.get('username'))
+        return sync_list_response('events', events, next_sync_cursor())
     
     except Exception as e:
-        print(f"❌ Get events error: {e}")
+        data_log.error("❌ Get events error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/calendar/events', methods=['POST'])
+@donna_routes.route('/api/calendar/events', methods=['POST'])
+@require_auth
+@idempotent('calendar_events')
 def create_calendar_event():
     """Create calendar event"""
     try:
-        user = get_current_user()
-        if not user:
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
-        
-        user_id = str(user.get('user_id'))
+        user_id = g.user_id
         data = request.json or {}
         
         date = data.get('date', datetime.now().strftime('%Y-%m-%d'))
         time = data.get('time', '00:00')
         
-        result = supabase.table('calendar_events').insert({
+        event = {
             'user_id': user_id,
             'title': data.get('title', 'Event'),
             'description': data.get('description', ''),
@@ -746,24 +4399,30 @@ def create_calendar_event():
             'start_time': data.get('start_time', f"{date}T{time}:00"),
             'end_time': data.get('end_time', f"{date}T{time}:00"),
             'created_at': datetime.utcnow().isoformat()
-        }).execute()
+        }
+        if data.get('recurrence'):
+            try:
+                event.update(recurrence_fields(data['recurrence'], date))
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
         
-        print(f"✅ Event created: {data.get('title')}")
+        with stage_timer('calendar_events_insert'):
+            result = supabase.table('calendar_events').insert(event).execute()
+        notify_change(user_id, 'calendar')
+        
+        data_log.info("✅ Event created: %s", data.get('title'))
         return jsonify({'success': True, 'event': result.data[0] if result.data else {}}), 201
     
     except Exception as e:
-        print(f"❌ Create event error: {e}")
+        data_log.error("❌ Create event error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/calendar/events/<event_id>', methods=['PUT'])
+@donna_routes.route('/api/calendar/events/<event_id>', methods=['PUT'])
+@require_auth
 def update_calendar_event(event_id):
     """Update calendar event"""
     try:
-        user = get_current_user()
-        if not user:
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
-        
-        user_id = str(user.get('user_id'))
+        user_id = g.user_id
         data = request.json or {}
         
         update_data = {}
@@ -779,89 +4438,259 @@ def update_calendar_event(event_id):
             update_data['start_time'] = data['start_time']
         if 'end_time' in data:
             update_data['end_time'] = data['end_time']
+        if 'recurrence' in data:
+            if data['recurrence'] and 'date' not in data:
+                return jsonify({'success': False, 'error': 'date is required when setting recurrence'}), 400
+            try:
+                update_data.update(recurrence_fields(data['recurrence'], data.get('date')))
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
         
-        supabase.table('calendar_events').update(update_data)\
-            .eq('id', event_id)\
-            .eq('user_id', user_id)\
-            .execute()
+        with stage_timer('calendar_events_update'):
+            supabase.table('calendar_events').update(update_data)\
+                .eq('id', event_id)\
+                .eq('user_id', user_id)\
+                .execute()
+        notify_change(user_id, 'calendar')
         
-        print(f"✅ Event updated: {event_id}")
+        data_log.info("✅ Event updated: %s", event_id)
         return jsonify({'success': True}), 200
     
     except Exception as e:
-        print(f"❌ Update event error: {e}")
+        data_log.error("❌ Update event error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/calendar/events/<event_id>', methods=['DELETE'])
+@donna_routes.route('/api/calendar/events/<event_id>', methods=['DELETE'])
+@require_auth
 def delete_calendar_event(event_id):
     """Delete calendar event"""
     try:
-        user = get_current_user()
-        if not user:
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
-        
-        user_id = str(user.get('user_id'))
+        user_id = g.user_id
         
-        supabase.table('calendar_events').delete()\
-            .eq('id', event_id)\
-            .eq('user_id', user_id)\
-            .execute()
+        with stage_timer('calendar_events_delete'):
+            supabase.table('calendar_events').delete()\
+                .eq('id', event_id)\
+                .eq('user_id', user_id)\
+                .execute()
+        notify_change(user_id, 'calendar')
         
-        print(f"✅ Event deleted: {event_id}")
+        data_log.info("✅ Event deleted: %s", event_id)
         return jsonify({'success': True}), 200
     
     except Exception as e:
-        print(f"❌ Delete event error: {e}")
+        data_log.error("❌ Delete event error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # ==================== HEALTH & DEBUG ROUTES ====================
 
-@app.route('/api/health', methods=['GET'])
-@app.route('/health', methods=['GET'])
+@donna_routes.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@donna_routes.after_app_request
+def record_request_metrics(response):
+    """Count every request and time it until its headers are ready"""
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    started = g.get('request_started')
+    if started is not None:
+        metrics.observe('donna_http_request_seconds', time.perf_counter() - started, endpoint=endpoint)
+    metrics.inc('donna_http_requests_total', endpoint=endpoint, method=request.method, status=str(response.status_code))
+    if response.status_code >= 500:
+        metrics.inc('donna_http_errors_total', endpoint=endpoint)
+    return response
+
+def collect_component_metrics():
+    """Export the stats the LLM client, caches, hash pool, push channel, chat queue, summarizer, idempotency cache and logger already keep"""
+    llm = llm_client.stats()
+    context = context_cache.stats()
+    responses = response_cache.stats()
+    tokens = token_cache.stats()
+    unknown = unknown_logins.stats()
+    hashing = password_hasher.stats()
+    push = change_notifier.stats()
+    jobs = chat_jobs.stats()
+    summaries = conversation_summarizer.stats()
+    idempotency = idempotency_cache.stats()
+    return [
+        ('donna_llm_tokens_total', 'counter', 'LLM tokens reported by OpenRouter.',
+         [({'kind': 'prompt'}, llm['prompt_tokens']), ({'kind': 'completion'}, llm['completion_tokens'])]),
+        ('donna_llm_calls_total', 'counter', 'OpenRouter calls, retries, failures and hedges.',
+         [({'outcome': 'call'}, llm['calls']), ({'outcome': 'retry'}, llm['retries']),
+          ({'outcome': 'failure'}, llm['failures']), ({'outcome': 'hedge'}, llm['hedges_sent'])]),
+        ('donna_llm_circuit_open', 'gauge', '1 while the OpenRouter circuit breaker is open.',
+         [({}, llm['circuit'] == 'open')]),
+        ('donna_cache_hits_total', 'counter', 'Cache hits.',
+         [({'cache': 'context'}, context['hits']), ({'cache': 'response'}, responses['hits']),
+          ({'cache': 'token'}, tokens['hits']), ({'cache': 'unknown_login'}, unknown['hits'])]),
+        ('donna_cache_misses_total', 'counter', 'Cache misses.',
+         [({'cache': 'context'}, context['misses']), ({'cache': 'response'}, responses['misses']),
+          ({'cache': 'token'}, tokens['misses']), ({'cache': 'unknown_login'}, unknown['misses'])]),
+        ('donna_password_hashes_pending', 'gauge', 'Password hashes running or waiting for a core.',
+         [({}, hashing['pending'])]),
+        ('donna_password_hashes_rejected_total', 'counter', 'Sign-ins answered 503 because the hash pool was full.',
+         [({}, hashing['rejected'])]),
+        ('donna_push_streams', 'gauge', 'Open change notification streams.', [({}, push['streams'])]),
+        ('donna_push_streams_rejected_total', 'counter', 'Change notification streams refused at MAX_STREAMS.',
+         [({}, push['rejected'])]),
+        ('donna_chat_queue_depth', 'gauge', 'Chat jobs waiting for a worker.', [({}, jobs['queued'])]),
+        ('donna_chat_jobs_running', 'gauge', 'Chat jobs being processed.', [({}, jobs['running'])]),
+        ('donna_chat_jobs_total', 'counter', 'Chat jobs by outcome.',
+         [({'outcome': 'submitted'}, jobs['submitted']), ({'outcome': 'rejected'}, jobs['rejected']),
+          ({'outcome': 'completed'}, jobs['completed']), ({'outcome': 'failed'}, jobs['failed'])]),
+        ('donna_summary_refreshes_total', 'counter', 'Conversation summary refreshes by outcome.',
+         [({'outcome': 'refreshed'}, summaries['refreshed']), ({'outcome': 'failed'}, summaries['failed'])]),
+        ('donna_summary_turns_folded_total', 'counter', 'Chat turns folded into conversation summaries.',
+         [({}, summaries['turns_folded'])]),
+        ('donna_idempotent_requests_total', 'counter', 'Requests with an Idempotency-Key, by what happened to them.',
+         [({'outcome': 'executed'}, idempotency['executed']), ({'outcome': 'coalesced'}, idempotency['coalesced']),
+          ({'outcome': 'replayed'}, idempotency['replayed']), ({'outcome': 'rejected'}, idempotency['rejected'])]),
+        ('donna_log_records_dropped_total', 'counter', 'Log records dropped because the log queue was full.',
+         [({}, logging_stats()['dropped'])])
+    ]
+
+metrics.add_collector(collect_component_metrics)
+
+@donna_routes.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@donna_routes.route('/api/health', methods=['GET'])
+@donna_routes.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'success': True,
         'status': 'healthy',
-        'timestamp': datetime.utcnow().isoformat()
+        'timestamp': datetime.utcnow().isoformat(),
+        'context_cache': context_cache.stats(),
+        'response_cache': response_cache.stats(),
+        'llm': llm_client.stats(),
+        'push': change_notifier.stats(),
+        'chat_queue': chat_jobs.stats(),
+        'conversation_summary': conversation_summarizer.stats(),
+        'auth': token_cache.stats(),
+        'unknown_logins': unknown_logins.stats(),
+        'static_assets': static_assets.stats(),
+        'idempotency': idempotency_cache.stats(),
+        'startup': {'warmup': warmup_status, 'supabase_client': supabase.ready},
+        'encoding': {'json': 'orjson' if orjson is not None else 'stdlib',
+                     'compression': ['br', 'gzip'] if brotli is not None else ['gzip']},
+        'password_hashing': password_hasher.stats(),
+        'logging': logging_stats(),
+        'stages': metrics.summary('donna_stage_seconds', 'stage'),
+        'endpoints': metrics.summary('donna_http_request_seconds', 'endpoint')
     }), 200
 
-@app.errorhandler(404)
+@donna_routes.app_errorhandler(404)
 def not_found(e):
     return jsonify({'success': False, 'error': 'Not found'}), 404
 
-@app.errorhandler(500)
+@donna_routes.app_errorhandler(500)
 def internal_error(e):
     return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
+# ==================== APP FACTORY ====================
+# Importing this module, and create_app(), only define things: no client
+# is created and no network is touched. Once the app is served, unless
+# WARMUP=false, start_warmup() runs warmup() in a background thread so the
+# next requests find the imports done, connections open and pages
+# rendered. The first request starts it (a platform health check usually),
+# or asgi.py's startup, or the __main__ block below.
+
+WARMUP_ENABLED = os.getenv('WARMUP', 'true').lower() == 'true'
+warmup_status = {'state': 'off', 'seconds': None, 'failed': []}
+_warmup_lock = threading.Lock()
+
+def warm_supabase():
+    """Create the client and open its pooled connection to PostgREST"""
+    supabase.table('users').select('id').limit(1).execute()
+
+def warmup(app):
+    """Do the first request's one-off work ahead of it; failures only cost that head start"""
+    started = time.perf_counter()
+    warmup_status['state'] = 'running'
+    steps = (
+        ('supabase', warm_supabase),
+        ('jwt', lambda: __import__('jwt')),
+        ('openrouter', llm_client.warm),
+        ('pages', lambda: prerender_pages(app))
+    )
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            warmup_status['failed'].append(name)
+            log.warning("⚠️ Warmup step %s failed: %s", name, e)
+    warmup_status['seconds'] = round(time.perf_counter() - started, 3)
+    warmup_status['state'] = 'done'
+    log.info("🔥 Warmup done in %.0fms (%d pages, %d static assets)", warmup_status['seconds'] * 1000,
+             len(page_shells), static_assets.stats()['files'])
+
+def start_warmup(app):
+    """Start warmup(app) in the background, once per process"""
+    if not WARMUP_ENABLED or warmup_status['state'] != 'off':
+        return
+    with _warmup_lock:
+        if warmup_status['state'] != 'off':
+            return
+        warmup_status['state'] = 'pending'
+    threading.Thread(target=warmup, args=(app,), name='donna-warmup', daemon=True).start()
+
+def create_app():
+    """Build the Flask app around the donna blueprint"""
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.secret_key = SECRET_KEY
+    app.register_blueprint(donna_routes)
+    
+    if not SUPABASE_URL or not SUPABASE_ANON_KEY:
+        log.warning("⚠️ SUPABASE_URL or SUPABASE_ANON_KEY is not set - database calls will fail")
+    log.info("🔧 Configuration loaded (OpenRouter key %s)", 'set' if OPENROUTER_API_KEY else 'MISSING')
+    log_banner(
+        log,
+        "🔧 CONFIGURATION LOADED",
+        f"✅ Supabase URL: {(SUPABASE_URL or 'MISSING')[:30]}...",
+        f"✅ Supabase Key: {(SUPABASE_ANON_KEY or 'MISSING')[:30]}...",
+        f"✅ OpenRouter Key: {'***' + OPENROUTER_API_KEY[-10:] if OPENROUTER_API_KEY else 'MISSING'}",
+        f"✅ Secret Key: {app.secret_key[:20]}..."
+    )
+    
+    if WARMUP_ENABLED:
+        app.before_request(lambda: start_warmup(app))
+    return app
+
+# gunicorn app:app and asgi.py use this instance
+app = create_app()
+
 # ==================== RUN APPLICATION ====================
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_ENV') == 'development' or os.getenv('FLASK_DEBUG') == 'True'
     
-    print("\n" + "="*80)
-    print("🚀 DONNA AI ASSISTANT - READY TO LAUNCH")
-    print("="*80)
-    print(f"🌐 Running on: http://localhost:{port}")
-    print(f"🔧 Debug mode: {debug}")
-    print(f"📅 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("")
-    print("📋 Available Routes:")
-    print(" GET / - Chat Interface")
-    print(" GET /login - Login Page")
-    print(" GET /tasks - Tasks Page")
-    print(" GET /calendar - Calendar Page")
-    print("")
-    print(" POST /api/auth/register - Register User")
-    print(" POST /api/auth/login - Login User")
-    print(" POST /api/chat - Chat with DONNA")
-    print(" GET /api/tasks - Get Tasks")
-    print(" GET /api/calendar/events - Get Events")
-    print("")
-    print("🔍 All requests will show detailed logs")
-    print("="*80 + "\n")
+    log.info("🚀 DONNA running on http://localhost:%s (debug=%s)", port, debug)
+    log_banner(
+        log,
+        "🚀 DONNA AI ASSISTANT - READY TO LAUNCH",
+        f"🌐 Running on: http://localhost:{port}",
+        f"🔧 Debug mode: {debug}",
+        f"📅 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        "",
+        "📋 Available Routes:",
+        " GET / - Chat Interface",
+        " GET /login - Login Page",
+        " GET /tasks - Tasks Page",
+        " GET /calendar - Calendar Page",
+        "",
+        " POST /api/auth/register - Register User",
+        " POST /api/auth/login - Login User",
+        " POST /api/chat - Chat with DONNA",
+        " GET /api/tasks - Get Tasks",
+        " GET /api/calendar/events - Get Events"
+    )
     
+    start_warmup(app)
     app.run(
         host='0.0.0.0',
         port=port,
@@ -0,0 +1,647 @@
+"""ASGI entry point: async chat routes in front of the Flask app.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 2
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --workers 2
+
+POST /api/chat and POST /api/chat/stream are served here by async
+handlers: Supabase through supabase's AsyncClient and OpenRouter through
+llm_client.astream(), so a chat waiting on the LLM costs a coroutine
+instead of a thread and one process can hold hundreds of them. Every
+other request (and queued chats, see "Prefer: respond-async") goes to the
+Flask app in app.py on a thread pool, so endpoints and responses are the
+same in both modes. Both share app.py's idempotency cache, so an
+Idempotency-Key is honoured whichever side serves a chat. Actions the LLM asks for are rare and run through
+app.py's synchronous code in a worker thread.
+
+benchmarks/bench_concurrency.py compares this mode with the gthread
+deployment in render.yaml.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import anyio
+from anyio import to_thread, from_thread
+from supabase import acreate_client
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import app as donna
+from app import chat_log, metrics, stage_timer
+
+WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 64))
+
+# ==================== ASYNC SUPABASE ====================
+
+_database = None
+
+async def database():
+    """The shared supabase AsyncClient, created at startup (or on first use without lifespan)"""
+    global _database
+    if _database is None:
+        _database = await acreate_client(donna.SUPABASE_URL, donna.SUPABASE_ANON_KEY)
+    return _database
+
+async def fetch_tasks(db, user_id):
+    with stage_timer('context_tasks'):
+        result = await db.table('tasks').select('*').eq('user_id', user_id).execute()
+    return result.data or []
+
+async def fetch_events_in_window(db, user_id, window_start, window_end, stage='calendar_events_window'):
+    """app.fetch_events_in_window() over the async client"""
+    start, end = window_start.isoformat(), window_end.isoformat()
+    if donna.recurrence_enabled:
+        try:
+            with stage_timer(stage):
+                result = await db.table('calendar_events')\
+                    .select('*')\
+                    .eq('user_id', user_id)\
+                    .or_(donna.events_window_filter(start, end))\
+                    .execute()
+            return donna.expand_events(result.data or [], window_start, window_end)
+        except Exception as e:
+            if not donna.is_missing_schema_error(e):
+                raise
+            donna.disable_recurrence(e)
+
+    with stage_timer(stage):
+        result = await db.table('calendar_events')\
+            .select('*')\
+            .eq('user_id', user_id)\
+            .gte('date', start)\
+            .lte('date', end)\
+            .order('date')\
+            .execute()
+    return result.data or []
+
+async def load_user_context(db, user_id):
+    """Cached context, or tasks and events loaded concurrently on a miss"""
+    cached = donna.context_cache.get(user_id)
+    if cached is not None:
+        return cached
+    cache_version = donna.context_cache.version(user_id)
+
+    try:
+        today = datetime.now().date()
+        tasks, events = await asyncio.wait_for(asyncio.gather(
+            fetch_tasks(db, user_id),
+            fetch_events_in_window(db, user_id, today, today + timedelta(days=donna.CONTEXT_EVENT_DAYS),
+                                   stage='context_events')
+        ), donna.SUPABASE_CALL_TIMEOUT)
+
+        result = donna.format_user_context(tasks, events, today)
+        donna.context_cache.set(user_id, result, version=cache_version)
+        return result
+
+    except asyncio.TimeoutError:
+        donna.data_log.warning("⚠️ User context timed out after %ss", donna.SUPABASE_CALL_TIMEOUT)
+        return donna.EMPTY_CONTEXT
+    except Exception as e:
+        donna.data_log.error("❌ Error getting user context: %s", e)
+        return donna.EMPTY_CONTEXT
+
+async def get_conversation_memory(db, user_id):
+    with stage_timer('conversation_memory'):
+        result = await asyncio.wait_for(db.table('messages')
+                                        .select(donna.HISTORY_COLUMNS)
+                                        .eq('user_id', user_id)
+                                        .eq('status', 'completed')
+                                        .order('created_at', desc=True)
+                                        .order('id', desc=True)
+                                        .limit(donna.MEMORY_RAW_TURNS)
+                                        .execute(), donna.SUPABASE_CALL_TIMEOUT)
+    return result.data or []
+
+async def get_conversation_summary(db, user_id):
+    if not donna.summaries_enabled:
+        return None
+    try:
+        with stage_timer('conversation_summary'):
+            result = await asyncio.wait_for(db.table('conversation_summaries')
+                                            .select(donna.SUMMARY_COLUMNS)
+                                            .eq('user_id', user_id)
+                                            .limit(1)
+                                            .execute(), donna.SUPABASE_CALL_TIMEOUT)
+    except Exception as e:
+        if not donna.is_missing_schema_error(e):
+            raise
+        donna.disable_summaries(e)
+        return None
+    return result.data[0] if result.data else None
+
+async def result_or_default(awaitable, default, label):
+    """app.result_or_default() for a task: ``default`` on error or timeout"""
+    try:
+        return await awaitable
+    except asyncio.TimeoutError:
+        donna.data_log.warning("⚠️ %s timed out after %ss", label, donna.SUPABASE_CALL_TIMEOUT)
+        return default
+    except Exception as e:
+        donna.data_log.error("❌ %s failed: %s", label, e)
+        return default
+
+async def store_chat_message(db, request_id, user_id, user_message):
+    with stage_timer('message_insert'):
+        await db.table('messages').insert(donna.new_message_row(request_id, user_id, user_message)).execute()
+
+async def mark_chat_failed(db, request_id, message):
+    """Record a failed reply on the messages row; best effort, even while cancelled"""
+    with anyio.CancelScope(shield=True):
+        try:
+            await db.table('messages').update({
+                'status': 'error',
+                'donna_response': message
+            }).eq('request_id', request_id).execute()
+        except Exception:
+            pass
+
+# ==================== ASYNC CHAT ====================
+
+async def prepare_chat(db, request_id, user_id, user_message):
+    """app.prepare_chat(): the insert, context, memory and summary run concurrently"""
+    local = donna.local_command(user_message) if donna.LOCAL_INTENTS_ENABLED else None
+    if local is not None:
+        await asyncio.wait_for(store_chat_message(db, request_id, user_id, user_message), donna.SUPABASE_CALL_TIMEOUT)
+        return None, None, local
+
+    insert = asyncio.ensure_future(store_chat_message(db, request_id, user_id, user_message))
+    memory = asyncio.ensure_future(get_conversation_memory(db, user_id))
+    summary = asyncio.ensure_future(get_conversation_summary(db, user_id))
+    try:
+        with stage_timer('user_context'):
+            user_context, context_data = await load_user_context(db, user_id)
+        chat_log.debug("🧠 Context: %d of %d tokens", context_data['tokens'], context_data['token_budget'])
+        local = (donna.local_query(user_message, context_data)
+                 if user_context and donna.LOCAL_INTENTS_ENABLED else None)
+        cache_key = donna.response_cache_key(user_id, user_message, user_context) if user_context else None
+        cached_response = donna.response_cache.get(cache_key) if cache_key and local is None else None
+        if local is not None or cached_response is not None:
+            memory.cancel()
+            summary.cancel()
+            await asyncio.wait_for(insert, donna.SUPABASE_CALL_TIMEOUT)
+            if local is not None:
+                return None, None, local
+            return None, cache_key, {'source': 'cache', 'response': cached_response, 'actions': []}
+
+        conversation_memory = donna.memory_messages(
+            await result_or_default(summary, None, 'Conversation summary'),
+            await result_or_default(memory, [], 'Conversation memory')
+        )
+        await asyncio.wait_for(insert, donna.SUPABASE_CALL_TIMEOUT)
+        return donna.build_chat_messages(user_context, conversation_memory, user_message), cache_key, None
+    except BaseException:
+        insert.cancel()
+        memory.cancel()
+        summary.cancel()
+        raise
+
+async def chat_events(db, request_id, user_id, messages, cache_key, reply, raise_errors=False):
+    """app.chat_events() as an async generator.
+
+    With ``raise_errors`` a failure is raised (after the row is marked
+    failed) instead of being sent as an 'error' event.
+    """
+    received = 0
+    scanner = donna.ActionScanner()
+
+    async def run_actions(batch):
+        if not batch:
+            return []
+        with stage_timer('actions'):
+            return await to_thread.run_sync(donna.execute_donna_actions, batch, user_id)
+
+    try:
+        if reply is not None:
+            chat_log.debug("⚡ Answered without the LLM (%s)", reply.get('intent') or reply['source'])
+            actions = reply['actions']
+            results, clean_response = await to_thread.run_sync(donna.carry_out_reply, reply, user_id)
+            for result in results:
+                yield 'action', result
+            yield 'token', {'text': clean_response}
+        else:
+            chat_log.debug("📡 Streaming from OpenRouter API...")
+            llm_started = time.perf_counter()
+            async for delta in donna.llm_client.astream(donna.openrouter_payload(messages, stream=True)):
+                if not received:
+                    metrics.observe('donna_stage_seconds', time.perf_counter() - llm_started, stage='llm_first_token')
+                received += len(delta)
+                visible, batch = scanner.feed(delta)
+                for result in await run_actions(batch):
+                    yield 'action', result
+                if visible:
+                    yield 'token', {'text': visible}
+
+            visible, batch = scanner.close()
+            for result in await run_actions(batch):
+                yield 'action', result
+            if visible:
+                yield 'token', {'text': visible}
+            metrics.observe('donna_stage_seconds', time.perf_counter() - llm_started, stage='llm')
+            chat_log.debug("✅ AI stream finished (%d chars)", received)
+
+            actions, clean_response = scanner.actions, scanner.text
+            if cache_key and not actions:
+                donna.response_cache.set(cache_key, clean_response)
+
+        with stage_timer('message_update'):
+            await db.table('messages').update({
+                'donna_response': clean_response,
+                'status': 'completed'
+            }).eq('request_id', request_id).execute()
+        await to_thread.run_sync(donna.notify_change, user_id, 'messages')
+        donna.conversation_summarizer.schedule(user_id)
+
+        chat_log.info("✅ Chat %s completed - %d actions executed", request_id, len(actions))
+        yield 'done', {
+            'requestId': request_id,
+            'response': clean_response,
+            'cached': bool(reply) and reply['source'] == 'cache',
+            'local': bool(reply) and reply['source'] == 'local'
+        }
+
+    except (GeneratorExit, anyio.get_cancelled_exc_class()):
+        chat_log.warning("⚠️ Chat stream closed by client: %s", request_id)
+        await mark_chat_failed(db, request_id, 'Sorry, the response was interrupted.')
+        raise
+
+    except Exception as e:
+        chat_log.exception("❌ Chat stream error: %s", e)
+        await mark_chat_failed(db, request_id, f'Sorry, I encountered an error: {str(e)}')
+        if raise_errors:
+            raise
+        yield 'error', {'requestId': request_id, 'error': str(e)}
+
+# ==================== REQUESTS & RESPONSES ====================
+
+class Request:
+    """The parts of an HTTP request the async handlers need"""
+
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.body = body
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {}
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').lower()
+            value = value.decode('latin-1')
+            self.headers[name] = f"{self.headers[name]}, {value}" if name in self.headers else value
+
+    def json(self):
+        try:
+            return json.loads(self.body or b'null') or {}
+        except ValueError:
+            return {}
+
+    def accepts_event_stream(self):
+        """Same choice app.chat() makes with request.accept_mimetypes"""
+        accept = parse_accept_header(self.headers.get('accept'), MIMEAccept)
+        return accept.best_match(['application/json', 'text/event-stream']) == 'text/event-stream'
+
+    def user(self):
+        """Claims of a valid Bearer token, or None"""
+        auth_header = self.headers.get('authorization', '')
+        if not auth_header.startswith('Bearer ') or not auth_header[7:].strip():
+            return None
+        return donna.verify_token(auth_header[7:].strip())
+
+async def send_json(send, payload, status=200, headers=None):
+    return await send_body(send, json.dumps(payload).encode(), status,
+                           [('Content-Type', 'application/json'), *(headers or {}).items()])
+
+async def send_body(send, body, status, headers):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-length', str(len(body)).encode())] +
+                   [(k.lower().encode(), str(v).encode()) for k, v in headers]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+    return status
+
+async def send_event_stream(send, receive, events, replayed=False):
+    """Send an async iterator of SSE strings, stopping early if the client goes away"""
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                    (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')] +
+                   ([(b'idempotent-replayed', b'true')] if replayed else [])
+    })
+
+    async with anyio.create_task_group() as tasks:
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            tasks.cancel_scope.cancel()
+
+        tasks.start_soon(watch_disconnect)
+        try:
+            async for chunk in events:
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await events.aclose()
+        tasks.cancel_scope.cancel()
+    return 200
+
+# ==================== ASYNC ROUTES ====================
+
+def wants_job_queue(request, data):
+    return bool(data.get('async')) or 'respond-async' in request.headers.get('prefer', '')
+
+async def claim_idempotency_key(request, user_id, scope):
+    """app.claim_idempotency_key() on a worker thread, since a repeated request waits there"""
+    return await to_thread.run_sync(donna.claim_idempotency_key, user_id, scope,
+                                    request.headers['idempotency-key'], request.body)
+
+async def follow_in_thread(events):
+    """Iterate a blocking generator of SSE strings without holding up the event loop"""
+    try:
+        while True:
+            chunk = await to_thread.run_sync(next, events, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        events.close()
+
+async def chat(request, receive, send):
+    """POST /api/chat, as app.chat()"""
+    data = request.json()
+    if wants_job_queue(request, data):
+        return None
+    if request.accepts_event_stream():
+        return await chat_stream(request, receive, send)
+
+    user = request.user()
+    if not user:
+        return await send_json(send, {'success': False, 'error': 'Unauthorized'}, 401)
+    user_id = str(user.get('user_id'))
+    user_message = data.get('message', '')
+    if not user_message:
+        return await send_json(send, {'success': False, 'error': 'Empty message'}, 400)
+
+    db = await database()
+    flight = None
+    if 'idempotency-key' in request.headers:
+        try:
+            idempotency_cache_key, flight, owner = await claim_idempotency_key(request, user_id, 'chat')
+        except donna.IdempotencyError as e:
+            return await send_json(send, {'success': False, 'error': str(e)}, e.status)
+        if not owner:
+            body, status, headers = flight.result
+            return await send_body(send, body, status, [*headers, ('Idempotent-Replayed', 'true')])
+
+    request_id = str(uuid.uuid4())
+    chat_log.info("💬 Chat request %s from %s (%d chars)", request_id, user.get('username'), len(user_message))
+    try:
+        messages, cache_key, reply = await prepare_chat(db, request_id, user_id, user_message)
+        actions, response = [], None
+        async for event, payload in chat_events(db, request_id, user_id, messages, cache_key, reply,
+                                                raise_errors=True):
+            if event == 'action':
+                actions.append(payload)
+            elif event == 'done':
+                response = payload['response']
+        body = json.dumps({
+            'success': True,
+            'requestId': request_id,
+            'response': response,
+            'actions': actions,
+            'cached': bool(reply) and reply['source'] == 'cache',
+            'local': bool(reply) and reply['source'] == 'local'
+        }).encode()
+        headers = [('Content-Type', 'application/json')]
+        if flight is not None:
+            donna.idempotency_cache.complete(flight, (body, 200, headers))
+        return await send_body(send, body, 200, headers)
+
+    except Exception as e:
+        chat_log.exception("❌ Chat error: %s", e)
+        if flight is not None:
+            donna.idempotency_cache.discard(idempotency_cache_key, flight)
+        await mark_chat_failed(db, request_id, f'Sorry, I encountered an error: {str(e)}')
+        # Fail fast with 503 while the OpenRouter circuit is open
+        status = 503 if isinstance(e, donna.CircuitOpenError) else 500
+        return await send_json(send, {'success': False, 'error': str(e)}, status)
+
+async def chat_stream(request, receive, send):
+    """POST /api/chat/stream, as app.chat_stream()"""
+    user = request.user()
+    if not user:
+        return await send_json(send, {'success': False, 'error': 'Unauthorized'}, 401)
+    user_id = str(user.get('user_id'))
+    user_message = request.json().get('message', '')
+    if not user_message:
+        return await send_json(send, {'success': False, 'error': 'Empty message'}, 400)
+
+    db = await database()
+    flight = None
+    if 'idempotency-key' in request.headers:
+        try:
+            idempotency_cache_key, flight, owner = await claim_idempotency_key(request, user_id, 'chat_stream')
+        except donna.IdempotencyError as e:
+            return await send_json(send, {'success': False, 'error': str(e)}, e.status)
+        if not owner:
+            chat_log.info("♻️ Chat %s followed by a repeated request", flight.result.request_id)
+            return await send_event_stream(send, receive, follow_in_thread(donna.follow_chat_job(flight.result)),
+                                           replayed=True)
+
+    request_id = str(uuid.uuid4())
+    chat_log.info("💬 Streaming chat request %s from %s (%d chars)", request_id, user.get('username'), len(user_message))
+    try:
+        messages, cache_key, reply = await prepare_chat(db, request_id, user_id, user_message)
+    except Exception as e:
+        chat_log.error("❌ Chat stream error: %s", e)
+        if flight is not None:
+            donna.idempotency_cache.discard(idempotency_cache_key, flight)
+        await mark_chat_failed(db, request_id, f'Sorry, I encountered an error: {str(e)}')
+        return await send_json(send, {'success': False, 'error': str(e)}, 500)
+
+    job = None
+    if flight is not None:
+        job = donna.start_idempotent_chat(idempotency_cache_key, flight, request_id, user_id, user_message)
+
+    async def generate():
+        events = chat_events(db, request_id, user_id, messages, cache_key, reply)
+        try:
+            yield donna.sse_event('start', {'requestId': request_id})
+            async for event, payload in events:
+                if job is not None:
+                    job.emit(event, payload)
+                yield donna.sse_event(event, payload)
+        finally:
+            await events.aclose()
+            if job is not None:
+                donna.finish_idempotent_chat(idempotency_cache_key, flight, job)
+
+    return await send_event_stream(send, receive, generate())
+
+ROUTES = {
+    ('POST', '/api/chat'): chat,
+    ('POST', '/api/chat/stream'): chat_stream,
+}
+
+# ==================== WSGI BRIDGE ====================
+
+class WsgiBridge:
+    """Serve a WSGI app from ASGI, each request on a worker thread.
+
+    The response body is iterated in that thread and every chunk is sent as
+    soon as it is produced, so the Flask SSE routes keep streaming. When the
+    client goes away the iterator is closed before its next chunk, like
+    under a WSGI server.
+    """
+
+    def __init__(self, wsgi_app, max_threads=64):
+        self.wsgi_app = wsgi_app
+        self.limiter = anyio.CapacityLimiter(max_threads)
+
+    async def __call__(self, scope, receive, send, body=None):
+        if body is None:
+            body = await read_body(receive)
+        environ = wsgi_environ(scope, body)
+        status = {}
+        disconnected = threading.Event()
+
+        def run():
+            def start_response(status_line, headers, exc_info=None):
+                status['code'] = int(status_line.split(' ', 1)[0])
+                status['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+            def flush_start():
+                if not status.get('started'):
+                    status['started'] = True
+                    from_thread.run(send, {'type': 'http.response.start', 'status': status['code'],
+                                           'headers': status['headers']})
+
+            iterable = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if disconnected.is_set():
+                        return
+                    if chunk:
+                        flush_start()
+                        from_thread.run(send, {'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                flush_start()
+                from_thread.run(send, {'type': 'http.response.body', 'body': b''})
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+
+        async with anyio.create_task_group() as tasks:
+            async def watch_disconnect():
+                while (await receive())['type'] != 'http.disconnect':
+                    pass
+                disconnected.set()
+
+            tasks.start_soon(watch_disconnect)
+            await to_thread.run_sync(run, limiter=self.limiter)
+            tasks.cancel_scope.cancel()
+        return status.get('code')
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+def wsgi_environ(scope, body):
+    """PEP 3333 environ for an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = name
+        else:
+            key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+# ==================== APPLICATION ====================
+
+class DonnaASGI:
+    """Routes the chat endpoints to the async handlers and the rest to Flask"""
+
+    def __init__(self, wsgi_app, routes):
+        self.wsgi = WsgiBridge(wsgi_app, max_threads=WSGI_THREADS)
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            await self.wsgi(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        body = await read_body(receive)
+        status = await handler(Request(scope, body), receive, send)
+        if status is None:
+            # The handler passed it on (a queued chat): Flask records its own metrics
+            await self.wsgi(scope, receive, send, body=body)
+            return
+
+        # What app.record_request_metrics() records for Flask routes
+        endpoint = scope['path']
+        metrics.observe('donna_http_request_seconds', time.perf_counter() - started, endpoint=endpoint)
+        metrics.inc('donna_http_requests_total', endpoint=endpoint, method=scope['method'], status=str(status))
+        if status >= 500:
+            metrics.inc('donna_http_errors_total', endpoint=endpoint)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await database()
+                except Exception as e:
+                    donna.data_log.error("❌ Async Supabase client failed to start: %s", e)
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                donna.start_warmup(donna.app)
+                donna.log_banner(donna.log, "⚡ ASGI MODE",
+                                 "Async: POST /api/chat, POST /api/chat/stream",
+                                 f"Flask (everything else): up to {WSGI_THREADS} threads")
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await donna.llm_client.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+app = DonnaASGI(donna.app, ROUTES)
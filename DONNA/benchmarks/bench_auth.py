@@ -0,0 +1,76 @@
+"""Per-request authentication cost: full JWT decode + logging vs the cached path.
+
+Run from the DONNA directory:  python benchmarks/bench_auth.py [iterations]
+Nothing is contacted; placeholder credentials are used when none are set.
+"""
+import contextlib
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import jwt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('SUPABASE_URL', 'http://127.0.0.1:54321')
+os.environ.setdefault('SUPABASE_ANON_KEY', jwt.encode({'role': 'anon'}, 'bench', algorithm='HS256'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import app as donna  # noqa: E402
+
+
+def legacy_get_current_user():
+    """The pre-cache implementation: decode and print on every request"""
+    auth_header = donna.request.headers.get('Authorization', '')
+    if not auth_header:
+        print("❌ No Authorization header")
+        return None
+    if not auth_header.startswith('Bearer '):
+        print("❌ Invalid Authorization header format")
+        return None
+    token = auth_header.replace('Bearer ', '').strip()
+    if not token:
+        print("❌ Empty token")
+        return None
+    try:
+        payload = jwt.decode(token, donna.app.secret_key, algorithms=['HS256'])
+        print(f"✅ Token decoded for user: {payload.get('username')}")
+        return payload
+    except jwt.InvalidTokenError as e:
+        print(f"❌ Invalid token: {e}")
+        return None
+
+
+def per_call_us(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    token = jwt.encode({
+        'user_id': 'bench-user',
+        'username': 'bench',
+        'email': 'bench@example.com',
+        'iat': datetime.utcnow(),
+        'exp': datetime.utcnow() + timedelta(days=30)
+    }, donna.app.secret_key, algorithm='HS256')
+
+    with donna.app.test_request_context(headers={'Authorization': f'Bearer {token}'}):
+        # Logs go wherever stdout goes in production (a pipe); /dev/null is the cheap case
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            before = per_call_us(legacy_get_current_user, iterations)
+        donna.get_current_user()  # warm the cache
+        after = per_call_us(donna.get_current_user, iterations)
+
+    print(f"iterations:            {iterations}")
+    print(f"decode + log (before): {before:8.2f} µs/request")
+    print(f"cached claims (after): {after:8.2f} µs/request")
+    print(f"speedup:               {before / after:8.1f}x")
+    print(f"token cache:           {donna.token_cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
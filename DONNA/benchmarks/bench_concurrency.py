@@ -0,0 +1,208 @@
+"""Concurrent chats per process: the gthread deployment vs asgi.py.
+
+Run from the DONNA directory:
+
+    python benchmarks/bench_concurrency.py --levels 16,32,64,128,256,512
+
+Starts FakeSupabase and FakeOpenRouter in a child process, then one server
+process per mode:
+
+    sync   gunicorn app:app --worker-class gthread --workers 1 --threads 32
+           (one of the two workers render.yaml runs)
+    async  uvicorn asgi:app --workers 1
+
+At each level that many POST /api/chat/stream requests are started at once
+and read to the end. A level passes when every chat completes and the p95
+time stays within --slo times the latency of a single chat on an idle
+server; the highest passing level is reported as the mode's max concurrent
+chats per process. Messages are unique write requests, so the response
+cache never answers them.
+
+Needs gunicorn and uvicorn (pip install gunicorn uvicorn). Nothing outside
+this machine is contacted.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DONNA_DIR = os.path.join(HERE, '..')
+sys.path.insert(0, HERE)
+
+from fakes import FAKE_ANON_KEY, FakeOpenRouter, FakeSupabase  # noqa: E402
+
+REPLY = ("Sure - I've noted that. You have a couple of things due this week, so let me know "
+         "if you'd like me to block some focus time on your calendar for them.")
+
+
+def serve_fakes(conn, supabase_latency_ms, llm_latency_ms, tokens_per_sec):
+    """Run both fakes in their own process so they don't share the client's GIL"""
+    supabase = FakeSupabase(latency_ms=supabase_latency_ms).start()
+    openrouter = FakeOpenRouter(latency_ms=llm_latency_ms, tokens_per_sec=tokens_per_sec, reply=REPLY).start()
+    conn.send((supabase.url, openrouter.url))
+    conn.recv()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_command(mode, port, threads):
+    if mode == 'sync':
+        return [sys.executable, '-m', 'gunicorn', 'app:app', '--worker-class', 'gthread', '--workers', '1',
+                '--threads', str(threads), '--timeout', '120', '--bind', f"127.0.0.1:{port}", '--log-level', 'warning']
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--workers', '1', '--port', str(port),
+            '--log-level', 'warning', '--backlog', '4096']
+
+
+def start_server(mode, port, threads, env):
+    process = subprocess.Popen(server_command(mode, port, threads), cwd=DONNA_DIR, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/health", timeout=1)
+            return process
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                raise SystemExit(f"{mode} server exited with {process.returncode}")
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"{mode} server did not start")
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def one_chat(client, base_url, headers, n):
+    """Seconds until the 'done' event, or None if the chat failed"""
+    started = time.perf_counter()
+    try:
+        async with client.stream('POST', f"{base_url}/api/chat/stream", headers=headers,
+                                 json={'message': f"remind me about item {n}"}) as response:
+            if response.status_code != 200:
+                return None
+            async for line in response.aiter_lines():
+                if line.startswith('event: done'):
+                    return time.perf_counter() - started
+                if line.startswith('event: error'):
+                    return None
+    except httpx.HTTPError:
+        return None
+    return None
+
+
+async def run_level(base_url, headers, concurrency, timeout):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one_chat(client, base_url, headers, n) for n in range(concurrency)))
+        wall = time.perf_counter() - started
+    completed = [r for r in results if r is not None]
+    return {
+        'concurrency': concurrency,
+        'completed': len(completed),
+        'failed': concurrency - len(completed),
+        'p50_s': round(percentile(completed, 0.50), 2) if completed else None,
+        'p95_s': round(percentile(completed, 0.95), 2) if completed else None,
+        'wall_s': round(wall, 2),
+        'chats_per_s': round(len(completed) / wall, 1)
+    }
+
+
+def login(base_url, mode):
+    username = f"bench_{mode}_{os.getpid()}"
+    httpx.post(f"{base_url}/api/auth/register", timeout=30, json={
+        'username': username, 'email': f"{username}@example.com", 'password': 'bench-pw'
+    }).raise_for_status()
+    response = httpx.post(f"{base_url}/api/auth/login", timeout=30,
+                          json={'username': username, 'password': 'bench-pw'})
+    response.raise_for_status()
+    return {'Authorization': f"Bearer {response.json()['token']}"}
+
+
+def benchmark_mode(mode, args, env):
+    port = free_port()
+    process = start_server(mode, port, args.threads, env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        headers = login(base_url, mode)
+        baseline = asyncio.run(run_level(base_url, headers, 1, args.timeout))['p50_s']
+        print(f"\n{mode}: single chat {baseline:.2f}s, SLO p95 <= {baseline * args.slo:.2f}s")
+        print(f"{'concurrent':>10} {'completed':>10} {'failed':>7} {'p50 s':>7} {'p95 s':>7} {'chats/s':>8}")
+        levels, best = [], 0
+        for concurrency in args.levels:
+            level = asyncio.run(run_level(base_url, headers, concurrency, args.timeout))
+            level['passed'] = level['failed'] == 0 and level['p95_s'] <= baseline * args.slo
+            levels.append(level)
+            print(f"{concurrency:>10} {level['completed']:>10} {level['failed']:>7} {level['p50_s'] or 0:>7.2f} "
+                  f"{level['p95_s'] or 0:>7.2f} {level['chats_per_s']:>8.1f}{'' if level['passed'] else '  over SLO'}")
+            if level['passed']:
+                best = concurrency
+        return {'single_chat_s': baseline, 'max_concurrent_chats': best, 'levels': levels}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--modes', default='sync,async')
+    parser.add_argument('--levels', default='16,32,64,128,256,512',
+                        type=lambda v: [int(x) for x in v.split(',') if x])
+    parser.add_argument('--threads', type=int, default=32, help='gthread threads of the sync worker')
+    parser.add_argument('--slo', type=float, default=1.5, help='allowed p95 as a multiple of a single chat')
+    parser.add_argument('--supabase-latency-ms', type=float, default=20)
+    parser.add_argument('--llm-latency-ms', type=float, default=500)
+    parser.add_argument('--tokens-per-sec', type=float, default=40)
+    parser.add_argument('--timeout', type=float, default=120, help='per-chat client timeout, seconds')
+    parser.add_argument('--output', help='write the JSON report here')
+    args = parser.parse_args()
+
+    conn, child_conn = multiprocessing.Pipe()
+    fakes = multiprocessing.Process(target=serve_fakes, daemon=True, args=(
+        child_conn, args.supabase_latency_ms, args.llm_latency_ms, args.tokens_per_sec))
+    fakes.start()
+    supabase_url, openrouter_url = conn.recv()
+    env = dict(
+        os.environ,
+        SUPABASE_URL=supabase_url,
+        SUPABASE_ANON_KEY=FAKE_ANON_KEY,
+        OPENROUTER_URL=openrouter_url,
+        OPENROUTER_API_KEY='sk-or-bench',
+        SECRET_KEY='bench-secret',
+        LOG_LEVEL=os.getenv('LOG_LEVEL', 'WARNING'),
+        OPENROUTER_POOL_SIZE=str(max(args.levels)),
+        OPENROUTER_ASYNC_POOL_SIZE=str(max(args.levels))
+    )
+
+    report = {}
+    try:
+        for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+            report[mode] = benchmark_mode(mode, args, env)
+    finally:
+        conn.send('stop')
+        fakes.join(timeout=5)
+
+    print()
+    for mode, result in report.items():
+        print(f"{mode:>6}: max concurrent chats per process = {result['max_concurrent_chats']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'modes': report}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Local intents: how many typical chat messages skip the LLM, and what deciding costs.
+
+Run from the DONNA directory:  python benchmarks/bench_intents.py [iterations]
+Nothing is contacted; placeholder credentials are used when none are set.
+Every message the local intents don't take still costs a full OpenRouter
+round trip (see loadtest.py for that latency). Exits with status 1 if a
+message in LLM_MESSAGES is answered locally, since a confident local
+reply that drops part of the message is worse than the round trip.
+"""
+import os
+import sys
+import time
+from datetime import date, datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from fakes import FAKE_ANON_KEY  # noqa: E402
+
+os.environ.setdefault('SUPABASE_URL', 'http://127.0.0.1:54321')
+os.environ.setdefault('SUPABASE_ANON_KEY', FAKE_ANON_KEY)
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import app as donna  # noqa: E402
+
+TODAY = date(2026, 3, 4)
+NOW = datetime(2026, 3, 4, 9, 0)
+
+CONTEXT = {
+    'active_tasks': [
+        {'title': f"Task {i}", 'priority': ('high', 'medium', 'low')[i % 3],
+         'due_date': f"2026-03-{(i % 27) + 1:02d}"} for i in range(25)
+    ],
+    'events': [
+        {'title': f"Event {i}", 'date': f"2026-03-{(i % 27) + 1:02d}", 'time': f"{9 + i % 8:02d}:00"}
+        for i in range(30)
+    ],
+}
+
+MESSAGES = [
+    "What's on my schedule today?",
+    "what do I have tomorrow?",
+    "Any overdue tasks?",
+    "What are my tasks?",
+    "How many meetings do I have this week?",
+    "what's next on my calendar",
+    "What's due Friday?",
+    "Remind me to buy groceries tomorrow at 2pm",
+    "Add a task to finish the report by Friday",
+    "Schedule a dentist appointment on March 12 at 10:30am",
+    "add lunch with Sam to my calendar Thursday at 1pm",
+    "remind me to call mom",
+]
+
+# Must be left to the LLM
+LLM_MESSAGES = [
+    "Hi Donna!",
+    "Can you help me plan my week so I have time to study?",
+    "Schedule a meeting with the team tomorrow",
+    "What should I focus on first?",
+    "Move my dentist appointment to next Tuesday",
+    "Remind me to water the plants every day",
+    # timing the parser can't pin down
+    "remind me to pay rent on the 1st",
+    "add a reminder to renew passport in march",
+    "remind me to call mom in an hour",
+    "remind me to check the oven in 5 minutes",
+    "add a task to call bob in 2 hours",
+    "remind me to renew my passport this summer",
+    "remind me to call the plumber at half past three",
+    "remind me to call grandma on christmas",
+    "add task submit the report by end of day",
+    "remind me to leave at 5:30",
+    # two commands in one message
+    "remind me to call mom at 2pm tomorrow and buy milk",
+    "remind me to call mom and buy milk tomorrow",
+    "add a task to pay rent friday & email the landlord",
+]
+
+
+def classify(message):
+    return donna.local_command(message, TODAY, NOW) or donna.local_query(message, CONTEXT, TODAY)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    local = 0
+    wrong = []
+    print(f"{'message':<58} {'intent':<14} {'decide':>9}")
+    for message in MESSAGES + LLM_MESSAGES:
+        reply = classify(message)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            classify(message)
+        per_call = (time.perf_counter() - start) / iterations * 1e6
+        local += reply is not None
+        if message in LLM_MESSAGES and reply is not None:
+            wrong.append(message)
+        print(f"{message:<58} {(reply or {}).get('intent', 'LLM'):<14} {per_call:>7.1f}µs")
+    print(f"\n{local} of {len(MESSAGES) + len(LLM_MESSAGES)} messages answered without the LLM")
+    if wrong:
+        print("Answered locally but should go to the LLM:\n  " + '\n  '.join(wrong))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""JSON serialization and compression cost of the list endpoints vs payload size.
+
+Run from the DONNA directory:  python benchmarks/bench_json.py [iterations]
+
+Builds task, calendar event and chat history lists shaped like the Supabase
+rows GET /api/tasks, /api/calendar/events and /api/chat/history return, and
+times, per list size:
+
+    stdlib   Flask's stock provider (json.dumps, sorted keys)
+    app      app.json, the provider jsonify() uses (orjson when installed)
+    gzip/br  compress_body() at the levels compress_response() uses
+
+Nothing is contacted; placeholder credentials are used when none are set.
+"""
+import gzip
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from flask.json.provider import DefaultJSONProvider
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from fakes import FAKE_ANON_KEY  # noqa: E402
+
+os.environ.setdefault('SUPABASE_URL', 'http://127.0.0.1:54321')
+os.environ.setdefault('SUPABASE_ANON_KEY', FAKE_ANON_KEY)
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import app as donna  # noqa: E402
+
+SIZES = (10, 100, 500, 2000)
+USER_ID = 'b1f8d3c2-5a7e-4c1d-9f3b-2e6a8d4c7b90'
+WORDS = ('review', 'quarterly', 'report', 'call', 'dentist', 'groceries', 'team', 'sync', 'draft',
+         'proposal', 'gym', 'pay', 'rent', 'book', 'flights', 'email', 'Sam', 'about', 'the', 'budget')
+START = datetime(2026, 3, 1, 9, 0)
+
+
+def sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize()
+
+
+def stamp(rng):
+    return (START + timedelta(minutes=rng.randrange(60 * 24 * 60))).isoformat() + '+00:00'
+
+
+def row_id(rng):
+    return '%08x-%04x-4%03x-%04x-%012x' % (rng.getrandbits(32), rng.getrandbits(16), rng.getrandbits(12),
+                                          rng.getrandbits(16), rng.getrandbits(48))
+
+
+def tasks(n, rng):
+    return {'success': True, 'delta': False, 'cursor': '2026-03-04T09:00:00.000000Z', 'tasks': [{
+        'id': row_id(rng), 'user_id': USER_ID, 'title': sentence(rng, rng.randint(2, 6)),
+        'description': sentence(rng, rng.randint(0, 18)), 'priority': rng.choice(('high', 'medium', 'low')),
+        'due_date': rng.choice((None, (START + timedelta(days=rng.randrange(60))).date().isoformat())),
+        'completed': rng.random() < 0.3, 'created_at': stamp(rng), 'updated_at': stamp(rng)
+    } for _ in range(n)]}
+
+
+def events(n, rng):
+    rows = []
+    for _ in range(n):
+        start = START + timedelta(days=rng.randrange(60), hours=rng.randrange(10))
+        rows.append({
+            'id': row_id(rng), 'user_id': USER_ID, 'title': sentence(rng, rng.randint(2, 5)),
+            'description': sentence(rng, rng.randint(0, 12)), 'date': start.date().isoformat(),
+            'time': start.strftime('%H:%M'), 'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=1)).isoformat(), 'recurrence': None,
+            'recurrence_until': None, 'created_at': stamp(rng), 'updated_at': stamp(rng)
+        })
+    return {'success': True, 'delta': False, 'cursor': '2026-03-04T09:00:00.000000Z', 'events': rows}
+
+
+def history(n, rng):
+    return {'success': True, 'has_more': True, 'cursor': {'before': stamp(rng), 'after': None}, 'messages': [{
+        'id': row_id(rng), 'user_message': sentence(rng, rng.randint(4, 20)) + '?',
+        'donna_response': sentence(rng, rng.randint(15, 80)) + '.', 'created_at': stamp(rng)
+    } for _ in range(n)]}
+
+
+def per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    stdlib = DefaultJSONProvider(donna.app)
+    fast = donna.app.json
+    encodings = ('gzip', 'br') if donna.brotli is not None else ('gzip',)
+    print(f"app.json uses {'orjson' if donna.orjson is not None else 'the stdlib encoder'}; "
+          f"gzip level {donna.DYNAMIC_GZIP_LEVEL}"
+          + (f", brotli quality {donna.DYNAMIC_BROTLI_QUALITY}" if donna.brotli is not None else ", brotli not installed"))
+    header = f"{'list':<8} {'rows':>5} {'bytes':>9} {'stdlib':>9} {'app':>9} {'speedup':>8}"
+    for encoding in encodings:
+        header += f" {encoding + ' bytes':>11} {encoding:>9}"
+    print(header)
+    rng = random.Random(7)
+    for name, build in (('tasks', tasks), ('events', events), ('history', history)):
+        for size in SIZES:
+            payload = build(size, rng)
+            body = fast.dumps_bytes(payload)
+            slow_us = per_call(lambda: stdlib.dumps(payload, separators=(',', ':')).encode(), iterations)
+            fast_us = per_call(lambda: fast.dumps_bytes(payload), iterations)
+            line = f"{name:<8} {size:>5} {len(body):>9} {slow_us:>7.0f}µs {fast_us:>7.0f}µs {slow_us / fast_us:>7.1f}x"
+            for encoding in encodings:
+                compressed = donna.compress_body(body, encoding)
+                line += f" {len(compressed):>11} {per_call(lambda: donna.compress_body(body, encoding), iterations):>7.0f}µs"
+            print(line)
+    level9_us = per_call(lambda: gzip.compress(body, compresslevel=9, mtime=0), max(1, iterations // 5))
+    print(f"\nbytes is the uncompressed body; times are per response. gzip level 9 (as used for static "
+          f"assets) takes {level9_us:.0f}µs on the last list.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Action extraction cost: the old parse + cleanup passes vs the single-pass ActionScanner.
+
+Run from the DONNA directory:  python benchmarks/bench_parser.py [iterations]
+Nothing is contacted; placeholder credentials are used when none are set.
+"""
+import json
+import os
+import re
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from fakes import FAKE_ANON_KEY  # noqa: E402
+
+os.environ.setdefault('SUPABASE_URL', 'http://127.0.0.1:54321')
+os.environ.setdefault('SUPABASE_ANON_KEY', FAKE_ANON_KEY)
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import app as donna  # noqa: E402
+
+
+# ---- the implementation ActionScanner replaced, without its logging ----
+
+def legacy_clean_title(title):
+    title = re.sub(r'["\']', '', title)
+    title = re.sub(r'\*+', '', title)
+    title = re.sub(r'\{[^}]*\}', '', title)
+    title = re.sub(r'\[[^\]]*\]', '', title)
+    title = re.sub(r'!+$', '', title)
+    title = re.sub(r'\s+', ' ', title).strip()
+    return title
+
+
+def legacy_parse_donna_actions(text):
+    actions = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if line.startswith('{') and '"action"' in line:
+            try:
+                obj = json.loads(line)
+                if "action" in obj:
+                    if 'title' in obj:
+                        obj['title'] = legacy_clean_title(obj['title'])
+                    actions.append(obj)
+            except json.JSONDecodeError:
+                continue
+    if len(actions) == 0:
+        for match in re.findall(r'\{[^{}]*"action"[^{}]*\}', text):
+            try:
+                obj = json.loads(match)
+                if "action" in obj:
+                    if 'title' in obj:
+                        obj['title'] = legacy_clean_title(obj['title'])
+                    actions.append(obj)
+            except json.JSONDecodeError:
+                continue
+    return actions
+
+
+def legacy_clean_donna_response(text):
+    clean_lines = []
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if stripped.startswith('{') and '"action"' in stripped:
+            continue
+        if stripped.startswith('```json') or stripped.startswith('```'):
+            continue
+        if stripped:
+            clean_lines.append(line)
+    clean_response = '\n'.join(clean_lines).strip()
+    clean_response = re.sub(r'\{[^{}]*"action"[^{}]*\}', '', clean_response)
+    clean_response = re.sub(r'\n{3,}', '\n\n', clean_response).strip()
+    return clean_response
+
+
+def legacy_pipeline(text):
+    actions = legacy_parse_donna_actions(text)
+    # The row builders cleaned every title a second time
+    for action in actions:
+        legacy_clean_title(action.get('title', ''))
+    return actions, legacy_clean_donna_response(text)
+
+
+# ---- workloads ----
+
+def action_lines(count):
+    return '\n'.join(json.dumps({
+        'action': 'create_task',
+        'title': f"**Follow up** with [team] about item {i}!",
+        'priority': 'medium',
+        'due_date': None
+    }) for i in range(count))
+
+
+def prose(paragraphs):
+    sentence = "You have a busy week ahead, so I've spread things out to leave room for focus time. "
+    return '\n\n'.join(sentence * 6 for _ in range(paragraphs))
+
+
+WORKLOADS = {
+    'typical (2 actions, 2 paragraphs)': action_lines(2) + '\n' + prose(2),
+    'large (40 actions, 30 paragraphs)': action_lines(40) + '\n' + prose(30),
+    'fenced (20 actions in ```json)': prose(3) + '\n```json\n' + action_lines(20) + '\n```\n' + prose(3),
+    'prose only (60 paragraphs)': prose(60),
+}
+
+
+def per_call_us(fn, text, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(text)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print(f"{'workload':<36} {'chars':>7} {'before':>10} {'after':>10} {'speedup':>8}")
+    for name, text in WORKLOADS.items():
+        before = per_call_us(legacy_pipeline, text, iterations)
+        after = per_call_us(donna.scan_donna_response, text, iterations)
+        print(f"{name:<36} {len(text):>7} {before:>8.1f}µs {after:>8.1f}µs {before / after:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Cold start: from launching a server process to its first served /health.
+
+Run from the DONNA directory:
+
+    python benchmarks/bench_startup.py --runs 5
+
+Each run starts a fresh Python process that imports app and serves it with
+werkzeug, and times:
+
+    import   importing app, measured inside the process
+    health   launching the process -> first 200 from GET /health
+    login    the first register + login, --gap-ms later (Supabase, JWT, hashing)
+    tasks    the first GET /api/tasks
+    page     the first GET /
+
+once with WARMUP=false and once with the background warmup on. --gap-ms
+stands for the time a browser spends loading the page before its first API
+call; warmup can only help within that gap. FakeSupabase
+and FakeOpenRouter run in a child process, so nothing outside this machine
+is contacted. To compare with another revision, point --app-dir at a
+checkout of it (e.g. from git worktree).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from fakes import FAKE_ANON_KEY, FakeOpenRouter, FakeSupabase  # noqa: E402
+
+RUNNER = """
+import sys, time
+started = time.perf_counter()
+sys.path.insert(0, {app_dir!r})
+import app
+print('imported', time.perf_counter() - started, flush=True)
+from werkzeug.serving import make_server
+make_server('127.0.0.1', {port}, app.app, threaded=True).serve_forever()
+"""
+
+
+def serve_fakes(conn, supabase_latency_ms):
+    """Run the fakes in their own process so they don't share the client's GIL"""
+    supabase = FakeSupabase(latency_ms=supabase_latency_ms).start()
+    openrouter = FakeOpenRouter(latency_ms=0).start()
+    conn.send((supabase.url, openrouter.url))
+    conn.recv()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def one_run(app_dir, env, username, gap):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', RUNNER.format(app_dir=app_dir, port=port)],
+                               cwd=app_dir, env=env, stdout=subprocess.PIPE, text=True)
+    try:
+        deadline = started + 60
+        while True:
+            try:
+                if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if process.poll() is not None or time.perf_counter() > deadline:
+                raise SystemExit(f"server in {app_dir} did not start")
+            time.sleep(0.005)
+        result = {'health_s': time.perf_counter() - started}
+        result['import_s'] = float(process.stdout.readline().split()[1])
+
+        headers = {}
+        time.sleep(gap)
+
+        def login():
+            httpx.post(f"{base_url}/api/auth/register", timeout=30, json={
+                'username': username, 'email': f"{username}@example.com", 'password': 'bench-pw'
+            }).raise_for_status()
+            response = httpx.post(f"{base_url}/api/auth/login", timeout=30,
+                                  json={'username': username, 'password': 'bench-pw'})
+            response.raise_for_status()
+            headers['Authorization'] = f"Bearer {response.json()['token']}"
+
+        result['login_s'] = timed(login)
+        result['tasks_s'] = timed(lambda: httpx.get(f"{base_url}/api/tasks", headers=headers, timeout=30)
+                                  .raise_for_status())
+        result['page_s'] = timed(lambda: httpx.get(f"{base_url}/", timeout=30).raise_for_status())
+        return result
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--app-dir', default=os.path.abspath(os.path.join(HERE, '..')),
+                        help='directory holding the app.py to start')
+    parser.add_argument('--gap-ms', type=float, default=500, help='pause between /health and the first login')
+    parser.add_argument('--supabase-latency-ms', type=float, default=20)
+    parser.add_argument('--output', help='write the JSON report here')
+    args = parser.parse_args()
+
+    conn, child_conn = multiprocessing.Pipe()
+    fakes = multiprocessing.Process(target=serve_fakes, daemon=True, args=(child_conn, args.supabase_latency_ms))
+    fakes.start()
+    supabase_url, openrouter_url = conn.recv()
+    base_env = dict(
+        os.environ,
+        SUPABASE_URL=supabase_url,
+        SUPABASE_ANON_KEY=FAKE_ANON_KEY,
+        OPENROUTER_URL=openrouter_url,
+        OPENROUTER_API_KEY='sk-or-bench',
+        SECRET_KEY='bench-secret',
+        LOG_LEVEL=os.getenv('LOG_LEVEL', 'WARNING')
+    )
+
+    columns = ('import_s', 'health_s', 'login_s', 'tasks_s', 'page_s')
+    report = {}
+    try:
+        print(f"{'warmup':<8} " + ' '.join(f"{c[:-2]:>9}" for c in columns) + "   (medians of "
+              f"{args.runs} runs, ms)")
+        for warmup in ('false', 'true'):
+            env = dict(base_env, WARMUP=warmup)
+            runs = [one_run(args.app_dir, env, f"cold_{warmup}_{n}_{os.getpid()}", args.gap_ms / 1000) for n in range(args.runs)]
+            medians = {c: statistics.median(run[c] for run in runs) for c in columns}
+            report[f"warmup_{warmup}"] = {'median': medians, 'runs': runs}
+            print(f"{warmup:<8} " + ' '.join(f"{medians[c] * 1000:>9.0f}" for c in columns))
+    finally:
+        conn.send('stop')
+        fakes.join(timeout=5)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'modes': report}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""Offline load test for the DONNA API.
+
+Starts FakeSupabase and FakeOpenRouter, serves app.py on a local threaded
+server and drives each scenario at the given concurrency:
+
+    python benchmarks/loadtest.py --concurrency 16 --requests 400 \
+        --supabase-latency-ms 30 --llm-latency-ms 800 --tokens-per-sec 60 \
+        --output results/today.json --compare results/baseline.json
+
+Every HTTP request is one sample. The report has throughput and
+p50/p95/p99 latency per operation, plus the app's own per-stage timings
+from /api/health. With --compare, the run fails (exit 1) when any
+operation's p95 regressed by more than --max-regression percent.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from fakes import FAKE_ANON_KEY, FakeOpenRouter, FakeSupabase  # noqa: E402
+
+SCENARIOS = ('auth', 'pages', 'tasks', 'calendar', 'history', 'chat', 'chat_stream', 'chat_async')
+
+CHAT_REPLY = (
+    '{"action": "create_task", "title": "Load test follow-up", "priority": "medium", "due_date": null}\n'
+    "Done! I've added that to your list. You have a few things due this week - "
+    "want me to block some time on your calendar for them?"
+)
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LoadTest:
+    """Registers users, seeds their data and runs the scenarios against one server"""
+
+    def __init__(self, base_url, users, seed_rows, supabase):
+        self.base_url = base_url
+        self.supabase = supabase
+        self.users = []
+        self.local = threading.local()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+        self.setup(users, seed_rows)
+
+    # ---- setup ----
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def setup(self, users, seed_rows):
+        today = datetime.now().date()
+        for n in range(users):
+            username = f"load{n}_{uuid.uuid4().hex[:6]}"
+            password = 'loadtest-pw'
+            requests.post(f"{self.base_url}/api/auth/register", json={
+                'username': username, 'email': f"{username}@example.com", 'password': password
+            }).raise_for_status()
+            login = requests.post(f"{self.base_url}/api/auth/login", json={
+                'username': username, 'password': password
+            })
+            login.raise_for_status()
+            user = login.json()['user']
+            self.users.append({
+                'id': user['id'],
+                'username': username,
+                'password': password,
+                'headers': {'Authorization': f"Bearer {login.json()['token']}"}
+            })
+            self.supabase.seed('tasks', [{
+                'user_id': user['id'],
+                'title': f"Seeded task {i}",
+                'description': '',
+                'priority': ('high', 'medium', 'low')[i % 3],
+                'due_date': str(today + timedelta(days=i % 14)),
+                'completed': i % 4 == 0
+            } for i in range(seed_rows)])
+            self.supabase.seed('calendar_events', [{
+                'user_id': user['id'],
+                'title': f"Seeded event {i}",
+                'description': '',
+                'date': str(today + timedelta(days=i % 30)),
+                'time': '09:00',
+                'start_time': f"{today + timedelta(days=i % 30)}T09:00:00",
+                'end_time': f"{today + timedelta(days=i % 30)}T10:00:00"
+            } for i in range(seed_rows)])
+
+    # ---- requests ----
+
+    def call(self, operation, method, path, user=None, expected=(), **kwargs):
+        headers = dict(user['headers']) if user else {}
+        headers.update(kwargs.pop('headers', {}))
+        started = time.perf_counter()
+        try:
+            response = self.session().request(method, f"{self.base_url}{path}", headers=headers, timeout=120, **kwargs)
+            body = response.content  # streams are read to the end
+            ok = response.status_code < 400 or response.status_code in expected
+        except requests.RequestException:
+            response, body, ok = None, b'', False
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.samples[operation].append(elapsed)
+            if not ok:
+                self.errors[operation] += 1
+        return response, body
+
+    def run_auth(self, user):
+        self.call('auth_login', 'POST', '/api/auth/login',
+                  json={'username': user['username'], 'password': user['password']})
+        # Stale usernames retried after a deploy
+        self.call('auth_login_unknown', 'POST', '/api/auth/login', expected=(401,),
+                  json={'username': f"gone-{user['username']}", 'password': user['password']})
+
+    def run_pages(self, user):
+        """A first visit, then a repeat visit revalidating the page with its ETag"""
+        response, _ = self.call('page_first_visit', 'GET', '/', headers={'Accept-Encoding': 'gzip, br'})
+        etag = response.headers.get('ETag') if response is not None else None
+        if etag:
+            self.call('page_repeat_visit', 'GET', '/', expected=(304,),
+                      headers={'Accept-Encoding': 'gzip, br', 'If-None-Match': etag})
+
+    def run_tasks(self, user):
+        self.call('tasks_list', 'GET', '/api/tasks', user)
+        create = {'json': {'title': 'Load test task', 'priority': 'low'},
+                  'headers': {'Idempotency-Key': uuid.uuid4().hex}}
+        response, _ = self.call('tasks_create', 'POST', '/api/tasks', user, **create)
+        # The same create again, as after a double-click: answered from the idempotency cache
+        self.call('tasks_create_replay', 'POST', '/api/tasks', user, **create)
+        task_id = ((response.json() if response is not None and response.ok else {}).get('task') or {}).get('id')
+        if task_id:
+            self.call('tasks_update', 'PUT', f"/api/tasks/{task_id}", user, json={'completed': True})
+            self.call('tasks_delete', 'DELETE', f"/api/tasks/{task_id}", user)
+
+    def run_calendar(self, user):
+        self.call('calendar_list', 'GET', '/api/calendar/events', user)
+        today = datetime.now().date()
+        self.call('calendar_month', 'GET', '/api/calendar/events', user, params={
+            'from': today.replace(day=1).isoformat(),
+            'to': (today.replace(day=28) + timedelta(days=4)).replace(day=1).isoformat()
+        })
+        day = (datetime.now().date() + timedelta(days=3)).isoformat()
+        response, _ = self.call('calendar_create', 'POST', '/api/calendar/events', user,
+                                json={'title': 'Load test event', 'date': day, 'time': '14:00'})
+        event_id = ((response.json() if response is not None and response.ok else {}).get('event') or {}).get('id')
+        if event_id:
+            self.call('calendar_update', 'PUT', f"/api/calendar/events/{event_id}", user, json={'time': '15:00'})
+            self.call('calendar_delete', 'DELETE', f"/api/calendar/events/{event_id}", user)
+
+    def run_history(self, user):
+        response, _ = self.call('chat_history', 'GET', '/api/chat/history', user)
+        cursor = ((response.json() if response is not None and response.ok else {}).get('cursor') or {}).get('after')
+        if cursor:
+            # What the pages poll with once the first page is on screen
+            self.call('chat_history_poll', 'GET', '/api/chat/history', user, params={'after': cursor})
+
+    def run_chat(self, user):
+        self.call('chat', 'POST', '/api/chat', user, json={'message': 'Can you help me plan my week?'})
+
+    def run_chat_stream(self, user):
+        self.call('chat_stream', 'POST', '/api/chat/stream', user,
+                  json={'message': 'Can you help me plan my week?'}, headers={'Accept': 'text/event-stream'})
+
+    def run_chat_async(self, user):
+        """Queue a chat, then follow it to the end; a 503 from a full queue counts as an error"""
+        response, _ = self.call('chat_enqueue', 'POST', '/api/chat', user,
+                                json={'message': 'Can you help me plan my week?'}, headers={'Prefer': 'respond-async'})
+        if response is not None and response.status_code == 202:
+            self.call('chat_result_stream', 'GET', response.json()['statusUrl'], user,
+                      headers={'Accept': 'text/event-stream'})
+
+    def run(self, scenario, iterations, concurrency):
+        """Run one scenario ``iterations`` times across ``concurrency`` threads"""
+        runner = getattr(self, f"run_{scenario}")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda i: runner(self.users[i % len(self.users)]), range(iterations)))
+        return time.perf_counter() - started
+
+    def report(self, operation, wall_seconds):
+        samples = self.samples.get(operation, [])
+        return {
+            'requests': len(samples),
+            'errors': self.errors.get(operation, 0),
+            'throughput_rps': round(len(samples) / wall_seconds, 2) if wall_seconds else None,
+            'mean_ms': round(sum(samples) / len(samples) * 1000, 2) if samples else None,
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 2) if samples else None,
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 2) if samples else None,
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 2) if samples else None,
+            'max_ms': round(max(samples) * 1000, 2) if samples else None
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, max_regression):
+    """Print p95 changes against a previous run; return the regressed operations"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['operations']
+    regressed = []
+    print(f"\n{'operation':<18} {'base p95':>10} {'p95':>10} {'change':>8}")
+    for operation, current in sorted(results.items()):
+        before = (baseline.get(operation) or {}).get('p95_ms')
+        if not before or current['p95_ms'] is None:
+            continue
+        change = (current['p95_ms'] - before) / before * 100
+        flag = '  REGRESSION' if change > max_regression else ''
+        print(f"{operation:<18} {before:>10.1f} {current['p95_ms']:>10.1f} {change:>+7.1f}%{flag}")
+        if flag:
+            regressed.append(operation)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='iterations per scenario')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--seed-rows', type=int, default=20, help='tasks and events seeded per user')
+    parser.add_argument('--supabase-latency-ms', type=float, default=20)
+    parser.add_argument('--llm-latency-ms', type=float, default=300)
+    parser.add_argument('--tokens-per-sec', type=float, default=0, help='0 streams as fast as possible')
+    parser.add_argument('--llm-error-rate', type=float, default=0)
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='previous JSON report to compare p95 against')
+    parser.add_argument('--max-regression', type=float, default=20, help='allowed p95 increase, percent')
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    supabase = FakeSupabase(latency_ms=args.supabase_latency_ms).start()
+    openrouter = FakeOpenRouter(latency_ms=args.llm_latency_ms, tokens_per_sec=args.tokens_per_sec,
+                                reply=CHAT_REPLY, error_rate=args.llm_error_rate).start()
+    os.environ.update(
+        SUPABASE_URL=supabase.url,
+        SUPABASE_ANON_KEY=FAKE_ANON_KEY,
+        OPENROUTER_URL=openrouter.url,
+        OPENROUTER_API_KEY='sk-or-loadtest',
+        SECRET_KEY='loadtest-secret'
+    )
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('LOG_LEVELS', 'werkzeug=WARNING')
+
+    import app as donna
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, donna.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    load = LoadTest(base_url, args.users, args.seed_rows, supabase)
+    operations = {}
+    for scenario in scenarios:
+        before = set(load.samples)
+        wall = load.run(scenario, args.requests, args.concurrency)
+        for operation in sorted(set(load.samples) - before):
+            operations[operation] = load.report(operation, wall)
+            r = operations[operation]
+            print(f"{operation:<18} {r['requests']:>6} req {r['errors']:>4} err {r['throughput_rps']:>8.1f} rps  "
+                  f"p50 {r['p50_ms']:>8.1f}  p95 {r['p95_ms']:>8.1f}  p99 {r['p99_ms']:>8.1f} ms")
+
+    health = requests.get(f"{base_url}/api/health").json()
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'config': vars(args),
+        'operations': operations,
+        'stages': health.get('stages'),
+        'llm': health.get('llm'),
+        'upstream_requests': {'supabase': supabase.requests, 'openrouter': openrouter.requests}
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    server.shutdown()
+    if args.compare and compare(operations, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+-- Delta sync for GET /api/tasks?since= and GET /api/calendar/events?since=
+--
+-- updated_at is maintained by a trigger on every insert/update, and every
+-- delete leaves a row in sync_tombstones, so changes made outside the app
+-- (Supabase dashboard, SQL) are picked up too. Until this is applied the
+-- API falls back to returning full lists.
+
+alter table tasks add column if not exists updated_at timestamptz not null default now();
+alter table calendar_events add column if not exists updated_at timestamptz not null default now();
+
+create index if not exists tasks_user_updated_idx on tasks (user_id, updated_at);
+create index if not exists calendar_events_user_updated_idx on calendar_events (user_id, updated_at);
+
+create or replace function donna_touch_updated_at() returns trigger as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$ language plpgsql;
+
+drop trigger if exists tasks_touch_updated_at on tasks;
+create trigger tasks_touch_updated_at before insert or update on tasks
+    for each row execute function donna_touch_updated_at();
+
+drop trigger if exists calendar_events_touch_updated_at on calendar_events;
+create trigger calendar_events_touch_updated_at before insert or update on calendar_events
+    for each row execute function donna_touch_updated_at();
+
+create table if not exists sync_tombstones (
+    id bigint generated always as identity primary key,
+    user_id text not null,
+    table_name text not null,
+    row_id text not null,
+    deleted_at timestamptz not null default now()
+);
+
+create index if not exists sync_tombstones_lookup_idx on sync_tombstones (user_id, table_name, deleted_at);
+
+create or replace function donna_record_tombstone() returns trigger as $$
+begin
+    insert into sync_tombstones (user_id, table_name, row_id)
+    values (old.user_id::text, tg_table_name, old.id::text);
+    return old;
+end;
+$$ language plpgsql;
+
+drop trigger if exists tasks_tombstone on tasks;
+create trigger tasks_tombstone after delete on tasks
+    for each row execute function donna_record_tombstone();
+
+drop trigger if exists calendar_events_tombstone on calendar_events;
+create trigger calendar_events_tombstone after delete on calendar_events
+    for each row execute function donna_record_tombstone();
+
+-- Tombstones only need to outlive the longest gap between two polls.
+-- Prune them periodically, e.g. with pg_cron:
+--   delete from sync_tombstones where deleted_at < now() - interval '7 days';
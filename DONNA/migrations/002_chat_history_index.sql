@@ -0,0 +1,8 @@
+-- Keyset pagination for GET /api/chat/history?before= / ?after=
+--
+-- Pages are read in (created_at, id) order per user, newest first for the
+-- first page and ?before=, oldest first for ?after= polls. This index
+-- serves both directions without a sort. The endpoint works without it,
+-- just slower for long histories.
+
+create index if not exists messages_user_created_idx on messages (user_id, created_at, id);
@@ -0,0 +1,13 @@
+-- Recurring calendar events and date-windowed reads for
+-- GET /api/calendar/events?from=&to=
+--
+-- A series is a single row: `recurrence` holds the rule (an RRULE subset,
+-- e.g. FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10) and `recurrence_until` the last
+-- date it can fall on, null when it never ends. The app expands series
+-- inside the requested window. Until this is applied every event is a
+-- single event and windows are plain date ranges.
+
+alter table calendar_events add column if not exists recurrence text;
+alter table calendar_events add column if not exists recurrence_until date;
+
+create index if not exists calendar_events_user_date_idx on calendar_events (user_id, date);
@@ -0,0 +1,15 @@
+-- Rolling conversation summary used as chat memory
+--
+-- One row per user. After each completed reply the app folds the turns
+-- that have dropped out of the last MEMORY_RAW_TURNS into `summary`;
+-- `summarized_until`/`summarized_id` is the (created_at, id) of the newest
+-- message folded in, so the next refresh only reads newer ones. Until this
+-- is applied chats still work, with only the last raw turns as memory.
+
+create table if not exists conversation_summaries (
+    user_id text primary key,
+    summary text not null default '',
+    summarized_until timestamptz,
+    summarized_id text,
+    updated_at timestamptz not null default now()
+);
@@ -0,0 +1,449 @@
+let currentDate = new Date();
+let events = [];
+let selectedDate = null;
+let currentEventId = null;
+let authToken = null;
+let currentUser = null;
+// The month on screen is loaded as a ?from=&to= window; the ETag
+// only applies to the window it came from
+let eventsWindow = null;
+let eventsEtag = null;
+// Sent with the create request, new each time the create form opens
+let createKey = null;
+
+// Initialize
+window.addEventListener('load', () => {
+    console.log('🚀 Initializing calendar page...');
+
+    authToken = localStorage.getItem('authToken');
+    const userDataString = localStorage.getItem('currentUser');
+
+    console.log('🔑 Auth check:', {
+        hasToken: !!authToken,
+        hasUserData: !!userDataString
+    });
+
+    if (!authToken || !userDataString) {
+        console.log('❌ Not authenticated, redirecting to login');
+        window.location.href = '/login';
+        return;
+    }
+
+    try {
+        currentUser = JSON.parse(userDataString);
+        console.log('✅ Authenticated as:', currentUser.username);
+        document.getElementById('username-display').textContent = currentUser.username;
+    } catch (e) {
+        console.error('❌ Invalid user JSON:', e);
+        localStorage.clear();
+        window.location.href = '/login';
+        return;
+    }
+
+    loadEvents();
+    renderCalendar();
+    connectLiveUpdates();
+
+    // Auto-refresh every 30 seconds while live updates are down
+    setInterval(() => {
+        if (!liveUpdatesConnected()) loadEvents();
+    }, 30000);
+    setInterval(loadEvents, 60000);
+});
+
+// Live updates: the server pushes a 'change' event when data changes.
+// Polling only runs while the stream is down, plus a slow backstop
+// for changes made through another server worker.
+let liveUpdates = null;
+let liveUpdatesRetry = null;
+let liveUpdatesDelay = 5000;
+
+// EventSource can't send the Authorization header, so each (re)connect
+// opens the stream with a fresh short-lived stream token
+async function connectLiveUpdates() {
+    if (!window.EventSource) return;
+    let streamToken;
+    try {
+        const response = await fetch('/api/events/token', {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${authToken}` }
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        streamToken = (await response.json()).token;
+    } catch (error) {
+        console.error('❌ Live updates unavailable:', error);
+        retryLiveUpdates();
+        return;
+    }
+
+    const source = new EventSource(`/api/events/stream?token=${encodeURIComponent(streamToken)}`);
+    liveUpdates = source;
+    // Catch up on anything missed while (re)connecting
+    source.addEventListener('ready', () => {
+        liveUpdatesDelay = 5000;
+        loadEvents();
+    });
+    source.addEventListener('change', (e) => {
+        const { topic } = JSON.parse(e.data);
+        if (topic === 'calendar') {
+            console.log('🔔 calendar changed');
+            loadEvents();
+        }
+    });
+    // The browser would retry with the same, soon expired, token; a full
+    // server (503) or a dropped connection reconnects from here instead
+    source.addEventListener('error', () => {
+        source.close();
+        retryLiveUpdates();
+    });
+}
+
+function retryLiveUpdates() {
+    clearTimeout(liveUpdatesRetry);
+    liveUpdatesRetry = setTimeout(connectLiveUpdates, liveUpdatesDelay);
+    liveUpdatesDelay = Math.min(liveUpdatesDelay * 2, 60000);
+}
+
+function liveUpdatesConnected() {
+    return liveUpdates !== null && liveUpdates.readyState === EventSource.OPEN;
+}
+
+// Render Calendar
+function renderCalendar() {
+    const year = currentDate.getFullYear();
+    const month = currentDate.getMonth();
+
+    document.getElementById('currentMonth').textContent = currentDate.toLocaleString('default', { month: 'long', year: 'numeric' });
+
+    const firstDay = new Date(year, month, 1);
+    const lastDay = new Date(year, month + 1, 0);
+    const prevLastDay = new Date(year, month, 0);
+    const firstDayOfWeek = firstDay.getDay();
+    const lastDateOfMonth = lastDay.getDate();
+    const prevLastDate = prevLastDay.getDate();
+
+    let html = '';
+
+    // Header
+    const days = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday'];
+    days.forEach(day => {
+        html += `<div class="calendar-header-cell">${day}</div>`;
+    });
+
+    // Previous month days
+    for (let i = firstDayOfWeek - 1; i >= 0; i--) {
+        html += `<div class="calendar-day-cell other-month"><div class="day-number">${prevLastDate - i}</div></div>`;
+    }
+
+    // Current month days
+    const today = new Date();
+    for (let day = 1; day <= lastDateOfMonth; day++) {
+        const dateStr = `${year}-${String(month + 1).padStart(2, '0')}-${String(day).padStart(2, '0')}`;
+        const isToday = day === today.getDate() && month === today.getMonth() && year === today.getFullYear();
+        const dayEvents = events.filter(e => {
+            const eventDate = e.date || (e.starttime ? e.starttime.split('T')[0] : '');
+            return eventDate === dateStr;
+        });
+
+        html += `<div class="calendar-day-cell ${isToday ? 'today' : ''}" onclick="openCreateModalForDate('${dateStr}')">
+            <div class="day-number">${day}</div>
+            <div class="day-events">
+                ${dayEvents.slice(0, 3).map(event => {
+                    const hasTime = event.time && event.time !== '00:00';
+                    const timeStr = hasTime ? event.time.substring(0, 5) : '';
+                    return `<div class="event-chip ${hasTime ? 'has-time' : ''}" onclick="event.stopPropagation(); viewEvent(${event.id}, '${event.date}')">${hasTime ? timeStr + ' ' : ''}${escapeHtml(event.title)}</div>`;
+                }).join('')}
+                ${dayEvents.length > 3 ? `<div class="more-events">${dayEvents.length - 3} more</div>` : ''}
+            </div>
+        </div>`;
+    }
+
+    // Next month days
+    const totalCells = Math.ceil((firstDayOfWeek + lastDateOfMonth) / 7) * 7;
+    const nextDays = totalCells - firstDayOfWeek - lastDateOfMonth;
+    for (let day = 1; day <= nextDays; day++) {
+        html += `<div class="calendar-day-cell other-month"><div class="day-number">${day}</div></div>`;
+    }
+
+    document.getElementById('calendarGrid').innerHTML = html;
+}
+
+// The first and last day of the month on screen
+function visibleWindow() {
+    const year = currentDate.getFullYear();
+    const month = currentDate.getMonth();
+    const pad = (n) => String(n).padStart(2, '0');
+    const lastDate = new Date(year, month + 1, 0).getDate();
+    return {
+        from: `${year}-${pad(month + 1)}-01`,
+        to: `${year}-${pad(month + 1)}-${pad(lastDate)}`
+    };
+}
+
+// Load the events of the month on screen (recurring ones expanded)
+async function loadEvents() {
+    try {
+        const { from, to } = visibleWindow();
+        const windowKey = `${from}/${to}`;
+        console.log('📥 Loading events...', windowKey);
+        const headers = { 
+            'Authorization': `Bearer ${authToken}`,
+            'Content-Type': 'application/json'
+        };
+        if (eventsEtag && eventsWindow === windowKey) {
+            headers['If-None-Match'] = eventsEtag;
+        }
+
+        const response = await fetch(`/api/calendar/events?from=${from}&to=${to}`, { headers, cache: 'no-store' });
+
+        console.log('📡 Events response status:', response.status);
+
+        if (response.status === 401) {
+            console.log('❌ 401 Unauthorized');
+            alert('Your session has expired. Please login again.');
+            localStorage.clear();
+            window.location.href = '/login';
+            return;
+        }
+
+        if (response.status === 304) {
+            console.log('✅ Events unchanged');
+            return;
+        }
+
+        const data = await response.json();
+        console.log('📦 Events data:', data);
+
+        // The month changed while this was loading
+        const current = visibleWindow();
+        if (windowKey !== `${current.from}/${current.to}`) return;
+
+        if (data.success) {
+            events = data.events || [];
+            eventsWindow = windowKey;
+            eventsEtag = response.headers.get('ETag');
+            console.log(`✅ Loaded ${events.length} events`);
+            renderCalendar();
+        }
+    } catch (error) {
+        console.error('❌ Error loading events:', error);
+    }
+}
+
+function previousMonth() {
+    currentDate.setDate(1);
+    currentDate.setMonth(currentDate.getMonth() - 1);
+    events = [];
+    renderCalendar();
+    loadEvents();
+}
+
+function nextMonth() {
+    currentDate.setDate(1);
+    currentDate.setMonth(currentDate.getMonth() + 1);
+    events = [];
+    renderCalendar();
+    loadEvents();
+}
+
+function openCreateModal() {
+    selectedDate = null;
+    currentEventId = null;
+    createKey = newIdempotencyKey();
+    document.getElementById('modalTitle').textContent = 'Create Event';
+    document.getElementById('eventForm').reset();
+    document.getElementById('eventDate').value = new Date().toISOString().split('T')[0];
+    document.getElementById('eventModal').classList.add('active');
+}
+
+function openCreateModalForDate(dateStr) {
+    selectedDate = dateStr;
+    currentEventId = null;
+    createKey = newIdempotencyKey();
+    document.getElementById('modalTitle').textContent = 'Create Event';
+    document.getElementById('eventForm').reset();
+    document.getElementById('eventDate').value = dateStr;
+    document.getElementById('eventModal').classList.add('active');
+}
+
+// One key per user action, so a double-click or a retried request is
+// answered once by the server (see the Idempotency-Key header)
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+}
+
+function closeModal() {
+    document.getElementById('eventModal').classList.remove('active');
+}
+
+function closeViewModal() {
+    document.getElementById('viewEventModal').classList.remove('active');
+    currentEventId = null;
+}
+
+function viewEvent(eventId, date) {
+    const event = events.find(e => e.id === eventId && (!date || e.date === date));
+    if (!event) return;
+
+    currentEventId = eventId;
+    const eventDate = new Date(event.date || event.starttime);
+    const dateStr = eventDate.toLocaleDateString('en-US', { weekday: 'long', year: 'numeric', month: 'long', day: 'numeric' });
+    const timeStr = event.time && event.time !== '00:00' ? event.time : 'All day';
+
+    document.getElementById('eventDetailsContent').innerHTML = `
+        <div class="event-detail-item">
+            <div class="event-detail-label">Event Title</div>
+            <div class="event-detail-value">${escapeHtml(event.title)}</div>
+        </div>
+        <div class="event-detail-item">
+            <div class="event-detail-label">Date</div>
+            <div class="event-detail-value">${dateStr}</div>
+        </div>
+        <div class="event-detail-item">
+            <div class="event-detail-label">Time</div>
+            <div class="event-detail-value">${timeStr}</div>
+        </div>
+        ${event.recurrence ? `<div class="event-detail-item">
+            <div class="event-detail-label">Repeats</div>
+            <div class="event-detail-value">${escapeHtml(describeRecurrence(event.recurrence))}</div>
+        </div>` : ''}
+        ${event.description ? `<div class="event-detail-item">
+            <div class="event-detail-label">Description</div>
+            <div class="event-detail-value">${escapeHtml(event.description)}</div>
+        </div>` : ''}
+    `;
+    document.getElementById('viewEventModal').classList.add('active');
+}
+
+// Label for a stored rule, from the Repeats options where possible
+function describeRecurrence(rule) {
+    const option = Array.from(document.getElementById('eventRepeat').options)
+        .find(o => o.value && o.value === rule);
+    return option ? option.textContent : rule;
+}
+
+async function saveEvent(e) {
+    e.preventDefault();
+
+    const title = document.getElementById('eventTitle').value.trim();
+    const date = document.getElementById('eventDate').value;
+    const startTime = document.getElementById('eventStartTime').value;
+    const endTime = document.getElementById('eventEndTime').value;
+    const description = document.getElementById('eventDescription').value.trim();
+    const recurrence = document.getElementById('eventRepeat').value || null;
+
+    if (!title || !date) {
+        alert('Please fill in title and date');
+        return;
+    }
+
+    console.log('💾 Saving event:', { title, date, startTime });
+
+    const eventData = {
+        title,
+        date,
+        time: startTime || '00:00',
+        starttime: startTime ? `${date}T${startTime}` : null,
+        endtime: endTime ? `${date}T${endTime}` : null,
+        description,
+        recurrence
+    };
+
+    try {
+        const url = currentEventId ? `/api/calendar/events/${currentEventId}` : '/api/calendar/events';
+        const method = currentEventId ? 'PUT' : 'POST';
+        const headers = {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${authToken}`
+        };
+        if (!currentEventId && createKey) {
+            headers['Idempotency-Key'] = createKey;
+        }
+
+        const response = await fetch(url, {
+            method,
+            headers,
+            body: JSON.stringify(eventData)
+        });
+
+        if (response.status === 401) {
+            alert('Session expired. Please login again.');
+            localStorage.clear();
+            window.location.href = '/login';
+            return;
+        }
+
+        const data = await response.json();
+        if (data.success) {
+            console.log('✅ Event saved successfully');
+            loadEvents();
+            closeModal();
+            alert(currentEventId ? 'Event updated!' : 'Event created!');
+        } else {
+            alert('Error: ' + (data.message || 'Unknown error'));
+        }
+    } catch (error) {
+        console.error('❌ Error saving event:', error);
+        alert('Failed to save event');
+    }
+}
+
+async function deleteCurrentEvent() {
+    if (!currentEventId) return;
+    const isSeries = events.some(e => e.id === currentEventId && e.recurrence);
+    if (!confirm(isSeries
+        ? 'This event repeats. Delete every occurrence?'
+        : 'Are you sure you want to delete this event?')) return;
+
+    console.log('🗑 Deleting event:', currentEventId);
+
+    try {
+        const response = await fetch(`/api/calendar/events/${currentEventId}`, {
+            method: 'DELETE',
+            headers: { 
+                'Authorization': `Bearer ${authToken}`,
+                'Content-Type': 'application/json'
+            }
+        });
+
+        if (response.status === 401) {
+            alert('Session expired. Please login again.');
+            localStorage.clear();
+            window.location.href = '/login';
+            return;
+        }
+
+        const data = await response.json();
+        if (data.success) {
+            console.log('✅ Event deleted successfully');
+            loadEvents();
+            closeViewModal();
+            alert('Event deleted!');
+        } else {
+            alert('Error deleting event');
+        }
+    } catch (error) {
+        console.error('❌ Error deleting event:', error);
+        alert('Failed to delete event');
+    }
+}
+
+function handleLogout() {
+    if (confirm('Are you sure you want to logout?')) {
+        console.log('🚪 Logging out...');
+        if (liveUpdates) liveUpdates.close();
+        localStorage.clear();
+        window.location.href = '/login';
+    }
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
@@ -0,0 +1,539 @@
+// State management
+let authToken = null;
+let currentUser = null;
+let isLoadingMessages = false;
+let isSendingMessage = false;
+let lastMessageCount = 0;
+let refreshInterval = null;
+// History cursors: polls ask only for messages after historyCursor,
+// scrolling to the top pages back from olderCursor
+let historyCursor = null;
+let olderCursor = null;
+let hasOlderMessages = false;
+let isLoadingOlder = false;
+// Messages sent from this page, shown before the server has them
+let pendingSends = [];
+
+// Initialize on page load
+window.addEventListener('DOMContentLoaded', initChat);
+
+function initChat() {
+    console.log('🚀 Initializing DONNA chat...');
+
+    // Get auth data
+    authToken = localStorage.getItem('authToken');
+    const userDataString = localStorage.getItem('currentUser');
+
+    // Validate authentication
+    if (!authToken || !userDataString) {
+        console.log('❌ No authentication - redirecting to login');
+        window.location.href = '/login';
+        return;
+    }
+
+    // Parse user data safely
+    try {
+        currentUser = JSON.parse(userDataString);
+        if (!currentUser || !currentUser.username) {
+            throw new Error('Invalid user data structure');
+        }
+        console.log('✅ Authenticated as:', currentUser.username);
+        document.getElementById('username-display').textContent = currentUser.username;
+    } catch (e) {
+        console.error('❌ Failed to parse user data:', e);
+        localStorage.clear();
+        window.location.href = '/login.html';
+        return;
+    }
+
+    // Setup UI
+    autoResizeTextarea();
+    document.getElementById('chat-messages').addEventListener('scroll', (e) => {
+        if (e.target.scrollTop < 80) loadOlderMessages();
+    });
+    document.getElementById('message-input').focus();
+
+    // Initial load
+    loadMessages();
+    connectLiveUpdates();
+
+    // Setup refresh (FIXED: single interval with debouncing)
+    // Polls only while live updates are down, plus a slow backstop
+    let refreshTicks = 0;
+    refreshInterval = setInterval(() => {
+        refreshTicks++;
+        if (!isLoadingMessages && !isSendingMessage && (!liveUpdatesConnected() || refreshTicks % 12 === 0)) {
+            loadMessages();
+        }
+    }, 5000);
+
+    // Reload on visibility change (FIXED: debounced)
+    let visibilityTimeout;
+    document.addEventListener('visibilitychange', () => {
+        if (!document.hidden) {
+            clearTimeout(visibilityTimeout);
+            visibilityTimeout = setTimeout(() => {
+                if (!isLoadingMessages) loadMessages();
+            }, 500);
+        }
+    });
+}
+
+// Live updates: the server pushes a 'change' event when a reply is stored
+let liveUpdates = null;
+let liveUpdatesRetry = null;
+let liveUpdatesDelay = 5000;
+
+// EventSource can't send the Authorization header, so each (re)connect
+// opens the stream with a fresh short-lived stream token
+async function connectLiveUpdates() {
+    if (!window.EventSource) return;
+    let streamToken;
+    try {
+        const response = await fetch('/api/events/token', {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${authToken}` }
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        streamToken = (await response.json()).token;
+    } catch (error) {
+        console.error('❌ Live updates unavailable:', error);
+        retryLiveUpdates();
+        return;
+    }
+
+    const source = new EventSource(`/api/events/stream?token=${encodeURIComponent(streamToken)}`);
+    liveUpdates = source;
+    // Catch up on anything missed while (re)connecting
+    source.addEventListener('ready', () => {
+        liveUpdatesDelay = 5000;
+        if (!isSendingMessage) loadMessages();
+    });
+    source.addEventListener('change', (e) => {
+        const { topic } = JSON.parse(e.data);
+        if (topic === 'messages' && !isSendingMessage) {
+            console.log('🔔 messages changed');
+            loadMessages();
+        }
+    });
+    // The browser would retry with the same, soon expired, token; a full
+    // server (503) or a dropped connection reconnects from here instead
+    source.addEventListener('error', () => {
+        source.close();
+        retryLiveUpdates();
+    });
+}
+
+function retryLiveUpdates() {
+    clearTimeout(liveUpdatesRetry);
+    liveUpdatesRetry = setTimeout(connectLiveUpdates, liveUpdatesDelay);
+    liveUpdatesDelay = Math.min(liveUpdatesDelay * 2, 60000);
+}
+
+function liveUpdatesConnected() {
+    return liveUpdates !== null && liveUpdates.readyState === EventSource.OPEN;
+}
+
+// Auto-resize textarea
+function autoResizeTextarea() {
+    const textarea = document.getElementById('message-input');
+    textarea.addEventListener('input', function() {
+        this.style.height = 'auto';
+        this.style.height = Math.min(this.scrollHeight, 120) + 'px';
+    });
+}
+
+// Fetch one page of chat history; null when it failed
+async function fetchHistory(query) {
+    const response = await fetch(`/api/chat/history${query}`, {
+        method: 'GET',
+        headers: { 
+            'Authorization': `Bearer ${authToken}`,
+            'Content-Type': 'application/json'
+        }
+    });
+
+    // Handle authentication errors
+    if (response.status === 401) {
+        console.log('❌ Session expired');
+        clearInterval(refreshInterval);
+        if (liveUpdates) liveUpdates.close();
+        localStorage.clear();
+        window.location.href = '/login.html';
+        return null;
+    }
+
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+
+    const data = await response.json();
+
+    if (!data.success) {
+        console.error('❌ API returned error:', data.error);
+        return null;
+    }
+    return data;
+}
+
+// Load chat history (FIXED: prevents race conditions)
+// The first load renders the newest page; later loads only fetch
+// messages newer than the last one shown
+async function loadMessages() {
+    // Prevent multiple simultaneous calls
+    if (isLoadingMessages) {
+        console.log('⏳ Already loading messages, skipping...');
+        return;
+    }
+
+    isLoadingMessages = true;
+
+    try {
+        const query = historyCursor ? `?after=${encodeURIComponent(historyCursor)}` : '';
+        const data = await fetchHistory(query);
+        if (!data) return;
+
+        if (historyCursor) {
+            appendMessages(data.messages || []);
+        } else {
+            renderMessages(data.messages || []);
+            olderCursor = data.cursor.before;
+            hasOlderMessages = data.has_more;
+        }
+        if (data.cursor.after) historyCursor = data.cursor.after;
+
+    } catch (error) {
+        console.error('❌ Error loading messages:', error);
+        // Don't show error to user on background refresh
+        if (lastMessageCount === 0) {
+            const chatBox = document.getElementById('chat-messages');
+            chatBox.innerHTML = `
+                <div class="empty-state">
+                    <div class="empty-icon">⚠️</div>
+                    <div class="empty-title">Connection Error</div>
+                    <div class="empty-text">
+                        Unable to load messages. Please check your connection and try again.
+                    </div>
+                </div>
+            `;
+        }
+    } finally {
+        isLoadingMessages = false;
+    }
+}
+
+// Page back through history when scrolled to the top
+async function loadOlderMessages() {
+    if (!hasOlderMessages || !olderCursor || isLoadingOlder) return;
+    isLoadingOlder = true;
+
+    try {
+        const data = await fetchHistory(`?before=${encodeURIComponent(olderCursor)}`);
+        if (!data) return;
+
+        const chatBox = document.getElementById('chat-messages');
+        const previousHeight = chatBox.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        (data.messages || []).forEach(msg => {
+            if (msg.user_message) addMessageElement(fragment, msg.user_message, 'user');
+            if (msg.donna_response) addMessageElement(fragment, msg.donna_response, 'donna');
+        });
+        chatBox.insertBefore(fragment, chatBox.firstChild);
+        // Keep the messages on screen where they were
+        chatBox.scrollTop += chatBox.scrollHeight - previousHeight;
+
+        olderCursor = data.cursor.before;
+        hasOlderMessages = data.has_more;
+        console.log(`✅ Loaded ${(data.messages || []).length} older messages`);
+    } catch (error) {
+        console.error('❌ Error loading older messages:', error);
+    } finally {
+        isLoadingOlder = false;
+    }
+}
+
+// Render the newest page of messages
+function renderMessages(messages) {
+    const chatBox = document.getElementById('chat-messages');
+
+    // Handle empty state
+    if (messages.length === 0) {
+        chatBox.innerHTML = `
+            <div class="empty-state">
+                <div class="empty-icon">🤖</div>
+                <div class="empty-title">Welcome to DONNA Mission Control</div>
+                <div class="empty-text">
+                    I'm your intelligent AI assistant. I can help you manage tasks, schedule events, 
+                    provide daily briefings, and much more. Just ask me anything!
+                </div>
+            </div>
+        `;
+        lastMessageCount = 0;
+        return;
+    }
+
+    // Rebuild chat
+    chatBox.innerHTML = '';
+    pendingSends = [];
+    lastMessageCount = 0;
+    messages.forEach(msg => {
+        if (msg.user_message) {
+            addMessageElement(chatBox, msg.user_message, 'user');
+            lastMessageCount++;
+        }
+        if (msg.donna_response) {
+            addMessageElement(chatBox, msg.donna_response, 'donna');
+            lastMessageCount++;
+        }
+    });
+
+    chatBox.scrollTop = chatBox.scrollHeight;
+    console.log(`✅ Rendered ${lastMessageCount} messages`);
+}
+
+// Add messages that arrived since the last load
+function appendMessages(messages) {
+    if (messages.length === 0) return;
+
+    const chatBox = document.getElementById('chat-messages');
+    const wasAtBottom = chatBox.scrollHeight - chatBox.scrollTop <= chatBox.clientHeight + 50;
+    const emptyState = chatBox.querySelector('.empty-state');
+    if (emptyState) {
+        chatBox.innerHTML = '';
+    }
+
+    messages.forEach(msg => {
+        // Sent from this page: already on screen, just settle the reply
+        const pendingIndex = pendingSends.findIndex(p => p.text === msg.user_message);
+        if (pendingIndex !== -1) {
+            const pending = pendingSends.splice(pendingIndex, 1)[0];
+            if (pending.donnaEl && msg.donna_response) pending.donnaEl.textContent = msg.donna_response;
+            return;
+        }
+        if (msg.user_message) {
+            addMessageElement(chatBox, msg.user_message, 'user');
+            lastMessageCount++;
+        }
+        if (msg.donna_response) {
+            addMessageElement(chatBox, msg.donna_response, 'donna');
+            lastMessageCount++;
+        }
+    });
+
+    if (wasAtBottom) {
+        chatBox.scrollTop = chatBox.scrollHeight;
+    }
+    console.log(`✅ Appended ${messages.length} messages`);
+}
+
+// Add message element
+function addMessageElement(container, text, sender) {
+    const messageEl = document.createElement('div');
+    messageEl.className = `message message-${sender}`;
+    messageEl.textContent = text;
+    container.appendChild(messageEl);
+    return messageEl;
+}
+
+// Add message to chat (for real-time updates)
+function addMessageToChat(text, sender) {
+    const chatBox = document.getElementById('chat-messages');
+
+    // Remove empty state
+    const emptyState = chatBox.querySelector('.empty-state');
+    if (emptyState) {
+        chatBox.innerHTML = '';
+    }
+
+    const messageEl = addMessageElement(chatBox, text, sender);
+    chatBox.scrollTop = chatBox.scrollHeight;
+    lastMessageCount++;
+    return messageEl;
+}
+
+// Parse one Server-Sent Event block ("event: x\ndata: {...}")
+function parseSseEvent(rawEvent) {
+    let event = 'message';
+    const dataLines = [];
+    rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : {} };
+}
+
+// Render a streamed DONNA reply token by token
+async function readChatStream(response) {
+    const chatBox = document.getElementById('chat-messages');
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let messageEl = null;
+    let streamedText = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const { event, data } = parseSseEvent(rawEvent);
+
+            if (event === 'token') {
+                streamedText += data.text;
+                if (!messageEl) {
+                    messageEl = addMessageToChat(streamedText, 'donna');
+                } else {
+                    messageEl.textContent = streamedText;
+                    chatBox.scrollTop = chatBox.scrollHeight;
+                }
+            } else if (event === 'done') {
+                if (!messageEl) {
+                    messageEl = addMessageToChat(data.response, 'donna');
+                } else {
+                    messageEl.textContent = data.response;
+                }
+                console.log('✅ Response streamed');
+                return messageEl;
+            } else if (event === 'error') {
+                throw new Error(data.error || 'Unknown error');
+            }
+        }
+    }
+
+    throw new Error('Connection closed before the response finished');
+}
+
+// One key per user action, so a double-click or a retried request is
+// answered once by the server (see the Idempotency-Key header)
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+}
+
+// Send message (FIXED: prevents duplicate sends)
+async function sendMessage() {
+    // Prevent sending while already sending
+    if (isSendingMessage) {
+        console.log('⏳ Already sending a message...');
+        return;
+    }
+
+    const input = document.getElementById('message-input');
+    const sendBtn = document.getElementById('send-btn');
+    const text = input.value.trim();
+
+    if (!text) {
+        return;
+    }
+
+    console.log('📤 Sending message...');
+    isSendingMessage = true;
+
+    // Add user message immediately
+    const pending = { text, donnaEl: null, idempotencyKey: newIdempotencyKey() };
+    pendingSends.push(pending);
+    addMessageToChat(text, 'user');
+    input.value = '';
+    input.style.height = 'auto';
+
+    // Show loading state
+    sendBtn.disabled = true;
+    sendBtn.innerHTML = `
+        <div class="loading-dots">
+            <div class="loading-dot"></div>
+            <div class="loading-dot"></div>
+            <div class="loading-dot"></div>
+        </div>
+    `;
+
+    try {
+        const response = await fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: { 
+                'Content-Type': 'application/json', 
+                'Accept': 'text/event-stream',
+                'Authorization': `Bearer ${authToken}`,
+                'Idempotency-Key': pending.idempotencyKey
+            },
+            body: JSON.stringify({ message: text })
+        });
+
+        if (response.status === 401) {
+            clearInterval(refreshInterval);
+            localStorage.clear();
+            window.location.href = '/login.html';
+            return;
+        }
+
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+        }
+
+        const contentType = response.headers.get('Content-Type') || '';
+        if (contentType.includes('text/event-stream') && response.body) {
+            pending.donnaEl = await readChatStream(response);
+        } else {
+            const data = await response.json();
+
+            if (data.success && data.response) {
+                console.log('✅ Response received');
+                pending.donnaEl = addMessageToChat(data.response, 'donna');
+            } else {
+                throw new Error(data.error || 'Unknown error');
+            }
+        }
+
+    } catch (error) {
+        console.error('❌ Send error:', error);
+        pendingSends = pendingSends.filter(p => p !== pending);
+        addMessageToChat(`⚠️ Failed to send message: ${error.message}`, 'system');
+    } finally {
+        isSendingMessage = false;
+        sendBtn.disabled = false;
+        sendBtn.innerHTML = '<span>Send</span><span>🚀</span>';
+        input.focus();
+    }
+}
+
+// Keyboard shortcuts
+function handleKeyDown(event) {
+    if (event.key === 'Enter' && !event.shiftKey) {
+        event.preventDefault();
+        sendMessage();
+    }
+}
+
+// Logout
+function handleLogout() {
+    if (confirm('Are you sure you want to logout?')) {
+        console.log('🚪 Logging out...');
+        clearInterval(refreshInterval);
+        if (liveUpdates) liveUpdates.close();
+        localStorage.removeItem('authToken');
+        localStorage.removeItem('currentUser');
+        window.location.href = '/login.html';
+    }
+}
+
+// Cleanup on page unload
+window.addEventListener('beforeunload', () => {
+    if (refreshInterval) {
+        clearInterval(refreshInterval);
+    }
+    if (liveUpdates) {
+        liveUpdates.close();
+    }
+});
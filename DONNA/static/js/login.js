@@ -0,0 +1,174 @@
+const isExplicitLogout = new URLSearchParams(window.location.search).get('logout');
+if (isExplicitLogout) {
+    console.log('🔄 Explicit logout detected - clearing auth');
+    localStorage.clear();
+}
+
+function switchTab(tab) {
+    document.getElementById('login').classList.remove('active');
+    document.getElementById('register').classList.remove('active');
+    document.querySelectorAll('.tab-btn').forEach(btn => btn.classList.remove('active'));
+    document.getElementById(tab).classList.add('active');
+    event.target.classList.add('active');
+
+    const indicator = document.getElementById('tabIndicator');
+    if (tab === 'register') {
+        indicator.classList.add('register');
+    } else {
+        indicator.classList.remove('register');
+    }
+
+    document.getElementById('loginMessage').style.display = 'none';
+    document.getElementById('registerMessage').style.display = 'none';
+}
+
+function showMessage(elementId, message, type) {
+    const msgEl = document.getElementById(elementId);
+    msgEl.textContent = message;
+    msgEl.className = `message ${type}`;
+    msgEl.style.display = 'block';
+}
+
+async function handleLogin() {
+    const username = document.getElementById('loginUsername').value.trim();
+    const password = document.getElementById('loginPassword').value.trim();
+    const loginBtn = document.getElementById('loginBtn');
+
+    console.log('🔐 Login attempt:', { username, passwordLength: password.length });
+
+    if (!username || !password) {
+        showMessage('loginMessage', '❌ Please fill in all fields', 'error');
+        return;
+    }
+
+    loginBtn.disabled = true;
+    loginBtn.innerHTML = 'AUTHENTICATING<span class="loading-dots"></span>';
+
+    try {
+        console.log('📡 Sending login request to /api/auth/login');
+
+        const response = await fetch('/api/auth/login', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ username, password })
+        });
+
+        console.log('📥 Response status:', response.status);
+
+        const data = await response.json();
+        console.log('📥 Response data:', { success: data.success, hasToken: !!data.token });
+
+        if (data.success && data.token) {
+            localStorage.setItem('authToken', data.token);
+
+            const currentUser = {
+                id: data.user?.id,
+                username: data.user?.username || username,
+                email: data.user?.email
+            };
+            localStorage.setItem('currentUser', JSON.stringify(currentUser));
+
+            console.log('✅ Login successful!');
+            console.log('✅ Token stored:', data.token.substring(0, 30) + '...');
+            console.log('✅ User stored:', currentUser);
+
+            showMessage('loginMessage', '✓ ACCESS GRANTED • REDIRECTING...', 'success');
+
+            setTimeout(() => {
+                console.log('🔄 Redirecting to /');
+                window.location.href = '/';
+            }, 1000);
+        } else {
+            throw new Error(data.message || 'Login failed');
+        }
+    } catch (error) {
+        console.error('❌ Login error:', error);
+        showMessage('loginMessage', `❌ ACCESS DENIED: ${error.message}`, 'error');
+    } finally {
+        loginBtn.disabled = false;
+        loginBtn.textContent = 'ACCESS SYSTEM';
+    }
+}
+
+async function handleRegister() {
+    const username = document.getElementById('registerUsername').value.trim();
+    const email = document.getElementById('registerEmail').value.trim();
+    const password = document.getElementById('registerPassword').value.trim();
+    const confirm = document.getElementById('registerConfirm').value.trim();
+    const registerBtn = document.getElementById('registerBtn');
+
+    console.log('📝 Registration attempt:', { username, email });
+
+    if (!username || !email || !password || !confirm) {
+        showMessage('registerMessage', '❌ Please fill in all fields', 'error');
+        return;
+    }
+
+    if (password.length < 6) {
+        showMessage('registerMessage', '❌ Password must be at least 6 characters', 'error');
+        return;
+    }
+
+    if (password !== confirm) {
+        showMessage('registerMessage', '❌ Passwords do not match', 'error');
+        return;
+    }
+
+    if (!email.includes('@')) {
+        showMessage('registerMessage', '❌ Please enter a valid email', 'error');
+        return;
+    }
+
+    registerBtn.disabled = true;
+    registerBtn.innerHTML = 'INITIALIZING<span class="loading-dots"></span>';
+
+    try {
+        console.log('📡 Sending registration request');
+
+        const response = await fetch('/api/auth/register', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ username, email, password })
+        });
+
+        console.log('📥 Response status:', response.status);
+
+        const data = await response.json();
+        console.log('📥 Response data:', data);
+
+        if (data.success) {
+            console.log('✅ Registration successful');
+            showMessage('registerMessage', '✓ ACCOUNT CREATED • SWITCHING TO LOGIN...', 'success');
+
+            setTimeout(() => {
+                document.getElementById('registerUsername').value = '';
+                document.getElementById('registerEmail').value = '';
+                document.getElementById('registerPassword').value = '';
+                document.getElementById('registerConfirm').value = '';
+
+                document.querySelector('.tab-btn').click();
+                document.getElementById('loginUsername').value = username;
+            }, 1500);
+        } else {
+            throw new Error(data.message || 'Registration failed');
+        }
+    } catch (error) {
+        console.error('❌ Registration error:', error);
+        showMessage('registerMessage', `❌ REGISTRATION FAILED: ${error.message}`, 'error');
+    } finally {
+        registerBtn.disabled = false;
+        registerBtn.textContent = 'INITIALIZE ACCOUNT';
+    }
+}
+
+document.addEventListener('keypress', (e) => {
+    if (e.key === 'Enter') {
+        const loginTab = document.getElementById('login');
+
+        if (loginTab.classList.contains('active')) {
+            handleLogin();
+        } else {
+            handleRegister();
+        }
+    }
+});
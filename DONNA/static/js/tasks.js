@@ -0,0 +1,305 @@
+let tasks = [];
+let authToken = null;
+let username = null;
+let syncCursor = null;
+let tasksEtag = null;
+
+// Initialize
+window.addEventListener('DOMContentLoaded', () => {
+    console.log('🚀 Initializing tasks page...');
+
+    authToken = localStorage.getItem('authToken');
+    username = localStorage.getItem('username');
+
+    console.log('🔍 Auth check:', { 
+        hasToken: !!authToken, 
+        username: username
+    });
+
+    if (!authToken || !username) {
+        console.log('❌ Not authenticated, redirecting to login');
+        window.location.href = '/login';
+        return;
+    }
+
+    console.log('✅ Authenticated as:', username);
+    document.getElementById('username-display').textContent = username;
+
+    loadTasks();
+    connectLiveUpdates();
+
+    // Auto-refresh every 10 seconds while live updates are down
+    setInterval(() => {
+        if (!liveUpdatesConnected()) loadTasks();
+    }, 10000);
+    setInterval(loadTasks, 60000);
+});
+
+// Live updates: the server pushes a 'change' event when data changes.
+// Polling only runs while the stream is down, plus a slow backstop
+// for changes made through another server worker.
+let liveUpdates = null;
+let liveUpdatesRetry = null;
+let liveUpdatesDelay = 5000;
+
+// EventSource can't send the Authorization header, so each (re)connect
+// opens the stream with a fresh short-lived stream token
+async function connectLiveUpdates() {
+    if (!window.EventSource) return;
+    let streamToken;
+    try {
+        const response = await fetch('/api/events/token', {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${authToken}` }
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        streamToken = (await response.json()).token;
+    } catch (error) {
+        console.error('❌ Live updates unavailable:', error);
+        retryLiveUpdates();
+        return;
+    }
+
+    const source = new EventSource(`/api/events/stream?token=${encodeURIComponent(streamToken)}`);
+    liveUpdates = source;
+    // Catch up on anything missed while (re)connecting
+    source.addEventListener('ready', () => {
+        liveUpdatesDelay = 5000;
+        loadTasks();
+    });
+    source.addEventListener('change', (e) => {
+        const { topic } = JSON.parse(e.data);
+        if (topic === 'tasks') {
+            console.log('🔔 tasks changed');
+            loadTasks();
+        }
+    });
+    // The browser would retry with the same, soon expired, token; a full
+    // server (503) or a dropped connection reconnects from here instead
+    source.addEventListener('error', () => {
+        source.close();
+        retryLiveUpdates();
+    });
+}
+
+function retryLiveUpdates() {
+    clearTimeout(liveUpdatesRetry);
+    liveUpdatesRetry = setTimeout(connectLiveUpdates, liveUpdatesDelay);
+    liveUpdatesDelay = Math.min(liveUpdatesDelay * 2, 60000);
+}
+
+function liveUpdatesConnected() {
+    return liveUpdates !== null && liveUpdates.readyState === EventSource.OPEN;
+}
+
+// Load tasks (only changes once we have a sync cursor)
+async function loadTasks() {
+    try {
+        console.log('📚 Loading tasks...');
+
+        const url = syncCursor ? `/api/tasks?since=${encodeURIComponent(syncCursor)}` : '/api/tasks';
+        const headers = { 
+            'Authorization': `Bearer ${authToken}`,
+            'Content-Type': 'application/json'
+        };
+        if (tasksEtag) {
+            headers['If-None-Match'] = tasksEtag;
+        }
+
+        const response = await fetch(url, {
+            method: 'GET',
+            headers,
+            cache: 'no-store'
+        });
+
+        console.log('📥 Tasks response status:', response.status);
+
+        if (response.status === 401) {
+            console.log('❌ 401 Unauthorized');
+            alert('Your session has expired. Please login again.');
+            localStorage.clear();
+            window.location.href = '/login';
+            return;
+        }
+
+        if (response.status === 304) {
+            console.log('✅ Tasks unchanged');
+            return;
+        }
+
+        const data = await response.json();
+        console.log('📥 Tasks data:', data);
+
+        if (!data.success) throw new Error(data.error);
+
+        if (data.delta) {
+            applyTaskChanges(data.tasks || [], data.deleted || []);
+        } else {
+            tasks = data.tasks || [];
+        }
+        syncCursor = data.cursor || null;
+        tasksEtag = response.headers.get('ETag');
+        console.log(`✅ Loaded ${tasks.length} tasks`);
+
+        updateStats();
+        renderTasks();
+    } catch (error) {
+        console.error('❌ Error loading tasks:', error);
+    }
+}
+
+// Merge a delta response into the local list
+function applyTaskChanges(changed, deleted) {
+    const byId = new Map(tasks.map(t => [String(t.id), t]));
+    deleted.forEach(id => byId.delete(String(id)));
+    changed.forEach(t => byId.set(String(t.id), t));
+    tasks = Array.from(byId.values())
+        .sort((a, b) => String(a.created_at || '').localeCompare(String(b.created_at || '')));
+}
+
+// Update stats
+function updateStats() {
+    const active = tasks.filter(t => !t.completed).length;
+    const completed = tasks.filter(t => t.completed).length;
+
+    document.getElementById('totalTasks').textContent = tasks.length;
+    document.getElementById('activeTasks').textContent = active;
+    document.getElementById('completedTasks').textContent = completed;
+}
+
+// Render tasks
+function renderTasks() {
+    const container = document.getElementById('tasksList');
+
+    if (tasks.length === 0) {
+        container.innerHTML = `
+            <div class="empty-state">
+                <div class="empty-icon">✓</div>
+                <div class="empty-title">No Tasks Yet</div>
+                <div class="empty-text">Ask DONNA to create tasks or enjoy your free time!</div>
+            </div>
+        `;
+        return;
+    }
+
+    // Sort: active tasks first, then completed
+    const sortedTasks = [...tasks].sort((a, b) => {
+        if (a.completed === b.completed) return 0;
+        return a.completed ? 1 : -1;
+    });
+
+    container.innerHTML = sortedTasks.map(task => `
+        <div class="task-item ${task.completed ? 'completed' : ''}">
+            <input 
+                type="checkbox" 
+                class="task-checkbox" 
+                ${task.completed ? 'checked' : ''} 
+                onchange="toggleTask('${task.id}', this.checked)"
+            >
+            <div class="task-content">
+                <div class="task-title">${escapeHtml(task.title)}</div>
+                <div class="task-meta">
+                    ${task.priority ? `<span class="task-priority priority-${task.priority}">${task.priority}</span>` : ''}
+                    ${task.due_date ? `<span>📅 Due: ${formatDate(task.due_date)}</span>` : ''}
+                </div>
+                ${task.description ? `<div class="task-description">${escapeHtml(task.description)}</div>` : ''}
+            </div>
+            <div class="task-actions">
+                <button class="task-delete" onclick="deleteTask('${task.id}')">Delete</button>
+            </div>
+        </div>
+    `).join('');
+}
+
+// Toggle task completion
+async function toggleTask(id, checked) {
+    console.log(`✓ Toggling task ${id} to ${checked ? 'completed' : 'active'}`);
+
+    try {
+        const response = await fetch(`/api/tasks/${id}`, {
+            method: 'PUT',
+            headers: { 
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${authToken}` 
+            },
+            body: JSON.stringify({ completed: checked })
+        });
+
+        if (response.status === 401) {
+            alert('Session expired. Please login again.');
+            localStorage.clear();
+            window.location.href = '/login';
+            return;
+        }
+
+        if (response.ok) {
+            console.log('✅ Task toggled successfully');
+            await loadTasks();
+        }
+    } catch (error) {
+        console.error('❌ Error toggling task:', error);
+    }
+}
+
+// Delete task
+async function deleteTask(id) {
+    if (!confirm('Delete this task?')) return;
+
+    console.log(`🗑️ Deleting task ${id}`);
+
+    try {
+        const response = await fetch(`/api/tasks/${id}`, {
+            method: 'DELETE',
+            headers: { 
+                'Authorization': `Bearer ${authToken}`,
+                'Content-Type': 'application/json'
+            }
+        });
+
+        if (response.status === 401) {
+            alert('Session expired. Please login again.');
+            localStorage.clear();
+            window.location.href = '/login';
+            return;
+        }
+
+        if (response.ok) {
+            console.log('✅ Task deleted successfully');
+            await loadTasks();
+        }
+    } catch (error) {
+        console.error('❌ Error deleting task:', error);
+    }
+}
+
+// Ask DONNA to add task
+function askDonnaToAddTask() {
+    window.location.href = '/';
+}
+
+// Helpers
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+function formatDate(dateStr) {
+    const date = new Date(dateStr);
+    return date.toLocaleDateString('en-US', { 
+        month: 'short', 
+        day: 'numeric',
+        year: 'numeric'
+    });
+}
+
+function handleLogout() {
+    if (confirm('Are you sure you want to logout?')) {
+        console.log('👋 Logging out...');
+        if (liveUpdates) liveUpdates.close();
+        localStorage.clear();
+        window.location.href = '/login';
+    }
+}